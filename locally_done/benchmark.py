@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for evaluate_submissions.py.
+
+Three parts:
+  - a generator that writes a synthetic cohort of .ipynb submissions with a
+    configurable number of cells, plot density and image size. The code
+    cells define the functions the questions file asks for, so the task
+    locator and prompt compiler do real work;
+  - the fake Gemini backend (gemini_client.FakeBackend) with configurable
+    latency, jitter, error rate and a 429 requests-per-minute limit;
+  - a runner that grades the cohort once per concurrency level, each in a
+    fresh process, and reports students/min, p50/p95 stage latencies (from
+    the metrics JSONL) and peak memory.
+
+No API quota is used. Examples:
+
+    python benchmark.py generate bench_cohort --students 50
+    python benchmark.py run --students 40 --levels 1,2,4,8 --latency 2 --rpm 60
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from metrics import percentile
+from task_locator import derive_task_functions
+
+QUESTIONS_FILE = "Assignment_2_Questions.json"
+BENCH_DIR = os.path.join(".grading_cache", "bench")
+
+
+def make_png(width, height, rng):
+    """A valid RGB PNG filled with noise (so it does not compress away)."""
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b""))
+
+
+def _source(text):
+    lines = text.split("\n")
+    return [line + "\n" for line in lines[:-1]] + [lines[-1]]
+
+
+def _function_source(name, rng):
+    body = [f"def {name}(data, *args, **kwargs):", f'    """Synthetic submission for {name}."""']
+    for i in range(rng.randint(4, 16)):
+        body.append(f"    step_{i} = [x * {rng.randint(1, 9)} for x in range({rng.randint(5, 50)})]")
+    body.append("    return data")
+    return "\n".join(body)
+
+
+def synthetic_notebook(task_functions, rng, cells=30, plot_density=0.3, image_kb=50, output_lines=10):
+    """
+    Builds a notebook dict. Every assessed function appears once, in a random
+    code cell; plot_density is the fraction of code cells with an image output.
+    """
+    names = [name for names in task_functions.values() for name in names]
+    code_cells = max(cells - cells // 3, len(names))
+    placement = {}
+    for name in names:
+        placement.setdefault(rng.randrange(code_cells), []).append(name)
+
+    side = max(8, int((image_kb * 1024 / 3) ** 0.5))
+    nb_cells = []
+    for i in range(code_cells):
+        if i % 2 == 0:
+            nb_cells.append({"cell_type": "markdown", "metadata": {},
+                             "source": _source(f"## Step {i}\nSome explanation of the approach taken here.")})
+        parts = [_function_source(name, rng) for name in placement.get(i, [])]
+        parts.append(f"result_{i} = sum(range({rng.randint(10, 1000)}))\nprint(result_{i})")
+        outputs = [{"output_type": "stream", "name": "stdout",
+                    "text": _source("\n".join(f"line {n}: {rng.random():.6f}" for n in range(output_lines)))}]
+        if rng.random() < plot_density:
+            png = base64.b64encode(make_png(side, side, rng)).decode("ascii")
+            outputs.append({"output_type": "display_data", "metadata": {},
+                            "data": {"image/png": png, "text/plain": ["<Figure size 640x480 with 1 Axes>"]}})
+        nb_cells.append({"cell_type": "code", "execution_count": i + 1, "metadata": {},
+                         "source": _source("\n\n".join(parts)), "outputs": outputs})
+
+    return {"cells": nb_cells, "metadata": {"kernelspec": {"name": "python3", "display_name": "Python 3"}},
+            "nbformat": 4, "nbformat_minor": 5}
+
+
+def generate_cohort(out_dir, students, task_functions, seed=0, **notebook_options):
+    """Writes `students` synthetic notebooks to out_dir and returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for n in range(students):
+        rng = random.Random(seed * 100003 + n)
+        path = os.path.join(out_dir, f"{1000000 + n} - Synthetic Student {n}.ipynb")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(synthetic_notebook(task_functions, rng, **notebook_options), f)
+        paths.append(path)
+    return paths
+
+
+def load_task_functions(questions_file=QUESTIONS_FILE):
+    with open(questions_file, "r", encoding="utf-8") as f:
+        return derive_task_functions(json.load(f))
+
+
+def summarize_level(workers, elapsed, metrics_path, peak_rss_kb):
+    """One report row from a level's metrics JSONL."""
+    records = []
+    if os.path.exists(metrics_path):
+        with open(metrics_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    ok = [r for r in records if r["status"] == "ok"]
+    stages = {}
+    for rec in records:
+        for name, seconds in rec["stages"].items():
+            stages.setdefault(name, []).append(seconds)
+    return {
+        "workers": workers,
+        "graded": len(ok),
+        "failed": len(records) - len(ok),
+        "elapsed": elapsed,
+        "students_per_min": len(ok) / (elapsed / 60) if elapsed else 0.0,
+        "stages": {name: (percentile(v, 50), percentile(v, 95)) for name, v in stages.items()},
+        "peak_rss_mb": peak_rss_kb / 1024,
+    }
+
+
+def format_report(rows):
+    stage_names = []
+    for row in rows:
+        stage_names += [name for name in row["stages"] if name not in stage_names]
+    header = f"{'workers':>7} {'graded':>6} {'failed':>6} {'st/min':>7} {'peak MB':>8}"
+    header += "".join(f" {name + ' p50/p95':>19}" for name in stage_names)
+    lines = [header]
+    for row in rows:
+        line = (f"{row['workers']:>7} {row['graded']:>6} {row['failed']:>6} "
+                f"{row['students_per_min']:>7.1f} {row['peak_rss_mb']:>8.0f}")
+        for name in stage_names:
+            p50, p95 = row["stages"].get(name, (0.0, 0.0))
+            line += f" {p50:>8.2f}s/{p95:>8.2f}s"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def run_level(cohort_dir, workers, work_dir, fake_options, extra_env=None):
+    """Grades the cohort in a fresh process with GRADING_WORKERS=workers and returns its report row."""
+    prefix = os.path.join(work_dir, f"workers-{workers}")
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_BACKEND": "fake",
+        "FAKE_GEMINI_LATENCY": str(fake_options.get("latency", 0.0)),
+        "FAKE_GEMINI_JITTER": str(fake_options.get("jitter", 0.0)),
+        "FAKE_GEMINI_ERROR_RATE": str(fake_options.get("error_rate", 0.0)),
+        "FAKE_GEMINI_RPM": str(fake_options.get("rpm", 0)),
+        "GRADING_WORKERS": str(workers),
+        "UPLOAD_WORKERS": str(workers),
+        "STUDENT_DIRS": os.path.abspath(cohort_dir),
+        "GRADING_OUTPUT": f"{prefix}.csv",
+        "METRICS_FILE": f"{prefix}.metrics.jsonl",
+        "RESULTS_DB": f"{prefix}.results.sqlite3",
+        "SIMILARITY_INDEX": f"{prefix}.similarity.sqlite3",
+        "PDF_CACHE_DIR": f"{prefix}-pdf",
+        "IMAGE_CACHE_DIR": f"{prefix}-images",
+        "UPLOAD_REGISTRY_FILE": f"{prefix}-uploads.sqlite3",
+        "UPLOAD_REUSE": "0",
+        "RESPONSE_CACHE": "0",
+        "GRADE_MEMO": "",
+        "PIPELINE_REPORT_INTERVAL": "0",
+    })
+    env.update(extra_env or {})
+
+    stats_path = f"{prefix}.stats.json"
+    with open(f"{prefix}.log", "w", encoding="utf-8") as log:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_child", stats_path],
+                              env=env, stdout=log, stderr=subprocess.STDOUT, check=False)
+    if proc.returncode != 0 or not os.path.exists(stats_path):
+        raise RuntimeError(f"Grading run with {workers} worker(s) did not finish; see {prefix}.log")
+    with open(stats_path, "r", encoding="utf-8") as f:
+        stats = json.load(f)
+    return summarize_level(workers, stats["elapsed"], f"{prefix}.metrics.jsonl", stats["peak_rss_kb"])
+
+
+def _child(stats_path):
+    """
+    Runs one grading pass (configured through the environment) and records elapsed time and peak memory.
+    Nothing is recorded for a pass that crashed or could not start, so the parent reports it as unfinished.
+    """
+    import evaluate_submissions
+
+    started = time.perf_counter()
+    if evaluate_submissions.main() is None:
+        sys.exit("Gemini backend could not be configured")
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in KB on Linux; node render processes are counted as children
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump({"elapsed": elapsed, "peak_rss_kb": peak}, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def cohort_options(p):
+        p.add_argument("--students", type=int, default=20)
+        p.add_argument("--cells", type=int, default=30)
+        p.add_argument("--plot-density", type=float, default=0.3)
+        p.add_argument("--image-kb", type=int, default=50)
+        p.add_argument("--seed", type=int, default=0)
+
+    gen = sub.add_parser("generate", help="write a synthetic cohort")
+    gen.add_argument("out_dir")
+    cohort_options(gen)
+
+    run = sub.add_parser("run", help="grade a cohort at several concurrency levels")
+    cohort_options(run)
+    run.add_argument("--cohort", help="existing cohort directory (default: generate one)")
+    run.add_argument("--levels", default="1,2,4,8")
+    run.add_argument("--latency", type=float, default=1.0, help="fake Gemini latency in seconds")
+    run.add_argument("--jitter", type=float, default=0.0)
+    run.add_argument("--error-rate", type=float, default=0.0)
+    run.add_argument("--rpm", type=int, default=0, help="fake requests-per-minute limit (429 beyond it)")
+    run.add_argument("--no-render-server", action="store_true")
+    run.add_argument("--grouped", action="store_true", help="evaluate rubric task groups as concurrent calls")
+    run.add_argument("--images", action="store_true", help="attach the notebooks' plot images instead of a PDF")
+    run.add_argument("--keep", action="store_true", help="keep the work directory")
+
+    child = sub.add_parser("_child")
+    child.add_argument("stats_path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "_child":
+        _child(args.stats_path)
+        return
+
+    notebook_options = {"cells": args.cells, "plot_density": args.plot_density, "image_kb": args.image_kb}
+    if args.command == "generate":
+        paths = generate_cohort(args.out_dir, args.students, load_task_functions(), seed=args.seed, **notebook_options)
+        print(f"Wrote {len(paths)} notebooks to {args.out_dir}")
+        return
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="run-", dir=BENCH_DIR)
+    cohort_dir = args.cohort
+    if not cohort_dir:
+        cohort_dir = os.path.join(work_dir, "cohort")
+        generate_cohort(cohort_dir, args.students, load_task_functions(), seed=args.seed, **notebook_options)
+
+    fake_options = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "rpm": args.rpm}
+    extra_env = {"RENDER_SERVER": "0"} if args.no_render_server else {}
+    if args.grouped:
+        extra_env["GROUPED_EVALUATION"] = "1"
+    if args.images:
+        extra_env["NOTEBOOK_ATTACHMENT"] = "images"
+    rows = []
+    for level in [int(x) for x in args.levels.split(",")]:
+        print(f"Benchmarking with {level} worker(s)...")
+        rows.append(run_level(cohort_dir, level, work_dir, fake_options, extra_env))
+        print(format_report(rows[-1:]).split("\n")[-1])
+    # On failure the work directory is left behind for its logs
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\nFake Gemini: latency {args.latency}s, jitter {args.jitter}s, error rate {args.error_rate}, "
+          f"rpm limit {args.rpm or 'none'}")
+    print(format_report(rows))
+    if args.keep:
+        print(f"Logs and metrics kept in {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
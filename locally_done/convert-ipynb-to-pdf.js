@@ -3,6 +3,12 @@ const path = require('path');
 const fs = require('fs/promises');
 const puppeteer = require('puppeteer');
 
+const PDF_OPTIONS = {
+  format: 'A4',
+  printBackground: true,
+  margin: { top: '12mm', right: '12mm', bottom: '12mm', left: '12mm' }
+};
+
 function run(cmd, args, opts = {}) {
   return new Promise((resolve, reject) => {
     execFile(cmd, args, opts, (err, stdout, stderr) => {
@@ -12,30 +18,35 @@ function run(cmd, args, opts = {}) {
   });
 }
 
-async function ipynbToPdf(ipynbPath, outPdfPath) {
+async function notebookToHtml(ipynbPath, htmlPath) {
   const absIpynb = path.resolve(ipynbPath);
-  const outDir = path.dirname(absIpynb);
-  const base = path.basename(absIpynb, '.ipynb');
-  const htmlName = `${base}.html`;
+  const absHtml = path.resolve(htmlPath);
+  const outDir = path.dirname(absHtml);
+  const htmlName = path.basename(absHtml);
   await run('python', ['-m', 'jupyter', 'nbconvert', '--to', 'html', absIpynb, '--output', htmlName, '--output-dir', outDir]);
-  const htmlPath = path.join(outDir, htmlName);
+  return absHtml;
+}
+
+async function htmlToPdf(page, htmlPath, outPdfPath) {
+  await page.goto(`file://${htmlPath}`, { waitUntil: 'networkidle0' });
+  await page.emulateMediaType('screen');
+  await page.pdf({ ...PDF_OPTIONS, path: path.resolve(outPdfPath) });
+}
+
+async function ipynbToPdf(ipynbPath, outPdfPath) {
+  const htmlPath = await notebookToHtml(ipynbPath, outPdfPath.replace(/\.pdf$/i, '') + '.html');
   const browser = await puppeteer.launch();
   try {
     const page = await browser.newPage();
-    await page.goto(`file://${htmlPath}`, { waitUntil: 'networkidle0' });
-    await page.emulateMediaType('screen');
-    await page.pdf({
-      path: path.resolve(outPdfPath),
-      format: 'A4',
-      printBackground: true,
-      margin: { top: '12mm', right: '12mm', bottom: '12mm', left: '12mm' }
-    });
+    await htmlToPdf(page, htmlPath, outPdfPath);
   } finally {
     await browser.close();
   }
   await fs.unlink(htmlPath).catch(() => {});
 }
 
+module.exports = { PDF_OPTIONS, notebookToHtml, htmlToPdf, ipynbToPdf };
+
 if (require.main === module) {
   const [ipynb, pdf] = process.argv.slice(2);
   if (!ipynb || !pdf) {
@@ -46,4 +57,4 @@ if (require.main === module) {
     console.error(err.message || String(err));
     process.exit(1);
   });
-}
\ No newline at end of file
+}
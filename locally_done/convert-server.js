@@ -0,0 +1,167 @@
+// Long-lived notebook -> PDF render service.
+//
+// Keeps one Chromium instance and a pool of warm pages, and serves jobs read
+// from stdin as JSON lines:
+//   {"id": 1, "ipynb": "/abs/path/nb.ipynb", "pdf": "/abs/path/out.pdf"}
+//   {"id": 2, "html": "/abs/path/nb.html", "pdf": "/abs/path/out.pdf"}
+// Each job is answered with one JSON line on stdout:
+//   {"id": 1, "ok": true, "ms": 812}   or   {"id": 1, "ok": false, "error": "..."}
+// A {"ready": true, "pool": N} line is printed once the browser is up.
+// Nothing else may be written to stdout; diagnostics go to stderr.
+
+const readline = require('readline');
+const fs = require('fs/promises');
+const puppeteer = require('puppeteer');
+const { notebookToHtml, htmlToPdf } = require('./convert-ipynb-to-pdf');
+
+const POOL_SIZE = Math.max(1, parseInt(process.env.RENDER_POOL_SIZE || '2', 10));
+// Pages are recycled after this many jobs to keep Chromium memory in check
+const RECYCLE_AFTER = Math.max(1, parseInt(process.env.RENDER_PAGE_RECYCLE || '50', 10));
+
+// A slot whose replacement page could not be opened is retried this often
+const NEW_PAGE_RETRY_MS = Math.max(100, parseInt(process.env.RENDER_NEW_PAGE_RETRY_MS || '1000', 10));
+
+class PagePool {
+  constructor(browser, size) {
+    this.browser = browser;
+    this.size = size;
+    this.idle = [];
+    this.waiters = [];
+    this.uses = new Map();
+    // Slots whose page is being reopened after newPage() failed
+    this.broken = 0;
+    this.lastError = null;
+  }
+
+  async warm() {
+    for (let i = 0; i < this.size; i++) {
+      this.idle.push(await this.browser.newPage());
+    }
+  }
+
+  acquire() {
+    if (this.idle.length > 0) return Promise.resolve(this.idle.pop());
+    if (this.broken >= this.size) return Promise.reject(this.unavailable());
+    return new Promise((resolve, reject) => this.waiters.push({ resolve, reject }));
+  }
+
+  async release(page) {
+    const uses = (this.uses.get(page) || 0) + 1;
+    this.uses.set(page, uses);
+    if (uses >= RECYCLE_AFTER || page.isClosed()) {
+      this.uses.delete(page);
+      await page.close().catch(() => {});
+      try {
+        page = await this.browser.newPage();
+      } catch (err) {
+        this.slotBroken(err);
+        return;
+      }
+    }
+    this.hand(page);
+  }
+
+  hand(page) {
+    const waiter = this.waiters.shift();
+    if (waiter) waiter.resolve(page);
+    else this.idle.push(page);
+  }
+
+  unavailable() {
+    const reason = this.lastError ? this.lastError.message || String(this.lastError) : 'unknown error';
+    return new Error(`no browser page available: ${reason}`);
+  }
+
+  // The slot is kept and reopened in the background. While no slot has a page,
+  // waiting and new jobs fail instead of hanging.
+  slotBroken(err) {
+    console.error(`convert-server: could not open a new page: ${err.message || String(err)}`);
+    this.lastError = err;
+    this.broken++;
+    if (this.broken >= this.size) {
+      for (const waiter of this.waiters.splice(0)) waiter.reject(this.unavailable());
+    }
+    setTimeout(() => this.refill(), NEW_PAGE_RETRY_MS);
+  }
+
+  async refill() {
+    let page;
+    try {
+      page = await this.browser.newPage();
+    } catch (err) {
+      this.lastError = err;
+      setTimeout(() => this.refill(), NEW_PAGE_RETRY_MS);
+      return;
+    }
+    this.broken--;
+    this.hand(page);
+  }
+}
+
+function reply(message) {
+  process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+async function handle(pool, job) {
+  const started = Date.now();
+  let htmlPath = job.html;
+  let ownsHtml = false;
+  try {
+    if (!job.pdf) throw new Error('missing "pdf" output path');
+    if (!htmlPath) {
+      if (!job.ipynb) throw new Error('job needs either "ipynb" or "html"');
+      htmlPath = await notebookToHtml(job.ipynb, job.pdf.replace(/\.pdf$/i, '') + '.html');
+      ownsHtml = true;
+    }
+    const page = await pool.acquire();
+    try {
+      await htmlToPdf(page, htmlPath, job.pdf);
+    } finally {
+      await pool.release(page);
+    }
+    reply({ id: job.id, ok: true, ms: Date.now() - started });
+  } catch (err) {
+    reply({ id: job.id, ok: false, error: err.message || String(err) });
+  } finally {
+    if (ownsHtml) await fs.unlink(htmlPath).catch(() => {});
+  }
+}
+
+async function main() {
+  const browser = await puppeteer.launch();
+  browser.on('disconnected', () => {
+    console.error('convert-server: browser disconnected, exiting');
+    process.exit(1);
+  });
+
+  const pool = new PagePool(browser, POOL_SIZE);
+  await pool.warm();
+  reply({ ready: true, pool: POOL_SIZE });
+
+  const pending = new Set();
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  rl.on('line', line => {
+    if (!line.trim()) return;
+    let job;
+    try {
+      job = JSON.parse(line);
+    } catch (err) {
+      reply({ id: null, ok: false, error: `bad request: ${err.message}` });
+      return;
+    }
+    const task = handle(pool, job).finally(() => pending.delete(task));
+    pending.add(task);
+  });
+
+  // stdin closed: finish in-flight jobs, then shut the browser down
+  rl.on('close', async () => {
+    await Promise.allSettled([...pending]);
+    await browser.close().catch(() => {});
+    process.exit(0);
+  });
+}
+
+main().catch(err => {
+  console.error(err.message || String(err));
+  process.exit(1);
+});
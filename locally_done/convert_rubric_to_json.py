@@ -1,9 +1,10 @@
 import json
 from docx import Document
 
-def convert_docx_to_json():
+def convert_docx_to_json(docx_path='Assignment_2_Rubric.docx', json_path='Assignment_2_Rubric.json'):
+    """Converts the rubric tables in docx_path to the rubric JSON. Returns the rubric, or None on failure."""
     try:
-        doc = Document('Assignment_2_Rubric.docx')
+        doc = Document(docx_path)
         
         rubric = {
             "title": "COMP9414 Assignment 2 - Rubric",
@@ -54,13 +55,15 @@ def convert_docx_to_json():
                     })
         
         # Output JSON
-        with open('Assignment_2_Rubric.json', 'w', encoding='utf-8') as f:
+        with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(rubric, f, indent=4)
             
-        print("Successfully converted to Assignment_2_Rubric.json")
+        print(f"Successfully converted to {json_path}")
+        return rubric
         
     except Exception as e:
         print(f"Error converting docx to json: {e}")
+        return None
 
 if __name__ == '__main__':
     convert_docx_to_json()
@@ -1,48 +1,149 @@
 import os
 import json
 import glob
-import pandas as pd
-import re
 
 import time
 import subprocess
+import threading
 
-# Configuration
-STUDENT_DIRS = ["4473"]
-QUESTIONS_FILE = "Assignment_2_Questions.json"
-RUBRIC_FILE = "Assignment_2_Rubric.json"
-SYSTEM_PROMPT_FILE = "system_prompt.md"
-OUTPUT_FILE = "grading_report.csv"
-
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 # Configuration
 load_dotenv()
-# STUDENT_DIRS duplicates removed, using the one above or confirming below.
-# Actually, let's keep the structure but update the value.
-STUDENT_DIRS = ["4473"]
-QUESTIONS_FILE = "Assignment_2_Questions.json"
-RUBRIC_FILE = "Assignment_2_Rubric.json"
-SYSTEM_PROMPT_FILE = "system_prompt.md"
-OUTPUT_FILE = "grading_report.csv"
-CONVERT_SCRIPT = "convert-ipynb-to-pdf.js"
+# Every setting below can be overridden from the environment (or .env); grademind_cli.py maps its options onto them.
+# STUDENT_DIRS (comma separated) and GRADING_OUTPUT override these, e.g. for benchmark runs.
+STUDENT_DIRS = os.environ.get("STUDENT_DIRS", "4473").split(",")
+QUESTIONS_FILE = os.environ.get("GRADING_QUESTIONS", "Assignment_2_Questions.json")
+RUBRIC_FILE = os.environ.get("GRADING_RUBRIC", "Assignment_2_Rubric.json")
+SYSTEM_PROMPT_FILE = os.environ.get("GRADING_SYSTEM_PROMPT", "system_prompt.md")
+OUTPUT_FILE = os.environ.get("GRADING_OUTPUT", "grading_report.csv")
+# The renderer ships next to this module, so grading works from any directory
+CONVERT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "convert-ipynb-to-pdf.js")
+
+# Pipeline sizing: workers per stage and the depth of the queue in front of each stage.
+# GRADING_WORKERS is the number of Gemini evaluations in flight at once.
+CONVERT_WORKERS = int(os.environ.get("CONVERT_WORKERS", "2"))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "4"))
+MAX_WORKERS = int(os.environ.get("GRADING_WORKERS", "4"))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_REPORT_INTERVAL = float(os.environ.get("PIPELINE_REPORT_INTERVAL", "30"))
+
+# Persistent render server (convert-server.js). Set RENDER_SERVER=0 to always use the one-shot script.
+USE_RENDER_SERVER = os.environ.get("RENDER_SERVER", "1") != "0"
+RENDER_POOL_SIZE = int(os.environ.get("RENDER_POOL_SIZE", str(CONVERT_WORKERS)))
+
+# Rendered PDFs are cached by notebook content + renderer settings, outside the submission dirs.
+# Keep RENDERER_SETTINGS in step with PDF_OPTIONS in convert-ipynb-to-pdf.js.
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(".grading_cache", "pdf"))
+PDF_CACHE_MAX_MB = int(os.environ.get("PDF_CACHE_MAX_MB", "2048"))
+RENDERER_SETTINGS = {"format": "A4", "printBackground": True, "margin": "12mm", "media": "screen"}
+
+# Rendered PDFs are shrunk before upload (pdf_optimizer.py): embedded images resampled to PDF_IMAGE_DPI,
+# fonts subset, unused objects dropped and, with PDF_DROP_BLANK_PAGES=1, empty pages removed.
+# Needs Ghostscript and/or pikepdf; without either the PDF is uploaded as rendered. PDF_OPTIMIZE=0 turns it off.
+PDF_OPTIMIZE = os.environ.get("PDF_OPTIMIZE", "1") != "0"
+PDF_IMAGE_DPI = int(os.environ.get("PDF_IMAGE_DPI", "150"))
+PDF_JPEG_QUALITY = int(os.environ.get("PDF_JPEG_QUALITY", "80"))
+PDF_DROP_BLANK_PAGES = os.environ.get("PDF_DROP_BLANK_PAGES", "0") == "1"
+OPTIMIZE_WORKERS = int(os.environ.get("OPTIMIZE_WORKERS", str(CONVERT_WORKERS)))
+
+# How plots reach Gemini: "pdf" renders the notebook and uploads the PDF; "images" attaches the
+# notebook's own image/png and image/jpeg outputs (notebook_images.py) and renders nothing.
+# Images are inlined in the request up to IMAGE_INLINE_MAX_MB in total and uploaded beyond that.
+NOTEBOOK_ATTACHMENT = os.environ.get("NOTEBOOK_ATTACHMENT", "pdf")
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join(".grading_cache", "images"))
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1024"))
+IMAGE_MAX_COUNT = int(os.environ.get("IMAGE_MAX_COUNT", "24"))
+IMAGE_INLINE_MAX_MB = float(os.environ.get("IMAGE_INLINE_MAX_MB", "12"))
+
+# Uploaded Gemini files are remembered by content hash and reused within their TTL.
+# Set UPLOAD_REUSE=0 to delete each file once its student has been graded.
+UPLOAD_REGISTRY_FILE = os.environ.get("UPLOAD_REGISTRY_FILE", os.path.join(".grading_cache", "uploads.sqlite3"))
+UPLOAD_TTL_HOURS = float(os.environ.get("UPLOAD_TTL_HOURS", "47"))
+UPLOAD_REUSE = os.environ.get("UPLOAD_REUSE", "1") != "0"
+
+# Gemini responses are stored by (system prompt, prompt, attachment hash, model, config).
+# Set RESPONSE_CACHE=0 to always call the API.
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+USE_RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_FILE = os.environ.get("RESPONSE_CACHE_FILE", os.path.join(".grading_cache", "responses.sqlite3"))
+RESPONSE_CACHE_TTL_DAYS = float(os.environ.get("RESPONSE_CACHE_TTL_DAYS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "50000"))
+
+# Gemini rate control: quota pacing (0 = unlimited), retries with backoff, and a circuit breaker
+# that pauses calls after GEMINI_BREAKER_FAILURES consecutive failures.
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "0"))
+GEMINI_MAX_IN_FLIGHT = int(os.environ.get("GEMINI_MAX_IN_FLIGHT", str(MAX_WORKERS)))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "5"))
+GEMINI_LATENCY_TARGET = float(os.environ.get("GEMINI_LATENCY_TARGET", "0")) or None
+GEMINI_BREAKER_FAILURES = int(os.environ.get("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET = float(os.environ.get("GEMINI_BREAKER_RESET", "60"))
+
+# Prompt size limits (estimated tokens). Oversized notebook cells are trimmed to fit.
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "24000"))
+PROMPT_MAX_CELL_TOKENS = int(os.environ.get("PROMPT_MAX_CELL_TOKENS", "1500"))
+
+# Every result also goes to the SQLite results store (batched); reports can be re-exported from it
+# with `python results_store.py export`.
+RESULTS_DB = os.environ.get("RESULTS_DB", "grading_results.sqlite3")
+# WAL is faster, but sharded runs across machines need DELETE (shard.py sets it)
+RESULTS_DB_JOURNAL = os.environ.get("RESULTS_DB_JOURNAL", "WAL")
+
+# Every student's extracted task code goes into this near-duplicate index; see
+# `python similarity_index.py report`. Set SIMILARITY_INDEX= (empty) to turn it off.
+SIMILARITY_INDEX_FILE = os.environ.get("SIMILARITY_INDEX", "similarity_index.sqlite3")
+
+# Grades of code sub-tasks are memoised by the normalised AST of the student's function, so
+# students handing in the same implementation share one grade (see grade_memo.py).
+# GRADE_MEMO_TASKS limits it to some sub-tasks (default: every sub-task with extracted code);
+# set GRADE_MEMO= (empty) to turn it off.
+GRADE_MEMO_FILE = os.environ.get("GRADE_MEMO", os.path.join(".grading_cache", "grade_memo.sqlite3"))
+GRADE_MEMO_TASKS = [t_id for t_id in os.environ.get("GRADE_MEMO_TASKS", "").split(",") if t_id]
+
+# Set CODE_CHECKS=1 to run the code sub-tasks against fixed test harnesses in sandboxed processes
+# (sandbox.py, task_checks.py). Verdicts listed in CODE_CHECK_GRADES are graded without Gemini
+# (pass = full marks, fail = 0); the others go to Gemini with the check results in the prompt.
+# This executes student code, so only turn it on where that is acceptable (a disposable VM or container).
+CODE_CHECKS = os.environ.get("CODE_CHECKS", "0") == "1"
+CODE_CHECK_GRADES = [v for v in os.environ.get("CODE_CHECK_GRADES", "pass").split(",") if v]
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", "2"))
+SANDBOX_CPU_SECONDS = int(os.environ.get("SANDBOX_CPU_SECONDS", "60"))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "8192"))
+SANDBOX_TIMEOUT = float(os.environ.get("SANDBOX_TIMEOUT", "120"))
+
+# Stream Gemini responses and store each task's result as soon as it is complete.
+# Set STREAM_RESPONSES=0 to wait for the whole response instead.
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "1") != "0"
 
-# Debug/Test Configuration
-# TEST_STUDENT_FILENAME = "2806832817 - Martin Peng - 2744791_Martin_Peng_z5580411_8279939_2111805061.ipynb"
-TEST_STUDENT_FILENAME = None  # Set to None to process all students
+# Set GROUPED_EVALUATION=1 to evaluate each rubric task group (Task 1/2 code, each Task 3.x
+# section) as its own concurrent Gemini call instead of one bulk call per student.
+# Each call counts against GEMINI_MAX_IN_FLIGHT, so raise it along with GROUP_WORKERS.
+GROUPED_EVALUATION = os.environ.get("GROUPED_EVALUATION", "0") == "1"
+GROUP_WORKERS = int(os.environ.get("GROUP_WORKERS", "8"))
+GROUP_OUTPUT_TOKENS_PER_TASK = int(os.environ.get("GROUP_OUTPUT_TOKENS_PER_TASK", "256"))
+
+# Per-student stage timings, token counts and cache hits are appended here (one JSON object per line)
+METRICS_FILE = os.environ.get("METRICS_FILE", "grading_metrics.jsonl")
+# Set GRADING_DEBUG=1 to print every raw Gemini response
+DEBUG_RESPONSES = os.environ.get("GRADING_DEBUG", "0") == "1"
+
+# Set GRADING_STUDENT to a notebook's file name to grade only that student
+TEST_STUDENT_FILENAME = os.environ.get("GRADING_STUDENT") or None
 
 
 def configure_gemini():
-    """Configures the Gemini API with the key from environment variables."""
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        print("Error: GEMINI_API_KEY not found in environment variables (.env).")
-        return False
-    
+    """
+    Sets up the shared Gemini backend (GEMINI_BACKEND=google|fake) once for the whole run.
+    The Google backend reads its API key from environment variables.
+    """
     try:
-        genai.configure(api_key=api_key)
+        backend = get_backend()
+        print(f"Using Gemini backend: {type(backend).__name__}")
         return True
+    except BackendConfigError as e:
+        print(f"Error: {e}")
+        return False
     except Exception as e:
         print(f"Error configuring Gemini API: {e}")
         return False
@@ -51,19 +152,96 @@ def load_json(path):
     with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def load_system_prompt():
-    if os.path.exists(SYSTEM_PROMPT_FILE):
-        with open(SYSTEM_PROMPT_FILE, 'r', encoding='utf-8') as f:
+def load_system_prompt(path=SYSTEM_PROMPT_FILE):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
             return f.read()
     return "You are a helpful grader."
 
+_render_client = None
+_render_client_failed = False
+_render_client_lock = threading.Lock()
+
+def get_render_client():
+    """
+    Returns the shared render server client, starting it on first use.
+    Returns None if the server is disabled or cannot be started.
+    """
+    global _render_client, _render_client_failed
+    if not USE_RENDER_SERVER:
+        return None
+    with _render_client_lock:
+        if _render_client is not None and _render_client.alive:
+            return _render_client
+        if _render_client_failed:
+            return None
+        try:
+            _render_client = RenderClient(RENDER_SERVER_SCRIPT, pool_size=RENDER_POOL_SIZE).start()
+            print(f"   -> Started render server with {RENDER_POOL_SIZE} warm page(s)")
+        except RenderServerError as e:
+            print(f"   -> Render server unavailable, using one-shot conversion: {e}")
+            _render_client = None
+            _render_client_failed = True
+        return _render_client
+
+def close_render_client():
+    global _render_client
+    with _render_client_lock:
+        if _render_client is not None:
+            _render_client.close()
+            _render_client = None
+
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+def get_pdf_cache():
+    global _pdf_cache
+    # Convert workers start together; they must all share one cache and its counters
+    with _pdf_cache_lock:
+        if _pdf_cache is None:
+            fingerprint = renderer_fingerprint(RENDERER_SETTINGS, [CONVERT_SCRIPT, RENDER_SERVER_SCRIPT])
+            _pdf_cache = PdfCache(PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_MB * 1024 * 1024, fingerprint=fingerprint)
+        return _pdf_cache
+
 def convert_ipynb_to_pdf(ipynb_path):
     """
-    Converts .ipynb to .pdf using the Node.js script.
+    Converts .ipynb to .pdf, through the render server when it is available
+    and the one-shot Node.js script otherwise.
+    PDFs are kept in the content-addressed cache, so an unchanged notebook is only rendered once.
+    Returns the path to the cached PDF or None if failed.
+    """
+    cache = get_pdf_cache()
+    key = cache.key_for(ipynb_path)
+    cached = cache.get(key)
+    if cached:
+        print(f"   -> PDF cache hit for {os.path.basename(ipynb_path)}")
+        metrics.incr("pdf_cache_hits")
+        return cached
+
+    # Render into the cache dir, never next to the student's submission
+    tmp_path = cache.temp_path_for(key)
+    pdf_path = None
+
+    client = get_render_client()
+    if client is not None:
+        try:
+            client.render(ipynb_path, tmp_path)
+            if os.path.exists(tmp_path):
+                pdf_path = tmp_path
+        except RenderServerError as e:
+            print(f"   -> Render server failed for {os.path.basename(ipynb_path)}, retrying one-shot: {e}")
+
+    if pdf_path is None:
+        pdf_path = convert_ipynb_to_pdf_oneshot(ipynb_path, tmp_path)
+    if pdf_path is None:
+        return None
+    return cache.put(key, pdf_path)
+
+def convert_ipynb_to_pdf_oneshot(ipynb_path, pdf_path):
+    """
+    Converts .ipynb to .pdf by running the Node.js script once for this notebook.
     Returns the path to the generated PDF or None if failed.
     """
-    pdf_path = ipynb_path.replace(".ipynb", ".pdf")
-    
     # If using the provided script which requires absolute paths or careful handling
     script_path = os.path.abspath(CONVERT_SCRIPT)
     
@@ -84,62 +262,147 @@ def convert_ipynb_to_pdf(ipynb_path):
     
     return None
 
+_upload_registry = None
+_upload_registry_lock = threading.Lock()
+
+def get_upload_registry():
+    global _upload_registry
+    with _upload_registry_lock:
+        if _upload_registry is None:
+            _upload_registry = UploadRegistry(get_backend(), UPLOAD_REGISTRY_FILE, ttl=UPLOAD_TTL_HOURS * 3600)
+        return _upload_registry
+
+def close_upload_registry():
+    global _upload_registry
+    with _upload_registry_lock:
+        if _upload_registry is not None:
+            if not UPLOAD_REUSE:
+                # Files a failed job never got to clean up are deleted too
+                _upload_registry.release_all()
+            _upload_registry.close()
+            print(_upload_registry.summary())
+            _upload_registry = None
+
 def upload_to_gemini(file_path, mime_type="application/pdf"):
-    """Uploads a file to Gemini and waits for it to be active."""
+    """
+    Uploads a file to Gemini and waits for it to be active.
+    A previous upload of the same bytes is reused while it is still valid.
+    """
     try:
-        file = genai.upload_file(file_path, mime_type=mime_type)
-        print(f"   -> Uploaded {file.display_name} to Gemini ({file.uri})")
-        
-        # Wait for processing
-        while file.state.name == "PROCESSING":
-            print("   -> Waiting for file processing...")
-            time.sleep(2)
-            file = genai.get_file(file.name)
-            
-        if file.state.name != "ACTIVE":
-            print(f"   -> File processing failed: {file.state.name}")
-            return None
-            
-        return file
+        return get_upload_registry().get_or_upload(file_path, mime_type=mime_type)
     except Exception as e:
         print(f"Gemini Upload Error: {e}")
         return None
 
-def call_gemini(prompt, system_instruction, attachment=None):
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    global _response_cache
+    if not USE_RESPONSE_CACHE:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(RESPONSE_CACHE_FILE, ttl_seconds=RESPONSE_CACHE_TTL_DAYS * 86400,
+                                            max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+        return _response_cache
+
+def close_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is not None:
+            print(_response_cache.summary())
+            _response_cache.close()
+            _response_cache = None
+
+_rate_controller = None
+_rate_controller_lock = threading.Lock()
+
+def get_rate_controller():
+    """Returns the run's shared RateController."""
+    global _rate_controller
+    with _rate_controller_lock:
+        if _rate_controller is None:
+            _rate_controller = RateController(
+                rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_in_flight=GEMINI_MAX_IN_FLIGHT,
+                max_retries=GEMINI_MAX_RETRIES, latency_target=GEMINI_LATENCY_TARGET,
+                failure_threshold=GEMINI_BREAKER_FAILURES, reset_timeout=GEMINI_BREAKER_RESET,
+            )
+        return _rate_controller
+
+def stream_results(backend, model_name, system_instruction, content, usage, on_result, generation_config=GENERATION_CONFIG):
+    """Consumes a streamed response, handing each finished results[] item to on_result. Returns the full text."""
+    parser = ResultStreamParser()
+    started = time.perf_counter()
+    for chunk in backend.generate_stream(model_name, system_instruction, generation_config, content, usage=usage):
+        for item in parser.feed(chunk):
+            if parser.items == 1:
+                metrics.record(first_result_seconds=round(time.perf_counter() - started, 3))
+            on_result(item)
+    return parser.text
+
+def call_gemini(prompt, system_instruction, attachment=None, attachment_hash=None, on_result=None,
+                generation_config=GENERATION_CONFIG):
     """
     Calls Google Gemini API.
-    supports optional attachment (File object).
+    supports optional attachment (File object, or a list of parts such as inline images).
+    Calls are paced and retried by the shared RateController; an error is only
+    returned once the retries are used up.
+    With on_result (and STREAM_RESPONSES on) the response is streamed and each
+    task result is passed to on_result as soon as it is complete.
+    Responses are served from the response cache when the same system prompt, prompt,
+    attachment content (attachment_hash), model and generation config were seen before.
+    generation_config defaults to GENERATION_CONFIG; task groups add their own max_output_tokens.
     """
-    api_key = os.environ.get("GEMINI_API_KEY")
     model_name = os.environ.get("GEMINI_MODEL", "gemini-1.5-pro")
-    
-    if not api_key:
+
+    try:
+        backend = get_backend()
+    except BackendConfigError as e:
         return {
             "marks_awarded": 0,
             "max_marks": 0,
-            "feedback": "GEMINI_API_KEY not found in .env",
+            "feedback": str(e),
             "issues": ["Config Error"]
         }
 
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            model_name,
-            system_instruction=system_instruction,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        
+    def generate():
         content = [prompt]
         if attachment:
-            content.append(attachment)
+            content.extend(attachment if isinstance(attachment, list) else [attachment])
             
-        response = model.generate_content(content)
+        usage = {}
+        if STREAM_RESPONSES and on_result is not None:
+            request = lambda: stream_results(backend, model_name, system_instruction, content, usage, on_result,
+                                             generation_config)
+        else:
+            request = lambda: backend.generate(model_name, system_instruction, generation_config, content, usage=usage)
+        text = get_rate_controller().call(request, tokens=estimate_tokens(prompt) + estimate_tokens(system_instruction))
+        metrics.incr("api_calls")
+        metrics.record(**usage)
         
         # Debug: Print raw response
-        print(f"\n[DEBUG] Raw Gemini Response:\n{response.text}\n")
+        if DEBUG_RESPONSES:
+            print(f"\n[DEBUG] Raw Gemini Response:\n{text}\n")
+
+        # Only well-formed JSON is worth keeping
+        json.loads(text)
+        return text
+
+    try:
+        cache = get_response_cache()
+        if cache is None:
+            text = generate()
+        else:
+            if attachment is not None and attachment_hash is None:
+                # Remote handles change between uploads; fall back to the file name
+                attachment_hash = getattr(attachment, "name", None)
+            key = make_response_key(system_instruction, prompt, attachment_hash, f"{backend.name}/{model_name}", generation_config)
+            text = cache.get_or_compute(key, generate, model=model_name)
 
+        metrics.record(response_chars=len(text))
         # Gemini returns a JSON string due to response_mime_type
-        return json.loads(response.text)
+        return json.loads(text)
         
     except Exception as e:
         print(f"Gemini API Error: {e}")
@@ -155,227 +418,962 @@ def mock_llm_call(prompt):
     # We will reroute the logic in the main loop
     pass
 
-def extract_code_from_notebook(file_path, task_signatures):
+def extract_code_from_notebook(file_path, task_functions, images=None):
     """
-    Extracts code cells based on function signatures or patterns.
+    Extracts the source of the functions each task asks for ({task_id: [function names]}).
     Also returns the full notebook content as a string for context/report tasks.
+    Cells are streamed one at a time; output payloads (plots, long logs) are never loaded.
+    With an ImageCollector, plot outputs are collected on the way and each cell's
+    figures are noted under its source.
     """
+    locator = TaskLocator(task_functions)
+    full_content = io.StringIO()
+    offload_dir = images.offload_dir if images is not None else None
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            nb = json.load(f)
+        for index, cell in enumerate(iter_notebook_cells(file_path, offload_dir=offload_dir)):
+            cell_type = cell.get('cell_type', 'raw')
+            source = ''.join(cell.get('source', []))
+            note = figure_note(images.add_cell(index, cell)) if images is not None else ""
+
+            # Add to full content
+            full_content.write(f"--- [{cell_type.upper()} CELL] ---\n{source}\n{note}\n")
+
+            # Index the cell's top-level definitions (parsed once per cell)
+            if cell_type == 'code':
+                locator.add_cell(source, index)
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return {}, ""
 
-    extracted_tasks = {}
-    full_content_lines = []
-    
-    for cell in nb['cells']:
-        cell_type = cell['cell_type']
-        source = ''.join(cell['source'])
-        
-        # Add to full content
-        full_content_lines.append(f"--- [{cell_type.upper()} CELL] ---")
-        full_content_lines.append(source)
-        full_content_lines.append("")
-        
-        # Extract specific tasks from code cells
-        if cell_type == 'code':
-            for task_id, signature in task_signatures.items():
-                if signature in source:
-                    if task_id not in extracted_tasks:
-                        extracted_tasks[task_id] = source
-                        
-    return extracted_tasks, "\n".join(full_content_lines)
+    # Same layout as joining [marker, source, ""] lines: drop the final blank line
+    return locator.tasks(), full_content.getvalue()[:-1]
 
 def generate_bulk_prompt(questions, rubric, extracted_tasks, full_notebook_content, is_pdf_available):
     """
     Constructs a single prompt for all tasks.
+    One-off convenience wrapper; the pipeline reuses a single PromptCompiler for the whole run.
     """
-    prompt = "--- BATCH EVALUATION ---\n"
-    prompt += "You are required to evaluate ALL tasks in the rubric below based on the provided student submission.\n"
-    prompt += "For tasks requiring code (Task 1 & 2), look at the EXTRACTED CODE SECTIONS.\n"
-    prompt += "For tasks requiring report/plots (Task 3), look at the FULL NOTEBOOK CONTENT (or attached PDF).\n\n"
-    
-    prompt += "RUBRIC:\n" + json.dumps(rubric, indent=2) + "\n\n"
-    
-    prompt += "--- EXTRACTED CODE SECTIONS ---\n"
-    for task_id, code in extracted_tasks.items():
-        prompt += f"Task {task_id} Code:\n```python\n{code}\n```\n\n"
-        
-    if not is_pdf_available:
-        prompt += "--- FULL NOTEBOOK CONTENT ---\n"
-        prompt += full_notebook_content + "\n\n"
-    else:
-        prompt += "--- FULL NOTEBOOK CONTENT ---\n"
-        prompt += "[SYSTEM]: The student's full notebook is attached as a PDF. Please refer to it for all plots and analysis tasks.\n\n"
-
-    prompt += "INSTRUCTION: Return a JSON object with a key 'results' containing a list of evaluations for every task_id in the rubric.\n"
-    prompt += "Format:\n"
-    prompt += "{\n  \"results\": [\n    {\n      \"task_id\": \"1.1\",\n      \"marks_awarded\": 1.0,\n      \"max_marks\": 1.0,\n      \"feedback\": \"Correct.\",\n      \"issues\": []\n    },\n    ...\n  ]\n}"
-    
-    return prompt
+    return PromptCompiler(rubric, token_budget=PROMPT_TOKEN_BUDGET).compile(
+        extracted_tasks, full_notebook_content, is_pdf_available).text
 
 
 import csv
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from gemini_client import BackendConfigError, get_backend
+from grade_memo import GradeMemo, grading_version, normalized_ast_hash
+import metrics
+from metrics import MetricsRecorder
+from notebook_images import ImageCollector, figure_note, image_summary, images_sha256
+from notebook_reader import iter_notebook_cells
+from pipeline import Pipeline, Stage
+from prompt_compiler import PromptCompiler, estimate_tokens
+from rate_control import RateController
+from result_stream import ResultStreamParser
+from results_store import ResultsStore, cohort_for
+from rubric_versions import diff_hashes, rubric_version, subset_rubric, subtask_hashes
+from sandbox import SandboxRunner, notebook_imports
+from similarity_index import SimilarityIndex
+from task_groups import merge_results, narrow_groups, split_task_groups
+from task_locator import TaskLocator, derive_task_functions
+from render_client import RENDER_SERVER_SCRIPT, RenderClient, RenderServerError
+from pdf_cache import PdfCache, file_sha256, renderer_fingerprint
+from pdf_optimizer import PdfOptimizer
+from upload_registry import UploadRegistry
+from response_cache import ResponseCache, make_key as make_response_key
+from run_ledger import RunLedger, ledger_path_for, stage_index
+
+# Serializes CSV writes so each student's row lands intact when grading concurrently
+CSV_LOCK = threading.Lock()
 
 def initialize_csv(filename, headers):
-    """Initializes the CSV file with headers if it doesn't exist."""
+    """
+    Initializes the CSV file with headers if it doesn't exist. A report written
+    under another rubric gets the current header, with its rows moved to match.
+    """
     if not os.path.exists(filename):
         with open(filename, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(headers)
+    elif read_csv_header(filename) != list(headers):
+        with CSV_LOCK:
+            _rewrite_csv(filename, headers)
+
+def read_csv_header(filename):
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+def _rewrite_csv(filename, headers, replace=None):
+    """
+    Writes the report again under headers, optionally with the row for replace["Student"]
+    replaced (or added). Columns the headers no longer have are dropped. Caller holds CSV_LOCK.
+    """
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.DictReader(f)
+                if replace is None or row.get("Student") != replace["Student"]]
+    tmp = f"{filename}.tmp"
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=headers, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        if replace is not None:
+            writer.writerow(replace)
+    os.replace(tmp, filename)
 
 def append_to_csv(filename, data_dict, headers):
-    """Appends a single student's result to the CSV."""
-    with open(filename, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
-        writer.writerow(data_dict)
+    """Appends a single student's result to the CSV. Safe to call from worker threads."""
+    with CSV_LOCK:
+        if os.path.exists(filename) and read_csv_header(filename) != list(headers):
+            # Never write a row under another rubric's header
+            _rewrite_csv(filename, headers, replace=data_dict)
+            return
+        with open(filename, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=headers)
+            writer.writerow(data_dict)
 
-def main():
-    print("--- Phase 1: Preparation ---")
-    
-    # Configure Gemini first
-    if not configure_gemini():
-        return
+def replace_csv_row(filename, data_dict, headers):
+    """Replaces the student's existing row (used when a re-grade changes their marks)."""
+    with CSV_LOCK:
+        _rewrite_csv(filename, headers, replace=data_dict)
+
+def completed(job, stage):
+    """True if the ledger shows this student already got past `stage` in an earlier run."""
+    return stage_index(job.get("done_stage", "pending")) >= stage_index(stage)
+
+def ledger_record(ctx, job, stage, **fields):
+    if ctx.get("ledger") is not None:
+        ctx["ledger"].record(job["filename"], stage, **fields)
+    job["done_stage"] = stage
+
+def ledger_fail(ctx, job, error):
+    print(f"   -> [{job['filename']}] Failed: {error}")
+    if ctx.get("ledger") is not None:
+        ctx["ledger"].fail(job["filename"], error)
+
+def convert_stage(ctx, job):
+    """Stage 1: render the notebook to PDF (or collect its plot images) and extract the task code (CPU bound)."""
+    file_path = job["file_path"]
+    filename = job["filename"]
+
+    if completed(job, "evaluated"):
+        # Result already stored; nothing left to convert
+        return job
+
+    images = None
+    if NOTEBOOK_ATTACHMENT == "images":
+        # The plots are taken from the notebook while it is read below; nothing is rendered
+        job["pdf_path"] = job["pdf_sha256"] = None
+        images = ImageCollector(IMAGE_CACHE_DIR, max_side=IMAGE_MAX_SIDE, max_images=IMAGE_MAX_COUNT)
+    elif completed(job, "converted") and job.get("pdf_path") and os.path.exists(job["pdf_path"]):
+        print(f"   -> [{filename}] Resuming after conversion")
+    else:
+        with metrics.timed("convert"):
+            job["pdf_path"] = convert_ipynb_to_pdf(file_path)
+        job["pdf_sha256"] = file_sha256(job["pdf_path"]) if job["pdf_path"] else None
+        if not job["pdf_path"]:
+            print(f"   -> [{filename}] PDF Conversion failed. Proceeding with text-only evaluation.")
+        ledger_record(ctx, job, "converted", pdf_path=job["pdf_path"], pdf_sha256=job["pdf_sha256"])
+
+    if job.get("pdf_path"):
+        metrics.record(pdf_bytes=os.path.getsize(job["pdf_path"]))
+
+    try:
+        with metrics.timed("extract"):
+            job["extracted_tasks"], job["full_notebook_content"] = extract_code_from_notebook(
+                file_path, ctx["task_functions"], images=images)
+    except Exception as e:
+        ledger_fail(ctx, job, f"Error extracting code - {e}")
+        return None
+    finally:
+        if images is not None:
+            images.close()
+
+    job["images"] = images.images if images is not None else []
+    if images is not None:
+        if job["images"]:
+            skipped = f", {images.skipped} more left out" if images.skipped else ""
+            print(f"   -> [{filename}] {image_summary(job['images'])}{skipped}")
+            metrics.record(images=len(job["images"]), image_bytes=sum(image.size for image in job["images"]))
+        else:
+            print(f"   -> [{filename}] No image outputs; evaluating without an attachment")
+        if not completed(job, "converted"):
+            ledger_record(ctx, job, "converted", pdf_path=None, pdf_sha256=None)
+
+    if ctx.get("similarity_index") is not None and job["extracted_tasks"]:
+        try:
+            with metrics.timed("similarity"):
+                ctx["similarity_index"].add_submission(cohort_for(file_path), filename, job["extracted_tasks"])
+        except Exception as e:
+            # The index is for review only; grading carries on without it
+            print(f"   -> [{filename}] Could not add to the similarity index: {e}")
+    return job
+
+def optimize_stage(ctx, job):
+    """Stage 1a: shrink the rendered PDF before it is uploaded (CPU bound)."""
+    if completed(job, "evaluated") or not job.get("pdf_path"):
+        return job
+    try:
+        with metrics.timed("optimize"):
+            result = ctx["pdf_optimizer"].optimize(job["pdf_path"])
+    except Exception as e:
+        print(f"   -> [{job['filename']}] PDF optimization failed, uploading it as rendered: {e}")
+        return job
+    print(f"   -> [{job['filename']}] {result.describe()}")
+    metrics.record(pdf_bytes_optimized=result.after)
+    if result.path != job["pdf_path"]:
+        job["pdf_path"] = result.path
+        job["pdf_sha256"] = file_sha256(result.path)
+    return job
+
+def execute_stage(ctx, job):
+    """Stage 1b: run the code sub-tasks against their test harnesses in the sandbox (CPU bound)."""
+    job["evidence"] = {}
+    if completed(job, "evaluated"):
+        return job
+    runner = ctx["sandbox"]
+    tasks = {t_id: code for t_id, code in job["extracted_tasks"].items() if runner.supports(t_id)}
+    if not tasks:
+        return job
+    with metrics.timed("execute"):
+        job["evidence"] = runner.run_all(tasks, notebook_imports(job["full_notebook_content"]))
+    for t_id, evidence in job["evidence"].items():
+        metrics.incr(f"checks_{evidence.verdict}")
+        detail = f" ({evidence.error})" if evidence.error else ""
+        print(f"   -> [{job['filename']}] Task {t_id} checks: {evidence.verdict}, {evidence.seconds:.1f}s{detail}")
+    return job
+
+def upload_stage(ctx, job):
+    """Stage 2: upload the rendered PDF to Gemini and wait until it is active (network bound)."""
+    job["gemini_file"] = None
+    job["image_parts"] = []
+    if completed(job, "evaluated"):
+        return job
+    if job["pdf_path"]:
+        # After a restart the upload registry hands back the earlier upload if it is still valid
+        with metrics.timed("upload"):
+            job["gemini_file"] = upload_to_gemini(job["pdf_path"])
+    elif job.get("images"):
+        with metrics.timed("upload"):
+            job["image_parts"] = image_parts(job["images"])
+        if job["image_parts"] is None:
+            # The figure notes number every image, so sending fewer would pair plots with the wrong cells
+            ledger_fail(ctx, job, "Image upload failed")
+            return None
+    ledger_record(ctx, job, "uploaded", gemini_file=job["gemini_file"].name if job["gemini_file"] else None)
+    return job
+
+def image_parts(images):
+    """
+    Request parts for the notebook's images: inline data while the total stays under
+    IMAGE_INLINE_MAX_MB, uploaded files after that. Returns one part per image, in
+    figure order, or None if an upload failed.
+    """
+    parts = []
+    inline_budget = IMAGE_INLINE_MAX_MB * 1024 * 1024
+    for image in images:
+        if image.size <= inline_budget:
+            inline_budget -= image.size
+            parts.append({"mime_type": image.mime, "data": image.read()})
+        else:
+            uploaded = upload_to_gemini(image.path, mime_type=image.mime)
+            if uploaded is None:
+                return None
+            parts.append(uploaded)
+    return parts
+
+def job_attachment(job):
+    """What goes with the prompt: (attachment, attachment_hash, image_count). The PDF wins over images."""
+    if job.get("gemini_file") is not None:
+        return job["gemini_file"], job["pdf_sha256"], 0
+    if job.get("image_parts"):
+        return job["image_parts"], images_sha256(job["images"]), len(job["image_parts"])
+    return None, None, 0
+
+def is_failed_response(evaluation_response):
+    """call_gemini reports API and config errors as a single error dict instead of results."""
+    return (isinstance(evaluation_response, dict)
+            and "results" not in evaluation_response
+            and any(issue in ("API Error", "Config Error") for issue in evaluation_response.get("issues", [])))
+
+def evaluate_stage(ctx, job):
+    """Stage 3: build the evaluation prompt(s), call Gemini and map the results onto a CSV row."""
+    filename = job["filename"]
+    if completed(job, "evaluated"):
+        print(f"   -> [{filename}] Resuming with stored evaluation")
+        return job
+
+    all_task_ids = ctx["all_task_ids"]
+
+    # Sub-tasks already graded against the current rubric version are reused as they are
+    reused = reusable_results(ctx, job)
+    pending_ids = [t_id for t_id in all_task_ids if t_id not in reused]
+    if reused and pending_ids:
+        print(f"   -> [{filename}] Re-grading {len(pending_ids)} changed sub-task(s), reusing {len(reused)}")
 
+    # So is code identical to an implementation another student was already graded on
+    code_hashes = memo_code_hashes(ctx, job)
+    memoized = memoized_results(ctx, code_hashes, pending_ids)
+    if memoized:
+        print(f"   -> [{filename}] Reusing memoised grades for Task {', '.join(memoized)} (same code as an earlier student)")
+        reused.update(memoized)
+        pending_ids = [t_id for t_id in pending_ids if t_id not in memoized]
+
+    # And code sub-tasks whose sandboxed checks were clear-cut
+    checked = checked_results(ctx, job, pending_ids)
+    if checked:
+        print(f"   -> [{filename}] Graded Task {', '.join(checked)} from automated checks")
+        reused.update(checked)
+        pending_ids = [t_id for t_id in pending_ids if t_id not in checked]
+
+    if not pending_ids:
+        print(f"   -> [{filename}] All {len(reused)} sub-tasks already graded; no Gemini call needed")
+        cleanup_gemini_file(job)
+        results_list = merge_results([list(reused.values())], all_task_ids)
+        return finish_evaluation(ctx, job, results_list, prompt_sha256=job.get("prompt_sha256"))
+
+    def on_result(result):
+        # Marks land in the ledger as they stream in, so they survive a timeout later in the response
+        print(f"   -> [{filename}] Task {result.get('task_id')}: {result.get('marks_awarded')}/{result.get('max_marks')}")
+        if ctx.get("ledger") is not None:
+            ctx["ledger"].record_partial(filename, result)
+
+    try:
+        with metrics.timed("generate"):
+            if ctx.get("group_executor") is not None:
+                results_list, prompt_sha256 = evaluate_groups(ctx, job, pending_ids, on_result)
+            else:
+                results_list, prompt_sha256 = evaluate_bulk(ctx, job, pending_ids, on_result)
+    finally:
+        cleanup_gemini_file(job)
+    if results_list is None:
+        # Leave the student at "uploaded" so the next run retries the evaluation
+        return None
+
+    remember_grades(ctx, job, code_hashes, results_list)
+    results_list = merge_results([results_list, list(reused.values())], all_task_ids)
+    return finish_evaluation(ctx, job, results_list, prompt_sha256=prompt_sha256)
+
+def evaluate_bulk(ctx, job, pending_ids, on_result):
+    """
+    Evaluates every pending sub-task in one Gemini call.
+    Returns (results, prompt_sha256), or (None, None) after recording the failure.
+    """
+    filename = job["filename"]
+    gemini_file = job["gemini_file"]
+    attachment, attachment_hash, image_count = job_attachment(job)
+
+    # Generate Bulk Prompt (the rubric/instruction prefix is compiled once per run)
+    extracted_tasks = {t_id: code for t_id, code in job["extracted_tasks"].items() if t_id in pending_ids}
+    compiled = prompt_compiler_for(ctx, pending_ids).compile(
+        extracted_tasks, job["full_notebook_content"], is_pdf_available=(gemini_file is not None),
+        evidence=prompt_evidence(job, pending_ids), image_count=image_count)
+    prompt = compiled.text
+    print(f"   -> [{filename}] Prompt {compiled.describe()}")
+    metrics.record(prompt_tokens_estimated=compiled.tokens)
+
+    print(f"   -> [{filename}] Calling Gemini for Batch Evaluation...")
+    evaluation_response = call_gemini(prompt, ctx["system_prompt"], attachment=attachment,
+                                      attachment_hash=attachment_hash, on_result=on_result)
+    results_list = response_results(ctx, job, evaluation_response, pending_ids)
+    if results_list is None:
+        ledger_fail(ctx, job, evaluation_response.get("feedback"))
+        return None, None
+    return results_list, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def evaluate_groups(ctx, job, pending_ids, on_result):
+    """
+    Evaluates each task group (see task_groups.py) with its own concurrent Gemini call
+    and merges the results, so the student waits on the largest group rather than the
+    whole rubric. Returns (results, prompt_sha256), or (None, None) if any group failed.
+    Groups that succeeded are in the response cache, so a retry only asks for the rest.
+    """
+    filename = job["filename"]
+    groups = narrow_groups(ctx["task_groups"], pending_ids)
+    print(f"   -> [{filename}] Calling Gemini for {len(groups)} task group(s) concurrently...")
+    metrics.record(task_groups=len(groups))
+
+    def run(group):
+        # Each group call keeps its own metrics; they are folded into the student's record below
+        rec = metrics.StudentMetrics(filename)
+        with metrics.bound(rec):
+            return evaluate_group(ctx, job, group, on_result), rec
+
+    outcomes = [future.result() for future in [ctx["group_executor"].submit(run, group) for group in groups]]
+    student_rec = metrics.current()
+    result_lists, prompt_hashes, failures = [], [], []
+    for group, ((results, prompt_sha256, error), rec) in zip(groups, outcomes):
+        if student_rec is not None:
+            student_rec.absorb(rec)
+        if results is None:
+            failures.append(f"{group.name}: {error}")
+        else:
+            result_lists.append(results)
+            prompt_hashes.append(prompt_sha256)
+    if failures:
+        ledger_fail(ctx, job, " | ".join(failures))
+        return None, None
+    return merge_results(result_lists, ctx["all_task_ids"]), hashlib.sha256("".join(prompt_hashes).encode("utf-8")).hexdigest()
+
+def evaluate_group(ctx, job, group, on_result):
+    """
+    One task group's Gemini call, with only the context the group needs: code groups get
+    their extracted code (plus the notebook if some of it was not found), report groups get
+    the notebook or PDF. The output is capped to the group's budget.
+    Returns (results, prompt_sha256, error).
+    """
+    filename = job["filename"]
+    extracted_tasks = {t_id: code for t_id, code in job["extracted_tasks"].items() if t_id in group.task_ids}
+    include_notebook = not group.needs_code or len(extracted_tasks) < len(group.task_ids)
+    attachment, attachment_hash, image_count = job_attachment(job) if include_notebook else (None, None, 0)
+    compiled = prompt_compiler_for(ctx, group.task_ids).compile(
+        extracted_tasks, job["full_notebook_content"], is_pdf_available=(job["gemini_file"] is not None),
+        include_notebook=include_notebook, evidence=prompt_evidence(job, group.task_ids), image_count=image_count)
+    output_budget = group.output_budget(GROUP_OUTPUT_TOKENS_PER_TASK)
+    print(f"   -> [{filename}] {group.name}: prompt {compiled.describe()}, output budget {output_budget} tokens")
+    metrics.record(prompt_tokens_estimated=compiled.tokens)
+
+    evaluation_response = call_gemini(compiled.text, ctx["system_prompt"], attachment=attachment,
+                                      attachment_hash=attachment_hash,
+                                      on_result=on_result,
+                                      generation_config=dict(GENERATION_CONFIG, max_output_tokens=output_budget))
+    results_list = response_results(ctx, job, evaluation_response, group.task_ids)
+    if results_list is None:
+        return None, None, evaluation_response.get("feedback")
+    return results_list, hashlib.sha256(compiled.text.encode("utf-8")).hexdigest(), None
+
+def response_results(ctx, job, evaluation_response, task_ids):
+    """
+    The results list from a call_gemini response. When the call failed, the results that
+    streamed in before it broke off are used if they cover task_ids; otherwise None.
+    """
+    if is_failed_response(evaluation_response):
+        partials = ctx["ledger"].partial_results(job["filename"]) if ctx.get("ledger") is not None else []
+        partials = [r for r in partials if r.get("task_id") in task_ids]
+        if partials and {r.get("task_id") for r in partials} >= set(task_ids):
+            # Every task arrived before the response broke off
+            print(f"   -> [{job['filename']}] Using {len(partials)} streamed results ({evaluation_response.get('feedback')})")
+            return partials
+        return None
+    if isinstance(evaluation_response, list):
+        return evaluation_response
+    return evaluation_response.get("results", [])
+
+def reusable_results(ctx, job):
+    """Stored results for this notebook whose sub-task is unchanged in the current rubric."""
+    store = ctx.get("results_store")
+    if store is None or not ctx.get("subtask_hashes"):
+        return {}
+    stored = store.stored_results(cohort_for(job["file_path"]), job["filename"],
+                                  notebook_sha256=job.get("notebook_sha256") or file_sha256(job["file_path"]))
+    return {t_id: r for t_id, r in stored.items() if r["subtask_sha256"] == ctx["subtask_hashes"].get(t_id)}
+
+def checked_results(ctx, job, task_ids):
+    """Local results for sub-tasks whose sandbox verdict is in CODE_CHECK_GRADES."""
+    results = {}
+    for t_id in task_ids:
+        evidence = job.get("evidence", {}).get(t_id)
+        if evidence is None or evidence.verdict not in ctx["code_check_grades"]:
+            continue
+        max_marks = ctx["task_marks"].get(t_id, 0)
+        if evidence.verdict == "pass":
+            results[t_id] = {"task_id": t_id, "marks_awarded": max_marks, "max_marks": max_marks,
+                             "feedback": "Passed all automated checks.", "issues": []}
+        elif evidence.verdict == "fail":
+            failed = [f"{c['name']}: {c['detail']}" if c["detail"] else c["name"] for c in evidence.failed(hard=True)]
+            results[t_id] = {"task_id": t_id, "marks_awarded": 0, "max_marks": max_marks,
+                             "feedback": "Failed automated checks: " + "; ".join(failed), "issues": failed}
+    return results
+
+def prompt_evidence(job, task_ids):
+    """Sandbox results for the sub-tasks still going to Gemini, as prompt text."""
+    evidence = job.get("evidence", {})
+    return {t_id: evidence[t_id].describe() for t_id in task_ids if t_id in evidence}
+
+def memo_code_hashes(ctx, job):
+    """{task_id: normalised-AST hash} of the student's code for every sub-task the grade memo covers."""
+    if ctx.get("grade_memo") is None:
+        return {}
+    hashes = {}
+    for t_id in ctx["memo_versions"]:
+        code = job["extracted_tasks"].get(t_id)
+        code_sha256 = normalized_ast_hash(code) if code else None
+        if code_sha256:
+            hashes[t_id] = code_sha256
+    return hashes
+
+def memoized_results(ctx, code_hashes, task_ids):
+    """Memoised grades for the given sub-tasks whose implementation was graded before."""
+    memoized = {}
+    for t_id in task_ids:
+        if t_id in code_hashes:
+            result = ctx["grade_memo"].get(t_id, code_hashes[t_id], ctx["memo_versions"][t_id])
+            if result is not None:
+                memoized[t_id] = result
+    return memoized
+
+def remember_grades(ctx, job, code_hashes, results_list):
+    """Stores fresh results for memoised sub-tasks so later students with the same code can reuse them."""
+    for result in results_list:
+        t_id = result.get("task_id")
+        if t_id in code_hashes and "marks_awarded" in result:
+            ctx["grade_memo"].put(t_id, code_hashes[t_id], ctx["memo_versions"][t_id], result, student=job["filename"])
+
+def prompt_compiler_for(ctx, task_ids):
+    """The run's PromptCompiler, or one for just the given sub-tasks when only some need grading."""
+    if list(task_ids) == list(ctx["all_task_ids"]):
+        return ctx["prompt_compiler"]
+    key = tuple(task_ids)
+    compilers = ctx.setdefault("subset_compilers", {})
+    if key not in compilers:
+        compilers[key] = PromptCompiler(subset_rubric(ctx["rubric"], task_ids), token_budget=PROMPT_TOKEN_BUDGET,
+                                        max_cell_tokens=PROMPT_MAX_CELL_TOKENS)
+    return compilers[key]
+
+def finish_evaluation(ctx, job, results_list, prompt_sha256=None):
+    """Maps evaluation results onto the student's CSV row, with totals and Overall Feedback, and records them."""
+    filename = job["filename"]
+    all_task_ids = ctx["all_task_ids"]
+    student_results = {"Student": filename, "Total Marks": 0}
+    deductions = []
+    for t_id in all_task_ids:
+        student_results[f"Task {t_id} Marks"] = 0
+
+    # Map results back to student_results
+    for result in results_list:
+        t_id = result.get("task_id")
+        marks = result.get("marks_awarded", 0)
+        feedback = result.get("feedback", "")
+        max_marks = result.get("max_marks") or 0
+
+        if t_id in all_task_ids:
+            student_results[f"Task {t_id} Marks"] = marks
+            student_results["Total Marks"] += marks
+
+            if marks < max_marks:
+                deductions.append(f"Task {t_id} (-{max_marks - marks:.1f}): {feedback}")
+        else:
+            print(f"   -> [{filename}] Warning: Gemini returned unknown task_id {t_id}")
+
+    # Handle missing evaluations (if Gemini skipped some)
+    evaluated_ids = [r.get("task_id") for r in results_list]
+    for t_id in all_task_ids:
+        if t_id not in evaluated_ids:
+            deductions.append(f"Task {t_id}: Not evaluated by AI (Error).")
+
+    # Generate Overall Feedback
+    if not deductions:
+        student_results["Overall Feedback"] = "Excellent work! Full marks on auto-graded tasks."
+    else:
+        student_results["Overall Feedback"] = " | ".join(deductions)
+
+    job["student_results"] = student_results
+    job["task_results"] = results_list
+    job["prompt_sha256"] = prompt_sha256
+    ledger_record(ctx, job, "evaluated", result=student_results, prompt_sha256=prompt_sha256)
+    return job
+
+def write_stage(ctx, job):
+    """Stage 4: append the student's row to the CSV report."""
+    with metrics.timed("write"):
+        if job.get("regrade"):
+            replace_csv_row(ctx["output_file"], job["student_results"], ctx["headers"])
+        else:
+            append_to_csv(ctx["output_file"], job["student_results"], ctx["headers"])
+        if ctx.get("results_store") is not None:
+            ctx["results_store"].add(cohort_for(job["file_path"]), job["student_results"],
+                                     task_results=job.get("task_results"), run_id=ctx.get("run_id"),
+                                     notebook_sha256=job.get("notebook_sha256"),
+                                     prompt_sha256=job.get("prompt_sha256"),
+                                     subtask_hashes=ctx.get("subtask_hashes"))
+    ledger_record(ctx, job, "written")
+    print(f"   -> Saved result for {job['filename']}")
+    if ctx.get("metrics") is not None:
+        ctx["metrics"].finish(job["metrics"])
+    return job
+
+def run_stage(stage, ctx, job):
+    """
+    Runs one pipeline stage with the job's metrics record bound to this thread.
+    A job dropped by a stage is recorded as failed.
+    """
+    recorder = ctx.get("metrics")
+    if recorder is None:
+        return stage(ctx, job)
+    if job.get("metrics") is None:
+        job["metrics"] = recorder.new(job["filename"])
+    try:
+        with metrics.bound(job["metrics"]):
+            result = stage(ctx, job)
+    except Exception:
+        recorder.finish(job["metrics"], status="failed")
+        raise
+    if result is None:
+        recorder.finish(job["metrics"], status="failed")
+    return result
+
+def cleanup_gemini_file(job):
+    # Uploaded files are kept for reuse unless UPLOAD_REUSE=0; deletion is batched by the registry's GC
+    gemini_file = job.get("gemini_file")
+    if gemini_file and not UPLOAD_REUSE:
+        get_upload_registry().schedule_delete(gemini_file.name)
+    job["gemini_file"] = None
+    job["image_parts"] = []
+
+def new_job(file_path, ledger_entry=None):
+    """Creates a pipeline job, picking up the stored state of an earlier, interrupted run."""
+    job = {"file_path": file_path, "filename": os.path.basename(file_path), "done_stage": "pending"}
+    if ledger_entry:
+        job["notebook_sha256"] = ledger_entry["notebook_sha256"]
+        job["prompt_sha256"] = ledger_entry["prompt_sha256"]
+        job["done_stage"] = ledger_entry["stage"]
+        job["pdf_path"] = ledger_entry["pdf_path"]
+        job["pdf_sha256"] = ledger_entry["pdf_sha256"]
+        if ledger_entry["result"]:
+            job["student_results"] = ledger_entry["result"]
+    return job
+
+def plan_jobs(ledger, student_files, needs_regrade=None, written_students=()):
+    """
+    Registers every submission in the ledger and returns the jobs still to run.
+    Students already written to the report are skipped, unless needs_regrade(job)
+    says their stored results were graded against an older rubric. A student in
+    written_students (the report's rows) whose notebook changed is graded again
+    and their row replaced rather than appended a second time; one the ledger has
+    not seen yet is taken as written.
+    """
+    jobs = []
+    skipped = 0
+    regrades = 0
+    for file_path in student_files:
+        filename = os.path.basename(file_path)
+        notebook_sha256 = file_sha256(file_path)
+        if filename in written_students and ledger.get(filename) is None:
+            # In a report written before the ledger existed: the row stands for this notebook
+            ledger.begin(filename, file_path, notebook_sha256)
+            ledger.record(filename, "written")
+            entry = ledger.get(filename)
+        else:
+            entry = ledger.begin(filename, file_path, notebook_sha256)
+        if stage_index(entry["stage"]) >= stage_index("evaluated") and needs_regrade is not None:
+            job = new_job(file_path, entry)
+            if needs_regrade(job):
+                # Convert again (a PDF cache hit) so the changed sub-tasks get the code and notebook text
+                job["regrade"] = entry["stage"] == "written" or filename in written_students
+                job["done_stage"] = "converted"
+                jobs.append(job)
+                regrades += 1
+                continue
+        if entry["stage"] == "written":
+            skipped += 1
+            continue
+        job = new_job(file_path, entry)
+        if filename in written_students:
+            # Resubmitted after their row was written: the ledger started them over
+            print(f"Re-grading resubmitted notebook {filename}")
+            job["regrade"] = True
+        elif entry["stage"] != "pending" or entry["error"]:
+            print(f"Resuming {filename} after stage '{entry['stage']}'" + (f" (last error: {entry['error']})" if entry["error"] else ""))
+        jobs.append(job)
+    if skipped:
+        print(f"Skipping {skipped} submission(s) already in the report.")
+    if regrades:
+        print(f"Re-grading changed rubric sub-tasks for {regrades} submission(s).")
+    return jobs
+
+def needs_regrade(ctx, job):
+    """
+    True if the student's stored results include a sub-task the current rubric has changed or added.
+    Results with no sub-task hash (imported, or written after a resume) count as changed, since
+    nothing shows which rubric they were graded against; those students are graded again in full.
+    """
+    store = ctx.get("results_store")
+    if store is None:
+        return False
+    stored = store.stored_results(cohort_for(job["file_path"]), job["filename"],
+                                  notebook_sha256=job.get("notebook_sha256"), include_unversioned=True)
+    return bool(stored) and any(stored.get(t_id, {}).get("subtask_sha256") != sha
+                                for t_id, sha in ctx["subtask_hashes"].items())
+
+def read_written_students(filename):
+    """Returns the students that already have a row in the CSV report."""
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        return {row["Student"] for row in csv.DictReader(f) if row.get("Student")}
+
+def student_stages(ctx):
+    """The stage functions a submission goes through before it is written, in pipeline order."""
+    stages = [convert_stage]
+    if ctx.get("pdf_optimizer") is not None:
+        stages.append(optimize_stage)
+    if ctx.get("sandbox") is not None:
+        stages.append(execute_stage)
+    return stages + [upload_stage, evaluate_stage]
+
+def grade_student(ctx, file_path):
+    """
+    Runs every stage back to back for a single submission, without the pipeline.
+    Returns the CSV row for the student, or None if the submission was skipped.
+    """
+    job = new_job(file_path)
+    for stage in student_stages(ctx):
+        job = stage(ctx, job)
+        if job is None:
+            return None
+    return job["student_results"]
+
+def build_pipeline(ctx):
+    """Wires the grading stages together with bounded queues."""
+    optional = []
+    if ctx.get("pdf_optimizer") is not None:
+        optional.append(Stage("optimize", partial(run_stage, optimize_stage, ctx), workers=OPTIMIZE_WORKERS,
+                              queue_size=PIPELINE_QUEUE_SIZE))
+    if ctx.get("sandbox") is not None:
+        optional.append(Stage("execute", partial(run_stage, execute_stage, ctx), workers=SANDBOX_WORKERS,
+                              queue_size=PIPELINE_QUEUE_SIZE))
+    return Pipeline([
+        Stage("convert", partial(run_stage, convert_stage, ctx), workers=CONVERT_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        *optional,
+        Stage("upload", partial(run_stage, upload_stage, ctx), workers=UPLOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("evaluate", partial(run_stage, evaluate_stage, ctx), workers=MAX_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        # A single writer keeps the CSV append-only and ordered by completion
+        Stage("write", partial(run_stage, write_stage, ctx), workers=1, queue_size=PIPELINE_QUEUE_SIZE),
+    ], report_interval=PIPELINE_REPORT_INTERVAL)
+
+def build_context(output_file, questions_file=QUESTIONS_FILE, rubric_file=RUBRIC_FILE,
+                  system_prompt_file=SYSTEM_PROMPT_FILE):
+    """
+    Loads the assignment and opens the report, run ledger, results store and metrics
+    for a grading run writing to output_file. Returns the context every stage uses.
+    """
     print("Loading Assignment Context...")
-    questions = load_json(QUESTIONS_FILE)
-    rubric = load_json(RUBRIC_FILE)
-    system_prompt_template = load_system_prompt()
+    questions = load_json(questions_file)
+    rubric = load_json(rubric_file)
+    system_prompt_template = load_system_prompt(system_prompt_file)
     
     print(f"Loaded {len(questions.get('tasks', []))} Tasks from Questions.")
     print(f"Loaded Rubric with {len(rubric.get('tasks', []))} Task Groups.")
 
-    # Define signatures to look for
-    task_signatures = {
-        "1.1": "def missing_data",
-        "1.2": "def encoding",
-        "1.3": "def rescale",
-        "2.1": "def train_shallow_net_class",
-        "2.2": "def train_classification_tree"
-    }
-    
     # Prepare CSV Headers
     # We need to know all possible columns. 
     # Structure: Student, Total Marks, Overall Feedback, [Task X Marks, Task X Feedback...]
     headers = ["Student", "Total Marks", "Overall Feedback"]
+    all_task_ids = []
     for task_group in rubric.get("tasks", []):
         for sub_task in task_group.get("sub_tasks", []):
             t_id = sub_task["sub_task_id"]
+            all_task_ids.append(t_id)
             headers.append(f"Task {t_id} Marks")
             # We can optionally add specific feedback columns back if needed, 
             # but the user liked the summary. Let's keep it simple for now.
     
-    initialize_csv(OUTPUT_FILE, headers)
-    print(f"Initialized {OUTPUT_FILE}")
+    # Functions to look for, taken from the assessed stubs in the questions file
+    task_functions = derive_task_functions(questions, set(all_task_ids))
+    for t_id, names in task_functions.items():
+        print(f"Task {t_id} code: {', '.join(names)}")
 
-    print("\n--- Phase 2: Evaluation & Appending ---")
-    
+    initialize_csv(output_file, headers)
+    print(f"Initialized {output_file}")
+
+    ledger = RunLedger(ledger_path_for(output_file))
+    ledger.reconcile_written(read_written_students(output_file))
+    print(f"Using run ledger {ledger.path}")
+    results_store = ResultsStore(RESULTS_DB, journal_mode=RESULTS_DB_JOURNAL)
+
+    hashes = subtask_hashes(rubric)
+    previous = results_store.record_rubric_version(rubric_version(hashes), hashes)
+    changed, added, removed = diff_hashes(previous, hashes) if previous else ([], [], [])
+    print(f"Rubric version {rubric_version(hashes)}")
+    if changed or added or removed:
+        print(f"Rubric changed since the last version: changed {changed or '-'}, added {added or '-'}, removed {removed or '-'}")
+
+    model = os.environ.get("GEMINI_MODEL", "gemini-1.5-pro")
+    pdf_optimizer = None
+    if PDF_OPTIMIZE and NOTEBOOK_ATTACHMENT == "pdf":
+        pdf_optimizer = PdfOptimizer(dpi=PDF_IMAGE_DPI, jpeg_quality=PDF_JPEG_QUALITY,
+                                     drop_blank_pages=PDF_DROP_BLANK_PAGES)
+        if not pdf_optimizer.available:
+            print("PDF optimization skipped: install Ghostscript or pikepdf to shrink PDFs before upload")
+            pdf_optimizer = None
+    task_groups = split_task_groups(rubric, task_functions)
+    if GROUPED_EVALUATION:
+        print(f"Grouped evaluation: {', '.join(f'{g.name} ({len(g.task_ids)})' for g in task_groups)}")
+
+    return {
+        "questions": questions,
+        "rubric": rubric,
+        "system_prompt": system_prompt_template,
+        "task_functions": task_functions,
+        "all_task_ids": all_task_ids,
+        "headers": headers,
+        "output_file": output_file,
+        "ledger": ledger,
+        "results_store": results_store,
+        "subtask_hashes": hashes,
+        "run_id": results_store.start_run(model=model,
+                                          rubric_sha256=file_sha256(rubric_file), output_file=output_file),
+        "metrics": MetricsRecorder(METRICS_FILE),
+        "prompt_compiler": PromptCompiler(rubric, token_budget=PROMPT_TOKEN_BUDGET,
+                                          max_cell_tokens=PROMPT_MAX_CELL_TOKENS),
+        "task_groups": task_groups,
+        "pdf_optimizer": pdf_optimizer,
+        "task_marks": {sub["sub_task_id"]: sub.get("marks", 0)
+                       for group in rubric.get("tasks", []) for sub in group.get("sub_tasks", [])},
+        "sandbox": (SandboxRunner(SANDBOX_WORKERS, cpu_seconds=SANDBOX_CPU_SECONDS, memory_mb=SANDBOX_MEMORY_MB,
+                                  timeout=SANDBOX_TIMEOUT) if CODE_CHECKS else None),
+        "code_check_grades": CODE_CHECK_GRADES,
+        "grade_memo": GradeMemo(GRADE_MEMO_FILE) if GRADE_MEMO_FILE else None,
+        "memo_versions": {
+            t_id: grading_version(hashes[t_id], system_prompt_template, model)
+            for t_id in task_functions if not GRADE_MEMO_TASKS or t_id in GRADE_MEMO_TASKS
+        },
+        "similarity_index": (SimilarityIndex(SIMILARITY_INDEX_FILE, journal_mode=RESULTS_DB_JOURNAL)
+                             if SIMILARITY_INDEX_FILE else None),
+        # Shared by every evaluate worker; group calls never submit further work, so it cannot deadlock
+        "group_executor": ThreadPoolExecutor(GROUP_WORKERS, thread_name_prefix="group") if GROUPED_EVALUATION else None,
+    }
+
+def close_shared_clients():
+    close_render_client()
+    close_upload_registry()
+    close_response_cache()
+
+def close_context(ctx):
+    """Prints the end-of-run summaries and closes what build_context opened. Returns the ledger counts."""
+    if ctx.get("group_executor") is not None:
+        ctx["group_executor"].shutdown()
+    ctx["results_store"].close()
+    if ctx.get("similarity_index") is not None:
+        ctx["similarity_index"].close()
+    if ctx.get("sandbox") is not None:
+        ctx["sandbox"].close()
+    if ctx.get("grade_memo") is not None:
+        print(ctx["grade_memo"].summary())
+        ctx["grade_memo"].close()
+    print(get_pdf_cache().summary())
+    if ctx.get("pdf_optimizer") is not None:
+        print(ctx["pdf_optimizer"].summary())
+    print(get_rate_controller().summary())
+    print(ctx["metrics"].summary())
+    ctx["metrics"].close()
+    counts = ctx["ledger"].counts()
+    ctx["ledger"].close()
+    return counts
+
+def discover_student_files(student_dirs):
+    """The notebooks in student_dirs; entries may also name single .ipynb files."""
     student_files = []
-    for d in STUDENT_DIRS:
+    for d in student_dirs:
         path = os.path.join(os.getcwd(), d)
-        if os.path.exists(path):
+        if os.path.isfile(path) and path.endswith(".ipynb"):
+            student_files.append(path)
+        elif os.path.exists(path):
             # Support ipynb (and theoretically pdf if we had a text extractor)
             files = glob.glob(os.path.join(path, "*.ipynb"))
             student_files.extend(files)
+        else:
+            print(f"Warning: {d} not found")
     
     print(f"Found {len(student_files)} submissions.")
     
-    for i, file_path in enumerate(student_files):
-        filename = os.path.basename(file_path)
-        
-        # Filter for test student if configured
-        if TEST_STUDENT_FILENAME and filename != TEST_STUDENT_FILENAME:
-            continue
+    if TEST_STUDENT_FILENAME:
+        student_files = [f for f in student_files if os.path.basename(f) == TEST_STUDENT_FILENAME]
+    return student_files
 
-        print(f"Processing ({i+1}/{len(student_files)}): {filename}")
-        
-        # 1. Convert to PDF
-        pdf_path = convert_ipynb_to_pdf(file_path)
-        gemini_file = None
-        if pdf_path:
-            # 2. Upload to Gemini
-            gemini_file = upload_to_gemini(pdf_path)
-        else:
-            print("   -> PDF Conversion failed. Proceeding with text-only evaluation.")
+class Grader:
+    """
+    A grading run's loaded state: the questions, rubric and system prompt, the
+    Gemini backend and caches, the run ledger, the report and the results store.
+    Each notebook can then be graded without loading any of it again:
 
+        with Grader("grading_report.csv") as grader:
+            row = grader.grade("4473/student.ipynb")
+
+    Students already in the report are not graded again unless the rubric changed,
+    the same as in a full run.
+    """
+
+    def __init__(self, output_file=OUTPUT_FILE, questions_file=QUESTIONS_FILE, rubric_file=RUBRIC_FILE,
+                 system_prompt_file=SYSTEM_PROMPT_FILE):
+        if not configure_gemini():
+            raise BackendConfigError("Gemini backend could not be configured")
+        self.output_file = output_file
+        self.ctx = build_context(output_file, questions_file, rubric_file, system_prompt_file)
+        self.counts = None
+
+    def grade(self, file_path):
+        """
+        Grades one notebook through every stage and writes its row to the report.
+        Returns the row (Student, Total Marks, Overall Feedback, Task <id> Marks...),
+        or None if grading failed; the ledger has the error.
+        """
+        ctx = self.ctx
+        jobs = plan_jobs(ctx["ledger"], [file_path], needs_regrade=partial(needs_regrade, ctx),
+                         written_students=read_written_students(ctx["output_file"]))
+        if not jobs:
+            return ctx["ledger"].get(os.path.basename(file_path))["result"]
+        job = jobs[0]
+        for stage in student_stages(ctx) + [write_stage]:
+            job = run_stage(stage, ctx, job)
+            if job is None:
+                return None
+        ctx["results_store"].flush()
+        return job["student_results"]
+
+    def grade_all(self, file_paths):
+        """Grades many notebooks concurrently through the stage pipeline. Returns the finished jobs."""
+        ctx = self.ctx
+        print(f"Pipeline workers: convert={CONVERT_WORKERS}, upload={UPLOAD_WORKERS}, evaluate={MAX_WORKERS}, write=1 "
+              f"(queue size {PIPELINE_QUEUE_SIZE})")
+        jobs = plan_jobs(ctx["ledger"], file_paths, needs_regrade=partial(needs_regrade, ctx),
+                         written_students=read_written_students(ctx["output_file"]))
+        pipeline = build_pipeline(ctx)
         try:
-            extracted_tasks, full_notebook_content = extract_code_from_notebook(file_path, task_signatures)
-        except Exception as e:
-            print(f"Skipping {filename}: Error extracting code - {e}")
-            if gemini_file:
-                genai.delete_file(gemini_file.name)
-            continue
-        
-        # Evaluate all tasks in one go
-        student_results = {"Student": filename, "Total Marks": 0}
-        deductions = []
-
-        # Initialize default marks for all tasks
-        all_task_ids = []
-        for task_group in rubric.get("tasks", []):
-            for sub_task in task_group.get("sub_tasks", []):
-                t_id = sub_task["sub_task_id"]
-                all_task_ids.append(t_id)
-                student_results[f"Task {t_id} Marks"] = 0
-
-        # Generate Bulk Prompt
-        prompt = generate_bulk_prompt(questions, rubric, extracted_tasks, full_notebook_content, is_pdf_available=(gemini_file is not None))
-        
-        print(f"   -> Calling Gemini for Batch Evaluation...")
-        evaluation_response = call_gemini(prompt, system_prompt_template, attachment=gemini_file)
-        
-        if isinstance(evaluation_response, list):
-            results_list = evaluation_response
-        else:
-            results_list = evaluation_response.get("results", [])
-        
-        # Map results back to student_results
-        for result in results_list:
-            t_id = result.get("task_id")
-            marks = result.get("marks_awarded", 0)
-            feedback = result.get("feedback", "")
-            max_marks = result.get("max_marks", 0)
-            
-            if t_id in all_task_ids:
-                student_results[f"Task {t_id} Marks"] = marks
-                student_results["Total Marks"] += marks
-                
-                if marks < max_marks:
-                     deductions.append(f"Task {t_id} (-{max_marks - marks:.1f}): {feedback}")
-            else:
-                print(f"   -> Warning: Gemini returned unknown task_id {t_id}")
+            finished = pipeline.run(jobs)
+        finally:
+            ctx["results_store"].flush()
+        print(f"\n[Pipeline] Finished {len(finished)}/{len(jobs)} submissions in {pipeline.elapsed():.0f}s")
+        print(pipeline.format_stats())
+        return finished
 
-        # Handle missing evaluations (if Gemini skipped some)
-        evaluated_ids = [r.get("task_id") for r in results_list]
-        for t_id in all_task_ids:
-            if t_id not in evaluated_ids:
-                deductions.append(f"Task {t_id}: Not evaluated by AI (Error).")
-        
-        # Cleanup Gemini File
-        if gemini_file:
-            try:
-                genai.delete_file(gemini_file.name)
-                print(f"   -> Deleted Gemini file {gemini_file.name}")
-            except Exception as e:
-                print(f"   -> Warning: Failed to delete Gemini file: {e}")
-        
-        # Cleanup Local PDF (Optional, but good for space)
-        if pdf_path and os.path.exists(pdf_path):
-            os.remove(pdf_path)
+    def close(self):
+        """Prints the run summaries and closes everything. Returns the ledger's stage counts."""
+        if self.counts is None:
+            close_shared_clients()
+            self.counts = close_context(self.ctx)
+        return self.counts
 
-        # Generate Overall Feedback
-        if not deductions:
-            student_results["Overall Feedback"] = "Excellent work! Full marks on auto-graded tasks."
-        else:
-            student_results["Overall Feedback"] = " | ".join(deductions)
-        
-        # Append to CSV immediately
-        append_to_csv(OUTPUT_FILE, student_results, headers)
-        print(f"   -> Saved result for {filename}")
-    
-    print(f"\nGrading complete. All results in {OUTPUT_FILE}")
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(student_dirs=None):
+    """Grades every notebook in student_dirs (default STUDENT_DIRS). Returns the ledger counts, or None."""
+    print("--- Phase 1: Preparation ---")
+
+    # Configure Gemini first
+    try:
+        grader = Grader(OUTPUT_FILE)
+    except BackendConfigError:
+        return None
+
+    print("\n--- Phase 2: Evaluation & Appending ---")
+
+    student_files = discover_student_files(student_dirs or STUDENT_DIRS)
+    try:
+        grader.grade_all(student_files)
+    finally:
+        counts = grader.close()
+    if counts["failed"]:
+        print(f"\n{counts['failed']} submission(s) failed; run again to retry them from their last completed stage.")
+    print(f"\nGrading complete. All results in {OUTPUT_FILE} (and {RESULTS_DB})")
+    return counts
 
 if __name__ == "__main__":
     main()
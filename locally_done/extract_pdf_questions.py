@@ -119,22 +119,30 @@ def structure_json(header_info, tasks):
                 
     return structured_data
 
-if __name__ == "__main__":
-    pdf_path = 'Assignment_2.pdf'
+def extract_questions(pdf_path='Assignment_2.pdf', json_path='Assignment_2_Questions.json',
+                      raw_text_path='extracted_text_raw.txt'):
+    """Extracts the tasks from the assignment PDF into the questions JSON. Returns it, or None on failure."""
     extracted_text = extract_text_from_pdf(pdf_path)
     
-    if extracted_text:
-        # Save raw text
-        with open('extracted_text_raw.txt', 'w', encoding='utf-8') as f:
+    if not extracted_text:
+        return None
+
+    # Save raw text
+    if raw_text_path:
+        with open(raw_text_path, 'w', encoding='utf-8') as f:
             f.write(extracted_text)
-            
-        # Parse
-        header, tasks = parse_tasks(extracted_text)
-        json_output = structure_json(header, tasks)
         
-        # Save JSON
-        with open('Assignment_2_Questions.json', 'w', encoding='utf-8') as f:
-            json.dump(json_output, f, indent=4)
-            
-        print(f"Successfully extracted {len(tasks)} tasks.")
-        print("Saved to Assignment_2_Questions.json")
+    # Parse
+    header, tasks = parse_tasks(extracted_text)
+    json_output = structure_json(header, tasks)
+    
+    # Save JSON
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(json_output, f, indent=4)
+        
+    print(f"Successfully extracted {len(tasks)} tasks.")
+    print(f"Saved to {json_path}")
+    return json_output
+
+if __name__ == "__main__":
+    extract_questions()
@@ -0,0 +1,251 @@
+"""
+Long-lived, thread-safe access to Gemini behind a pluggable backend.
+
+The grading stages talk to a GeminiBackend instead of the google.generativeai
+module directly. The Google backend configures the SDK once and caches one
+GenerativeModel per (model, system instruction, generation config), so every
+call reuses the same model object and the SDK's shared connection instead of
+reconfiguring and rebuilding both per request. FakeBackend answers locally,
+which makes offline runs and load tests possible.
+
+Select the backend with GEMINI_BACKEND=google (default) or GEMINI_BACKEND=fake.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+
+class BackendConfigError(Exception):
+    pass
+
+
+class FakeAPIError(Exception):
+    """Simulated API failure. `code` mirrors the HTTP status (429 for rate limiting)."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class GeminiBackend:
+    """Interface every backend implements. Files are objects with .name, .uri, .display_name and .state.name."""
+
+    # Part of the response cache key, so answers from different backends never mix
+    name = "base"
+
+    def generate(self, model_name, system_instruction, generation_config, contents, usage=None):
+        """
+        Returns the response text for contents (a list of prompt strings and file handles).
+        If a usage dict is passed, it is filled with prompt_tokens and response_tokens.
+        """
+        raise NotImplementedError
+
+    def generate_stream(self, model_name, system_instruction, generation_config, contents, usage=None):
+        """Yields the response text in chunks as it is generated. Backends without streaming yield it whole."""
+        yield self.generate(model_name, system_instruction, generation_config, contents, usage=usage)
+
+    def upload_file(self, path, mime_type=None):
+        raise NotImplementedError
+
+    def get_file(self, name):
+        raise NotImplementedError
+
+    def delete_file(self, name):
+        raise NotImplementedError
+
+
+class GoogleGenAIBackend(GeminiBackend):
+    name = "google"
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        if not self.api_key:
+            raise BackendConfigError("GEMINI_API_KEY not found in environment variables (.env).")
+
+        # Imported here so the fake backend works without the SDK installed
+        import google.generativeai as genai
+        self._genai = genai
+        genai.configure(api_key=self.api_key)
+
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, model_name, system_instruction, generation_config):
+        """Returns the cached GenerativeModel for this (model, system instruction, config)."""
+        key = (
+            model_name,
+            hashlib.sha256((system_instruction or "").encode("utf-8")).hexdigest(),
+            json.dumps(generation_config, sort_keys=True),
+        )
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._genai.GenerativeModel(
+                    model_name,
+                    system_instruction=system_instruction,
+                    generation_config=generation_config,
+                )
+                self._models[key] = model
+            return model
+
+    def generate(self, model_name, system_instruction, generation_config, contents, usage=None):
+        response = self.model(model_name, system_instruction, generation_config).generate_content(contents)
+        _record_usage(response, usage)
+        return response.text
+
+    def generate_stream(self, model_name, system_instruction, generation_config, contents, usage=None):
+        response = self.model(model_name, system_instruction, generation_config).generate_content(contents, stream=True)
+        for chunk in response:
+            # The final chunk carries the usage totals
+            _record_usage(chunk, usage)
+            yield chunk.text
+
+    def upload_file(self, path, mime_type=None):
+        return self._genai.upload_file(path, mime_type=mime_type)
+
+    def get_file(self, name):
+        return self._genai.get_file(name)
+
+    def delete_file(self, name):
+        return self._genai.delete_file(name)
+
+
+def _record_usage(response, usage):
+    meta = getattr(response, "usage_metadata", None)
+    if usage is not None and meta is not None:
+        usage["prompt_tokens"] = getattr(meta, "prompt_token_count", 0)
+        usage["response_tokens"] = getattr(meta, "candidates_token_count", 0)
+
+
+class FakeBackend(GeminiBackend):
+    """
+    Local stand-in for Gemini. Awards full marks for every sub-task found in the
+    rubric embedded in the prompt, after an optional simulated latency.
+
+    For load tests it can also misbehave: error_rate is the fraction of calls
+    that fail with a simulated 500, and rpm_limit makes calls beyond that many
+    per rolling minute fail with a 429, like the real quota does.
+    A max_output_tokens in the generation config cuts the response off at
+    that length, as Gemini does.
+    """
+
+    name = "fake"
+
+    STREAM_CHUNK = 64
+    SUB_TASK_PATTERN = re.compile(r'"sub_task_id":\s*"([^"]+)"[^{}]*?"marks":\s*([0-9.]+)', re.S)
+
+    def __init__(self, latency=0.0, processing_polls=0, jitter=0.0, error_rate=0.0, rpm_limit=0, seed=None):
+        self.latency = latency
+        self.processing_polls = processing_polls
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rpm_limit = rpm_limit
+        self.calls = 0
+        self.uploads = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._recent = deque()
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        """Counts the call and raises the simulated failure for it, if any."""
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            if self.rpm_limit:
+                while self._recent and now - self._recent[0] >= 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rpm_limit:
+                    self.rate_limited += 1
+                    raise FakeAPIError(429, "Resource has been exhausted (e.g. check quota).")
+                self._recent.append(now)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                raise FakeAPIError(500, "An internal error has occurred.")
+            return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def generate(self, model_name, system_instruction, generation_config, contents, usage=None):
+        delay = self._admit()
+        if delay:
+            time.sleep(delay)
+        prompt = "".join(part for part in contents if isinstance(part, str))
+        results = [
+            {"task_id": t_id, "marks_awarded": float(marks), "max_marks": float(marks),
+             "feedback": "Correct.", "issues": []}
+            for t_id, marks in self.SUB_TASK_PATTERN.findall(prompt)
+        ]
+        text = json.dumps({"results": results})
+        max_output_tokens = (generation_config or {}).get("max_output_tokens")
+        if max_output_tokens:
+            text = text[:max_output_tokens * 4]
+        if usage is not None:
+            usage["prompt_tokens"] = len(prompt) // 4
+            usage["response_tokens"] = len(text) // 4
+        return text
+
+    def generate_stream(self, model_name, system_instruction, generation_config, contents, usage=None):
+        text = self.generate(model_name, system_instruction, generation_config, contents, usage=usage)
+        for start in range(0, len(text), self.STREAM_CHUNK):
+            yield text[start:start + self.STREAM_CHUNK]
+
+    def _file(self, name):
+        state = "PROCESSING" if self._files[name] > 0 else "ACTIVE"
+        return SimpleNamespace(name=name, uri=f"fake://{name}", display_name=name, state=SimpleNamespace(name=state))
+
+    def upload_file(self, path, mime_type=None):
+        with self._lock:
+            self.uploads += 1
+            name = f"files/fake-{self.uploads}"
+            self._files[name] = self.processing_polls
+            return self._file(name)
+
+    def get_file(self, name):
+        with self._lock:
+            if name not in self._files:
+                raise KeyError(name)
+            self._files[name] -= 1
+            return self._file(name)
+
+    def delete_file(self, name):
+        with self._lock:
+            self._files.pop(name, None)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns the process-wide backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.environ.get("GEMINI_BACKEND", "google")
+            if name == "fake":
+                _backend = FakeBackend(
+                    latency=float(os.environ.get("FAKE_GEMINI_LATENCY", "0")),
+                    jitter=float(os.environ.get("FAKE_GEMINI_JITTER", "0")),
+                    error_rate=float(os.environ.get("FAKE_GEMINI_ERROR_RATE", "0")),
+                    rpm_limit=int(os.environ.get("FAKE_GEMINI_RPM", "0")),
+                )
+            elif name == "google":
+                _backend = GoogleGenAIBackend()
+            else:
+                raise BackendConfigError(f"Unknown GEMINI_BACKEND '{name}' (expected 'google' or 'fake')")
+        return _backend
+
+
+def set_backend(backend):
+    """Installs a backend explicitly (tests, benchmarks)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,113 @@
+"""
+Memo of grades for identical task implementations.
+
+Many students hand in the same code for the simple tasks, identical except
+for whitespace, comments or docstrings. Each extracted function is hashed by
+its normalised AST: the parse tree with docstrings removed and without
+line/column positions. The grade Gemini gave the first such implementation
+is stored under that hash and the sub-task's grading version, which is the
+rubric hash of the sub-task plus the system prompt and model. Later students
+with the same hash get the stored marks and feedback, and the sub-task is
+left out of their prompt.
+
+Code that does not parse is never memoised.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+GRADE_MEMO_FILE = os.path.join(".grading_cache", "grade_memo.sqlite3")
+
+
+def _strip_docstrings(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return tree
+
+
+def normalized_ast_hash(code):
+    """SHA-256 of the code's AST without docstrings or positions, or None if it does not parse."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    dump = ast.dump(_strip_docstrings(tree), annotate_fields=True, include_attributes=False)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+def grading_version(subtask_sha256, system_prompt, model):
+    """What a memoised grade depends on besides the code itself."""
+    payload = json.dumps({"subtask": subtask_sha256, "system": system_prompt, "model": model}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GradeMemo:
+    def __init__(self, path=GRADE_MEMO_FILE):
+        self.path = path
+        self.hits = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS grades ("
+            " task_id TEXT NOT NULL,"
+            " code_sha256 TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " first_student TEXT,"
+            " hits INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (task_id, code_sha256, version))"
+        )
+        self._conn.commit()
+
+    def get(self, task_id, code_sha256, version):
+        """The stored result for this implementation, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM grades WHERE task_id = ? AND code_sha256 = ? AND version = ?",
+                (task_id, code_sha256, version),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE grades SET hits = hits + 1 WHERE task_id = ? AND code_sha256 = ? AND version = ?",
+                (task_id, code_sha256, version),
+            )
+            self._conn.commit()
+            self.hits += 1
+        metrics.incr("grade_memo_hits")
+        return json.loads(row[0])
+
+    def put(self, task_id, code_sha256, version, result, student=None):
+        """Stores a fresh result; the first grade for an implementation is kept."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO grades (task_id, code_sha256, version, result, first_student, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (task_id, code_sha256, version, json.dumps(result), student, time.time()),
+            )
+            self._conn.commit()
+            self.stored += cursor.rowcount
+
+    def summary(self):
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+        return f"Grade memo: {self.hits} hit(s), {self.stored} new implementation(s), {total} stored"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
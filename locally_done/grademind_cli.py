@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+grademind-local: grade notebook submissions and prepare the assignment files.
+
+    grademind-local grade 4473 4470/student.ipynb --output grading_report.csv
+    grademind-local grade --student "123 - Name.ipynb" --backend fake
+    grademind-local convert-rubric Assignment_2_Rubric.docx -o Assignment_2_Rubric.json
+    grademind-local extract-questions Assignment_2.pdf -o Assignment_2_Questions.json
+    grademind-local report --cohort 4473 --csv 4473_grading_report.csv
+
+Only argparse is loaded at start-up. Each subcommand imports its own modules
+(the grading pipeline, python-docx, PyPDF2, the Gemini SDK) when it runs, so
+`--help` and scripts that shell out once per student start quickly. grade
+options are passed on as the environment settings read by
+evaluate_submissions.py; any other setting can be given in the environment
+or .env as before.
+
+To grade from Python without starting a process per student, use
+evaluate_submissions.Grader.
+"""
+
+import argparse
+import os
+import sys
+
+# grade option -> environment setting read by evaluate_submissions.py
+GRADE_SETTINGS = {
+    "output": "GRADING_OUTPUT",
+    "questions": "GRADING_QUESTIONS",
+    "rubric": "GRADING_RUBRIC",
+    "system_prompt": "GRADING_SYSTEM_PROMPT",
+    "student": "GRADING_STUDENT",
+    "workers": "GRADING_WORKERS",
+    "backend": "GEMINI_BACKEND",
+    "model": "GEMINI_MODEL",
+}
+
+
+def grade(args):
+    for option, name in GRADE_SETTINGS.items():
+        value = getattr(args, option)
+        if value is not None:
+            os.environ[name] = str(value)
+    import evaluate_submissions
+
+    counts = evaluate_submissions.main(args.paths or None)
+    return 1 if counts is None or counts["failed"] else 0
+
+
+def convert_rubric(args):
+    from convert_rubric_to_json import convert_docx_to_json
+
+    return 0 if convert_docx_to_json(args.docx, args.output) is not None else 1
+
+
+def extract_questions(args):
+    from extract_pdf_questions import extract_questions as extract
+
+    return 0 if extract(args.pdf, args.output, raw_text_path=args.raw_text) is not None else 1
+
+
+def report(args):
+    import csv
+
+    from results_store import ResultsStore
+
+    store = ResultsStore(args.db)
+    try:
+        if args.csv:
+            print(f"Wrote {store.export_csv(args.csv, args.cohort)} row(s) to {args.csv}")
+        if args.xlsx:
+            print(f"Wrote {store.export_xlsx(args.xlsx, args.cohort)} row(s) to {args.xlsx}")
+        if not (args.csv or args.xlsx):
+            headers, rows = store.table(args.cohort)
+            writer = csv.writer(sys.stdout)
+            writer.writerow(headers)
+            writer.writerows(rows)
+    finally:
+        store.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="grademind-local", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("grade", help="grade submissions and append them to the report")
+    p.add_argument("paths", nargs="*", help="student directories or notebooks (default: STUDENT_DIRS)")
+    p.add_argument("-o", "--output", help="report CSV (default: grading_report.csv)")
+    p.add_argument("--questions", help="questions JSON (default: Assignment_2_Questions.json)")
+    p.add_argument("--rubric", help="rubric JSON (default: Assignment_2_Rubric.json)")
+    p.add_argument("--system-prompt", help="system prompt file (default: system_prompt.md)")
+    p.add_argument("--student", help="grade only the notebook with this file name")
+    p.add_argument("--workers", type=int, help="Gemini evaluations in flight at once")
+    p.add_argument("--backend", choices=["google", "fake"], help="Gemini backend (fake answers locally)")
+    p.add_argument("--model", help="Gemini model name")
+    p.set_defaults(run=grade)
+
+    p = sub.add_parser("convert-rubric", help="convert the rubric .docx to the rubric JSON")
+    p.add_argument("docx", nargs="?", default="Assignment_2_Rubric.docx")
+    p.add_argument("-o", "--output", default="Assignment_2_Rubric.json")
+    p.set_defaults(run=convert_rubric)
+
+    p = sub.add_parser("extract-questions", help="extract the tasks from the assignment PDF into the questions JSON")
+    p.add_argument("pdf", nargs="?", default="Assignment_2.pdf")
+    p.add_argument("-o", "--output", default="Assignment_2_Questions.json")
+    p.add_argument("--raw-text", default="extracted_text_raw.txt", help="where to keep the raw PDF text ('' to skip)")
+    p.set_defaults(run=extract_questions)
+
+    p = sub.add_parser("report", help="export stored results as CSV/XLSX (CSV to stdout by default)")
+    p.add_argument("--db", default=os.environ.get("RESULTS_DB", "grading_results.sqlite3"))
+    p.add_argument("--cohort", help="one cohort (default: all, with a Cohort column)")
+    p.add_argument("--csv")
+    p.add_argument("--xlsx")
+    p.set_defaults(run=report)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
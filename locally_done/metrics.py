@@ -0,0 +1,170 @@
+"""
+Per-student timing, token, retry and cache metrics for a grading run.
+
+Each student gets a StudentMetrics record. A pipeline worker binds the record
+of the job it is working on to its thread, so code deep inside a stage (the
+PDF cache, the upload registry, call_gemini) can add to it with timed(),
+incr() and record() without passing it around. When a student finishes, its
+record is appended to a JSONL file, and summary() reports p50/p95/p99 wall
+time per stage and throughput for the run.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_FILE = "grading_metrics.jsonl"
+
+_local = threading.local()
+
+
+class StudentMetrics:
+    def __init__(self, student):
+        self.student = student
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.fields = {}
+        self.status = None
+
+    def absorb(self, other):
+        """
+        Folds in a record kept on another thread for the same student (one task
+        group's Gemini call). Counters and numeric fields add up; first_result_seconds
+        keeps the earliest.
+        """
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        for name, n in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        for name, value in other.fields.items():
+            if name == "first_result_seconds":
+                self.fields[name] = min(self.fields.get(name, value), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.fields[name] = self.fields.get(name, 0) + value
+            else:
+                self.fields[name] = value
+
+    def to_dict(self):
+        return {
+            "student": self.student,
+            "status": self.status,
+            "started_at": self.started,
+            "wall_seconds": round(time.time() - self.started, 3),
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            **self.counters,
+            **self.fields,
+        }
+
+
+def current():
+    return getattr(_local, "record", None)
+
+
+@contextmanager
+def bound(record):
+    """Makes record the target of timed()/incr()/record() on this thread."""
+    previous = current()
+    _local.record = record
+    try:
+        yield record
+    finally:
+        _local.record = previous
+
+
+@contextmanager
+def timed(stage):
+    """Adds the wall time of the block to `stage` on the bound record."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        rec = current()
+        if rec is not None:
+            rec.stages[stage] = rec.stages.get(stage, 0.0) + time.perf_counter() - start
+
+
+def incr(name, n=1):
+    rec = current()
+    if rec is not None:
+        rec.counters[name] = rec.counters.get(name, 0) + n
+
+
+def record(**fields):
+    rec = current()
+    if rec is not None:
+        rec.fields.update(fields)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of values (0 < p <= 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class MetricsRecorder:
+    """Collects finished StudentMetrics and appends each one to a JSONL file."""
+
+    def __init__(self, path=METRICS_FILE):
+        self.path = path
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._finished = []
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def new(self, student):
+        return StudentMetrics(student)
+
+    def finish(self, rec, status="ok"):
+        rec.status = status
+        line = json.dumps(rec.to_dict())
+        with self._lock:
+            self._finished.append(rec)
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def summary(self):
+        with self._lock:
+            finished = list(self._finished)
+        if not finished:
+            return "Metrics: no submissions processed."
+
+        elapsed = max(time.time() - self.started, 1e-9)
+        ok = [r for r in finished if r.status == "ok"]
+        lines = [
+            f"Metrics ({self.path}): {len(ok)} graded, {len(finished) - len(ok)} failed, "
+            f"{len(ok) / (elapsed / 60):.2f} students/min"
+        ]
+
+        stage_names = []
+        for rec in finished:
+            for name in rec.stages:
+                if name not in stage_names:
+                    stage_names.append(name)
+        for name in stage_names:
+            values = [r.stages[name] for r in finished if name in r.stages]
+            lines.append(
+                f"   {name:<9} n={len(values):<4} p50 {percentile(values, 50):7.2f}s  "
+                f"p95 {percentile(values, 95):7.2f}s  p99 {percentile(values, 99):7.2f}s"
+            )
+
+        totals = {}
+        for rec in finished:
+            for name, value in list(rec.counters.items()) + list(rec.fields.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[name] = totals.get(name, 0) + value
+        if totals:
+            lines.append("   totals: " + ", ".join(f"{k}={v:g}" for k, v in sorted(totals.items())))
+        return "\n".join(lines)
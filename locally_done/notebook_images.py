@@ -0,0 +1,199 @@
+"""
+Plot images taken straight from a notebook's outputs, as a PDF-free attachment.
+
+Rendering a notebook to PDF (nbconvert + Chromium) only serves to show
+Gemini the plots. Those plots are already in the notebook JSON as base64
+`image/png` / `image/jpeg` outputs. ImageCollector takes them from the
+cells while the notebook is read for its code. It uses the streaming
+reader's offload files, so the base64 never sits in a cell dict. Each image
+is decoded and de-duplicated by content. It is downscaled to max_side
+pixels when Pillow is installed, and kept as it is otherwise. Images are
+stored in out_dir under their content hash and max_side, so the same plot
+is written only once across students and runs.
+
+Each distinct image becomes a numbered figure. The notebook text gets an
+"[Output: Figure N attached]" line under the cell that produced it, which
+pairs every image with its code and markdown. A notebook without image
+outputs yields no figures, and no attachment is sent.
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+from notebook_reader import OmittedPayload, iter_notebook_cells
+
+IMAGE_CACHE_DIR = os.path.join(".grading_cache", "images")
+IMAGE_MAX_SIDE = 1024
+MAX_IMAGES = 24
+JPEG_QUALITY = 85
+
+# In order of preference when an output carries more than one
+IMAGE_MIMES = ("image/png", "image/jpeg")
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg"}
+
+_pil_image = None  # PIL.Image once loaded, False without Pillow
+
+
+def pil_image():
+    """PIL.Image, or None when Pillow is not installed (images are then sent at their original size)."""
+    global _pil_image
+    if _pil_image is None:
+        # Imported on first use, not with the module, to keep start-up fast
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = False
+        _pil_image = Image
+    return _pil_image or None
+
+
+@dataclass
+class NotebookImage:
+    figure: int
+    cell_index: int
+    mime: str
+    sha256: str
+    path: str
+    size: int
+    original_size: int
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def _payload_text(payload):
+    """The base64 text of an image output: a string, an offloaded payload or a list of either."""
+    if isinstance(payload, list):
+        return "".join(_payload_text(part) for part in payload)
+    if isinstance(payload, OmittedPayload):
+        if payload.path is None:
+            raise ValueError("image payload was not offloaded")
+        with open(payload.path, "r", encoding="utf-8") as f:
+            raw = f.read()
+        # Offloaded strings keep their JSON escapes (e.g. "\n" every 76 characters)
+        return json.loads(f'"{raw}"') if "\\" in raw else raw
+    return payload if isinstance(payload, str) else ""
+
+
+def downscale(data, mime, max_side=IMAGE_MAX_SIDE):
+    """Returns data resized to fit max_side x max_side, or unchanged without Pillow or when already small."""
+    Image = pil_image()
+    if Image is None or not max_side:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= max_side:
+                return data
+            image.thumbnail((max_side, max_side))
+            out = io.BytesIO()
+            if mime == "image/jpeg":
+                image.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            else:
+                image.save(out, "PNG", optimize=True)
+    except (OSError, ValueError):
+        # Not an image Pillow can read; let Gemini decide
+        return data
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+class ImageCollector:
+    """Collects the distinct image outputs of one notebook, cell by cell."""
+
+    def __init__(self, out_dir=IMAGE_CACHE_DIR, max_side=IMAGE_MAX_SIDE, max_images=MAX_IMAGES):
+        self.out_dir = out_dir
+        self.max_side = max_side
+        self.max_images = max_images
+        self.images = []
+        self.skipped = 0
+        self._by_hash = {}
+        os.makedirs(out_dir, exist_ok=True)
+        # iter_notebook_cells streams image payloads here instead of keeping them in memory
+        self.offload_dir = tempfile.mkdtemp(prefix="offload-", dir=out_dir)
+
+    def add_cell(self, cell_index, cell):
+        """Takes the images out of a cell's outputs. Returns the figure numbers they are shown as."""
+        figures = []
+        for output in cell.get("outputs") or []:
+            data = output.get("data") if isinstance(output, dict) else None
+            mime = next((m for m in IMAGE_MIMES if data and m in data), None)
+            if mime is None:
+                continue
+            try:
+                figure = self._add(cell_index, mime, data[mime])
+            except (ValueError, binascii.Error, OSError) as e:
+                print(f"   -> Skipping unreadable {mime} output in cell {cell_index}: {e}")
+                figure = None
+            if figure is not None and figure not in figures:
+                figures.append(figure)
+        self._discard_offloaded()
+        return figures
+
+    def _add(self, cell_index, mime, payload):
+        raw = base64.b64decode(_payload_text(payload), validate=False)
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest in self._by_hash:
+            # The same plot shown twice is attached once
+            return self._by_hash[digest].figure
+        if len(self.images) >= self.max_images:
+            self.skipped += 1
+            return None
+        # Stored per size, so a different max_side is not served images downscaled for another one
+        path = os.path.join(self.out_dir, f"{digest}-{self.max_side or 'full'}{EXTENSIONS[mime]}")
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+        else:
+            data = downscale(raw, mime, self.max_side)
+            # A scratch file of its own: convert workers may be writing the same plot at once
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.out_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            size = len(data)
+        image = NotebookImage(len(self.images) + 1, cell_index, mime, digest, path, size, len(raw))
+        self.images.append(image)
+        self._by_hash[digest] = image
+        return image.figure
+
+    def _discard_offloaded(self):
+        for name in os.listdir(self.offload_dir):
+            os.remove(os.path.join(self.offload_dir, name))
+
+    def close(self):
+        shutil.rmtree(self.offload_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def figure_note(figures):
+    return "".join(f"[Output: Figure {n} attached]\n" for n in figures)
+
+
+def images_sha256(images):
+    """One hash for a list of images, as attached (content and size), for the response cache key."""
+    return hashlib.sha256("".join(os.path.basename(image.path) for image in images).encode("utf-8")).hexdigest()
+
+
+def image_summary(images):
+    size = sum(image.size for image in images)
+    original = sum(image.original_size for image in images)
+    return f"{len(images)} image(s), {size / 1024:.0f} KB (from {original / 1024:.0f} KB)"
+
+
+def extract_images(ipynb_path, out_dir=IMAGE_CACHE_DIR, max_side=IMAGE_MAX_SIDE, max_images=MAX_IMAGES):
+    """The distinct image outputs of a notebook, without its text."""
+    with ImageCollector(out_dir, max_side, max_images) as collector:
+        for index, cell in enumerate(iter_notebook_cells(ipynb_path, offload_dir=collector.offload_dir)):
+            collector.add_cell(index, cell)
+        return collector.images
@@ -0,0 +1,268 @@
+"""
+Streaming .ipynb reader that yields cells one at a time.
+
+json.load materialises the whole notebook, including multi-megabyte base64
+plot images in cell outputs that grading never looks at. This reader parses
+the file incrementally in fixed-size chunks and yields each cell as soon as
+it is complete. Inside "outputs", image payloads and any string longer than
+max_output_chars are not kept in memory: they are replaced by an
+OmittedPayload, optionally after being streamed to a file in offload_dir.
+Memory use is therefore bounded by the size of the cell sources, not by the
+size of the notebook.
+"""
+
+import json
+import os
+import re
+
+CHUNK_SIZE = 1 << 20
+MAX_OUTPUT_CHARS = 10000
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SCALAR = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_SCALARS = {"true": True, "false": False, "null": None}
+
+
+class NotebookFormatError(ValueError):
+    pass
+
+
+class OmittedPayload:
+    """Stands in for an output string that was skipped (or offloaded to `path`)."""
+
+    __slots__ = ("size", "mime", "path")
+
+    def __init__(self, size, mime=None, path=None):
+        self.size = size
+        self.mime = mime
+        self.path = path
+
+    def __repr__(self):
+        where = f" -> {self.path}" if self.path else ""
+        return f"<omitted {self.mime or 'output'} ({self.size} chars){where}>"
+
+
+def _find_special(buf, start):
+    """Index of the next '"' or backslash at or after start, or -1. str.find is much faster than a regex here."""
+    quote = buf.find('"', start)
+    end = quote if quote >= 0 else len(buf)
+    backslash = buf.find("\\", start, end)
+    return backslash if backslash >= 0 else quote
+
+
+def is_binary_mime(mime):
+    return bool(mime) and (mime.startswith("image/") or mime in ("application/pdf", "application/octet-stream"))
+
+
+class _Parser:
+    def __init__(self, f, chunk_size, max_output_chars, offload_dir):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_output_chars = max_output_chars
+        self.offload_dir = offload_dir
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.cell_index = 0
+        self.offloaded = 0
+
+    def _fill(self):
+        """Drops consumed input and reads the next chunk. Returns False at end of file."""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch):
+        found = self.peek()
+        if found != ch:
+            raise NotebookFormatError(f"Expected '{ch}' but found '{found or 'end of file'}'")
+        self.pos += 1
+
+    def read_scalar(self):
+        while len(self.buf) - self.pos < 64 and self._fill():
+            pass
+        match = _SCALAR.match(self.buf, self.pos)
+        if not match:
+            raise NotebookFormatError(f"Unexpected input near '{self.buf[self.pos:self.pos + 20]}'")
+        self.pos = match.end()
+        token = match.group(0)
+        if token in _SCALARS:
+            return _SCALARS[token]
+        return float(token) if any(c in token for c in ".eE") else int(token)
+
+    def read_string(self, keep_limit=None, mime=None):
+        """
+        Reads a JSON string. Strings longer than keep_limit are not kept: they are
+        streamed to an offload file (if configured) and returned as an OmittedPayload.
+        """
+        self.expect('"')
+        parts = []
+        size = 0
+        sink = None
+        sink_path = None
+        keeping = True
+
+        def consume(raw):
+            nonlocal size, keeping, sink, sink_path, parts
+            if not raw:
+                return
+            size += len(raw)
+            if keeping and keep_limit is not None and size > keep_limit:
+                keeping = False
+                if self.offload_dir:
+                    sink_path = self._offload_path(mime)
+                    sink = open(sink_path, "w", encoding="utf-8")
+                    sink.writelines(parts)
+                parts = []
+            if keeping:
+                parts.append(raw)
+            elif sink is not None:
+                sink.write(raw)
+
+        try:
+            while True:
+                special = _find_special(self.buf, self.pos)
+                if special < 0:
+                    consume(self.buf[self.pos:])
+                    self.pos = len(self.buf)
+                    if not self._fill():
+                        raise NotebookFormatError("Unterminated string")
+                    continue
+
+                consume(self.buf[self.pos:special])
+                if self.buf[special] == '"':
+                    self.pos = special + 1
+                    break
+
+                # Escape sequence: make sure all of it is in the buffer before consuming it
+                self.pos = special
+                while len(self.buf) - self.pos < 6 and self._fill():
+                    pass
+                length = 6 if self.buf[self.pos + 1:self.pos + 2] == "u" else 2
+                consume(self.buf[self.pos:self.pos + length])
+                self.pos += length
+        finally:
+            if sink is not None:
+                sink.close()
+
+        if keeping:
+            raw = "".join(parts)
+            return json.loads(f'"{raw}"') if "\\" in raw else raw
+        return OmittedPayload(size, mime, sink_path)
+
+    def _offload_path(self, mime):
+        os.makedirs(self.offload_dir, exist_ok=True)
+        self.offloaded += 1
+        ext = ".b64" if is_binary_mime(mime) else ".txt"
+        return os.path.join(self.offload_dir, f"cell{self.cell_index}-{self.offloaded}{ext}")
+
+    def read_value(self, path):
+        ch = self.peek()
+        if ch == "{":
+            return self.read_object(path)
+        if ch == "[":
+            return self.read_array(path)
+        if ch == '"':
+            return self.read_string(*self._string_policy(path))
+        return self.read_scalar()
+
+    def _string_policy(self, path):
+        """Returns (keep_limit, mime) for a string at `path` inside the notebook."""
+        if "outputs" not in path:
+            return None, None
+        # data.<mime> holds the payload; base64 images are never kept
+        mime = None
+        if "data" in path:
+            i = path.index("data")
+            mime = path[i + 1] if i + 1 < len(path) else None
+        if is_binary_mime(mime):
+            return 0, mime
+        return self.max_output_chars, mime
+
+    def read_object(self, path):
+        self.expect("{")
+        obj = {}
+        if self.peek() == "}":
+            self.pos += 1
+            return obj
+        while True:
+            key = self.read_string()
+            self.expect(":")
+            obj[key] = self.read_value(path + (key,))
+            ch = self.peek()
+            self.pos += 1
+            if ch == "}":
+                return obj
+            if ch != ",":
+                raise NotebookFormatError(f"Expected ',' or '}}' but found '{ch or 'end of file'}'")
+
+    def read_array(self, path):
+        self.expect("[")
+        items = []
+        if self.peek() == "]":
+            self.pos += 1
+            return items
+        while True:
+            items.append(self.read_value(path))
+            ch = self.peek()
+            self.pos += 1
+            if ch == "]":
+                return items
+            if ch != ",":
+                raise NotebookFormatError(f"Expected ',' or ']' but found '{ch or 'end of file'}'")
+
+    def iter_cells(self):
+        """Yields each element of the top-level "cells" array without keeping the previous ones."""
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.read_string()
+            self.expect(":")
+            if key == "cells":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.read_value(("cells",))
+                        self.cell_index += 1
+                        ch = self.peek()
+                        self.pos += 1
+                        if ch == "]":
+                            break
+                        if ch != ",":
+                            raise NotebookFormatError(f"Expected ',' or ']' but found '{ch or 'end of file'}'")
+            else:
+                # metadata, nbformat, ... are small; parse and drop them
+                self.read_value((key,))
+            ch = self.peek()
+            self.pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise NotebookFormatError(f"Expected ',' or '}}' but found '{ch or 'end of file'}'")
+
+
+def iter_notebook_cells(path, max_output_chars=MAX_OUTPUT_CHARS, offload_dir=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields the cells of the notebook at `path` one by one.
+    Large output payloads come back as OmittedPayload instances.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        parser = _Parser(f, chunk_size, max_output_chars, offload_dir)
+        yield from parser.iter_cells()
@@ -0,0 +1,114 @@
+"""
+Content-addressed on-disk cache for rendered notebook PDFs.
+
+A PDF is stored under the SHA-256 of the notebook bytes plus a fingerprint of
+the renderer settings, so re-grading an unchanged cohort skips the render
+entirely while any change to a notebook (or to the renderer) misses.
+Entries are evicted least-recently-used first once the cache exceeds its
+size cap; a file's mtime doubles as its last-used time.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+PDF_CACHE_DIR = os.path.join(".grading_cache", "pdf")
+PDF_CACHE_MAX_MB = 2048
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hashes a file in chunks so large notebooks are never fully loaded."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def renderer_fingerprint(settings, script_paths=()):
+    """Hashes the renderer settings plus the renderer scripts themselves."""
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for path in script_paths:
+        if os.path.exists(path):
+            digest.update(file_sha256(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """LRU-evicting PDF store keyed by notebook content and renderer settings."""
+
+    def __init__(self, cache_dir=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_MB * 1024 * 1024, fingerprint=""):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key_for(self, ipynb_path):
+        digest = hashlib.sha256(file_sha256(ipynb_path).encode("ascii"))
+        digest.update(self.fingerprint.encode("ascii"))
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def temp_path_for(self, key):
+        """A unique scratch path in the cache dir for a render in progress."""
+        return os.path.join(self.cache_dir, f"{key}.{os.getpid()}-{threading.get_ident()}.tmp.pdf")
+
+    def get(self, key):
+        """Returns the cached PDF path for key, or None on a miss."""
+        path = self.path_for(key)
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+            self.misses += 1
+            return None
+
+    def put(self, key, rendered_path):
+        """Moves a freshly rendered PDF into the cache and enforces the size cap."""
+        path = self.path_for(key)
+        os.replace(rendered_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Deletes least-recently-used PDFs until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".pdf") or name.endswith(".tmp.pdf"):
+                    continue
+                full = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, full))
+                total += st.st_size
+
+            entries.sort()
+            # Always keep the newest entry, even if it alone exceeds the cap
+            while total > self.max_bytes and len(entries) > 1:
+                _, size, full = entries.pop(0)
+                try:
+                    os.remove(full)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"PDF cache: {self.hits} hit(s), {self.misses} miss(es) ({rate:.0f}% hit rate), {self.evictions} eviction(s)"
@@ -0,0 +1,211 @@
+"""
+Shrinks rendered notebook PDFs before they are uploaded to Gemini.
+
+Chromium's page.pdf() embeds every plot at full resolution, so a notebook
+with many figures can produce a PDF of tens of MB. That size is paid twice:
+once for the upload, and again in the server-side PROCESSING wait. The
+optimizer rewrites the PDF with whichever tools are installed:
+
+- Ghostscript (`gs`) downsamples embedded images to `dpi` and recompresses
+  them (JPEG quality `jpeg_quality` where Ghostscript picks JPEG). It also
+  subsets and compresses fonts, merges duplicate images, and drops objects
+  nothing refers to.
+- pikepdf (optional) then removes unreferenced page resources, compresses
+  streams into object streams and, with drop_blank_pages, deletes pages
+  that show no text or image (e.g. the empty page after a page break). A
+  page with only vector drawing counts as blank.
+
+Without Ghostscript, images keep their resolution. Without either tool the
+PDF is uploaded as rendered. An optimized PDF that comes out no smaller than
+the original is replaced by the original bytes. The result is stored next
+to the cached PDF under a name derived from the settings, so an unchanged
+notebook is optimized only once, and the PDF cache's LRU eviction covers
+these files too.
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+PDF_IMAGE_DPI = 150
+PDF_JPEG_QUALITY = 80
+GHOSTSCRIPT_TIMEOUT = 300
+GHOSTSCRIPT_NAMES = ("gs", "gswin64c", "gswin32c")
+
+# Content stream operators that put text or images on a page
+_VISIBLE_OPERATORS = {"Tj", "TJ", "'", '"', "Do", "BI", "sh"}
+
+
+@dataclass
+class OptimizeResult:
+    path: str
+    before: int
+    after: int
+    tools: tuple = ()
+    pages_dropped: int = 0
+    seconds: float = 0.0
+    reused: bool = False
+
+    def describe(self):
+        saved = (1 - self.after / self.before) * 100 if self.before else 0.0
+        how = ", ".join(self.tools) if self.tools else "unchanged"
+        dropped = f", {self.pages_dropped} blank page(s) dropped" if self.pages_dropped else ""
+        reused = ", reused" if self.reused else f" in {self.seconds:.1f}s"
+        return f"PDF {_mb(self.before)} -> {_mb(self.after)} (-{saved:.0f}%, {how}{dropped}){reused}"
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def find_ghostscript():
+    for name in GHOSTSCRIPT_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def ghostscript_command(gs, src, dst, dpi, jpeg_quality):
+    """The pdfwrite invocation that resamples images to dpi and rewrites the rest of the file."""
+    images = []
+    for kind in ("Color", "Gray"):
+        images += [
+            f"-dDownsample{kind}Images=true",
+            f"-d{kind}ImageDownsampleType=/Bicubic",
+            f"-d{kind}ImageResolution={dpi}",
+            # Only images more than 10% above the target are resampled
+            f"-d{kind}ImageDownsampleThreshold=1.1",
+        ]
+    return [
+        gs, "-q", "-dSAFER", "-dBATCH", "-dNOPAUSE", "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
+        *images,
+        "-dDownsampleMonoImages=true", f"-dMonoImageResolution={dpi * 2}",
+        f"-dJPEGQ={jpeg_quality}",
+        "-dDetectDuplicateImages=true", "-dSubsetFonts=true", "-dCompressFonts=true",
+        f"-sOutputFile={dst}", src,
+    ]
+
+
+def has_pikepdf():
+    # pikepdf is optional and only imported when a PDF is rewritten
+    return importlib.util.find_spec("pikepdf") is not None
+
+
+def is_blank_page(page):
+    """True if the page's content stream draws no text or image."""
+    import pikepdf
+
+    for _, operator in pikepdf.parse_content_stream(page):
+        if str(operator) in _VISIBLE_OPERATORS:
+            return False
+    return True
+
+
+class PdfOptimizer:
+    def __init__(self, dpi=PDF_IMAGE_DPI, jpeg_quality=PDF_JPEG_QUALITY, drop_blank_pages=False,
+                 gs="auto", use_pikepdf=True, timeout=GHOSTSCRIPT_TIMEOUT):
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+        self.drop_blank_pages = drop_blank_pages
+        self.gs = find_ghostscript() if gs == "auto" else gs
+        self.use_pikepdf = use_pikepdf and has_pikepdf()
+        self.timeout = timeout
+        self.count = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tools(self):
+        return tuple(name for name, on in (("ghostscript", self.gs), ("pikepdf", self.use_pikepdf)) if on)
+
+    @property
+    def available(self):
+        return bool(self.tools)
+
+    def fingerprint(self):
+        settings = {"dpi": self.dpi, "jpeg_quality": self.jpeg_quality, "drop_blank_pages": self.drop_blank_pages,
+                    "tools": self.tools}
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def output_path_for(self, pdf_path):
+        root = pdf_path[:-4] if pdf_path.endswith(".pdf") else pdf_path
+        return f"{root}.opt-{self.fingerprint()}.pdf"
+
+    def optimize(self, pdf_path):
+        """Returns an OptimizeResult whose path is the PDF to upload (pdf_path itself if nothing helped)."""
+        before = os.path.getsize(pdf_path)
+        if not self.available:
+            return self._count(OptimizeResult(pdf_path, before, before))
+
+        out_path = self.output_path_for(pdf_path)
+        if os.path.exists(out_path):
+            try:
+                os.utime(out_path)
+            except OSError:
+                pass
+            return self._count(OptimizeResult(out_path, before, os.path.getsize(out_path), self.tools, reused=True))
+
+        started = time.perf_counter()
+        tmp_paths = []
+        current, pages_dropped = pdf_path, 0
+        try:
+            if self.gs:
+                tmp = f"{out_path}.{os.getpid()}-{threading.get_ident()}.gs.tmp.pdf"
+                tmp_paths.append(tmp)
+                subprocess.run(ghostscript_command(self.gs, current, tmp, self.dpi, self.jpeg_quality),
+                               check=True, capture_output=True, timeout=self.timeout)
+                current = tmp
+            if self.use_pikepdf:
+                tmp = f"{out_path}.{os.getpid()}-{threading.get_ident()}.pike.tmp.pdf"
+                tmp_paths.append(tmp)
+                pages_dropped = self._rewrite(current, tmp)
+                current = tmp
+
+            if os.path.getsize(current) >= before and not pages_dropped:
+                # Nothing gained; remember that by storing the original bytes under the optimized name
+                shutil.copyfile(pdf_path, current)
+            os.replace(current, out_path)
+        finally:
+            for tmp in tmp_paths:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return self._count(OptimizeResult(out_path, before, os.path.getsize(out_path), self.tools, pages_dropped,
+                                          time.perf_counter() - started))
+
+    def _rewrite(self, src, dst):
+        """pikepdf pass: blank pages, unused resources, object streams. Returns the number of pages dropped."""
+        import pikepdf
+
+        dropped = 0
+        with pikepdf.open(src) as pdf:
+            if self.drop_blank_pages:
+                for index in reversed(range(len(pdf.pages))):
+                    # Never drop the last remaining page
+                    if len(pdf.pages) > 1 and is_blank_page(pdf.pages[index]):
+                        del pdf.pages[index]
+                        dropped += 1
+            pdf.remove_unreferenced_resources()
+            pdf.save(dst, compress_streams=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        return dropped
+
+    def _count(self, result):
+        with self._lock:
+            self.count += 1
+            self.bytes_before += result.before
+            self.bytes_after += result.after
+        return result
+
+    def summary(self):
+        if not self.available:
+            return "PDF optimizer: no Ghostscript or pikepdf found; PDFs uploaded as rendered"
+        saved = (1 - self.bytes_after / self.bytes_before) * 100 if self.bytes_before else 0.0
+        return (f"PDF optimizer ({', '.join(self.tools)}, {self.dpi} dpi): {self.count} PDF(s), "
+                f"{_mb(self.bytes_before)} -> {_mb(self.bytes_after)} (-{saved:.0f}%)")
@@ -0,0 +1,166 @@
+"""
+Small staged producer/consumer pipeline used by evaluate_submissions.py.
+
+Each Stage owns a bounded input queue and a fixed number of worker threads.
+A stage function receives a job, returns the job for the next stage (or None
+to drop it). Because every queue is bounded, a slow stage blocks the stage
+in front of it instead of letting work pile up in memory (backpressure).
+"""
+
+import queue
+import threading
+import time
+
+# Marks the end of the input for a stage
+_STOP = object()
+
+
+class Stage:
+    """One step of the pipeline: a function, a worker count and a bounded input queue."""
+
+    def __init__(self, name, func, workers=1, queue_size=4):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+
+        self._lock = threading.Lock()
+        self._active_workers = 0
+        self._busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+
+    def stats(self, elapsed):
+        """Returns a snapshot of queue depth and utilisation for this stage."""
+        with self._lock:
+            depth = self.queue.qsize()
+            capacity = self.workers * elapsed
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "busy": self._busy,
+                "queue_depth": depth,
+                "queue_size": self.queue.maxsize,
+                "max_depth": max(self.max_depth, depth),
+                "processed": self.processed,
+                "failed": self.failed,
+                "utilisation": (self.busy_seconds / capacity) if capacity > 0 else 0.0,
+            }
+
+
+class Pipeline:
+    """Connects stages with bounded queues and runs jobs through them."""
+
+    def __init__(self, stages, report_interval=30.0):
+        self.stages = stages
+        self.report_interval = report_interval
+        self._started = None
+
+    def elapsed(self):
+        return (time.monotonic() - self._started) if self._started else 0.0
+
+    def stats(self):
+        elapsed = self.elapsed()
+        return [stage.stats(elapsed) for stage in self.stages]
+
+    def format_stats(self):
+        lines = []
+        for s in self.stats():
+            lines.append(
+                f"   [{s['stage']:<9}] queue {s['queue_depth']}/{s['queue_size']} (max {s['max_depth']}), "
+                f"busy {s['busy']}/{s['workers']}, util {s['utilisation'] * 100:5.1f}%, "
+                f"done {s['processed']}, failed {s['failed']}"
+            )
+        return "\n".join(lines)
+
+    def run(self, jobs):
+        """
+        Feeds jobs into the first stage and blocks until every stage has drained.
+        Returns the jobs that came out of the last stage.
+        """
+        self._started = time.monotonic()
+        results = []
+        results_lock = threading.Lock()
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            stage._active_workers = stage.workers
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(stage, next_stage, results, results_lock),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                t.start()
+                threads.append(t)
+
+        done = threading.Event()
+        monitor = None
+        if self.report_interval:
+            monitor = threading.Thread(target=self._monitor, args=(done,), daemon=True)
+            monitor.start()
+
+        first = self.stages[0]
+        for job in jobs:
+            self._put(first, job)
+        for _ in range(first.workers):
+            first.queue.put(_STOP)
+
+        for t in threads:
+            t.join()
+        done.set()
+        if monitor:
+            monitor.join()
+        return results
+
+    def _put(self, stage, job):
+        # Blocks while the stage's queue is full
+        stage.queue.put(job)
+        with stage._lock:
+            stage.max_depth = max(stage.max_depth, stage.queue.qsize())
+
+    def _worker(self, stage, next_stage, results, results_lock):
+        while True:
+            job = stage.queue.get()
+            if job is _STOP:
+                break
+
+            with stage._lock:
+                stage._busy += 1
+            start = time.monotonic()
+            try:
+                out = stage.func(job)
+            except Exception as e:
+                print(f"   -> [{stage.name}] Unexpected error: {e}")
+                out = None
+                with stage._lock:
+                    stage.failed += 1
+            finally:
+                with stage._lock:
+                    stage._busy -= 1
+                    stage.busy_seconds += time.monotonic() - start
+                    stage.processed += 1
+
+            if out is None:
+                continue
+            if next_stage is not None:
+                self._put(next_stage, out)
+            else:
+                with results_lock:
+                    results.append(out)
+
+        # The last worker of a stage to exit closes the next stage's input
+        with stage._lock:
+            stage._active_workers -= 1
+            last = stage._active_workers == 0
+        if last and next_stage is not None:
+            for _ in range(next_stage.workers):
+                next_stage.queue.put(_STOP)
+
+    def _monitor(self, done):
+        while not done.wait(self.report_interval):
+            print(f"\n[Pipeline] {self.elapsed():.0f}s elapsed\n{self.format_stats()}\n")
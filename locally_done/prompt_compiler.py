@@ -0,0 +1,190 @@
+"""
+Builds the bulk evaluation prompt for each student within a token budget.
+
+The rubric and instruction text are identical for every student, so they are
+rendered once per run. Per student, only the extracted code and (when no PDF
+is attached) the notebook text are streamed into a buffer. A notebook that
+fits the budget is sent whole. Otherwise oversized cells, such as long
+training logs pasted into a cell, are cut down to their head and tail, and
+the notebook section is shrunk further until the whole prompt fits the
+budget. Each compiled prompt reports an estimated token count per section.
+"""
+
+import io
+import json
+import re
+from dataclasses import dataclass, field
+
+# Rough Gemini tokenisation for English text and code; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+PROMPT_TOKEN_BUDGET = 24000
+MAX_CELL_TOKENS = 1500
+MAX_CODE_TOKENS = 3000
+MIN_CELL_TOKENS = 64
+# What Gemini counts for one attached image, whatever its size
+IMAGE_TOKENS = 258
+
+CELL_MARKER = re.compile(r"^--- \[(\w+) CELL\] ---$", re.M)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def trim_text(text, max_tokens):
+    """Keeps the head and tail of text so it fits in about max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    budget = max_tokens * CHARS_PER_TOKEN
+    head, tail = [], []
+    used = 0
+    i, j = 0, len(lines) - 1
+    # Alternate between the start and the end so both the setup and the final result survive
+    while i <= j:
+        take_head = len(head) <= len(tail)
+        line = lines[i] if take_head else lines[j]
+        if used + len(line) + 1 > budget:
+            break
+        used += len(line) + 1
+        if take_head:
+            head.append(line)
+            i += 1
+        else:
+            tail.append(line)
+            j -= 1
+    if not head and not tail:
+        # A single huge line (e.g. a base64 blob or a progress bar)
+        return text[:budget // 2] + f"\n... [{len(text) - budget} characters trimmed] ...\n" + text[-budget // 2:]
+    omitted = j - i + 1
+    return "\n".join(head + [f"... [{omitted} lines trimmed] ..."] + list(reversed(tail)))
+
+
+def split_cells(full_notebook_content):
+    """Splits the text built by extract_code_from_notebook back into (cell_type, source) pairs."""
+    cells = []
+    matches = list(CELL_MARKER.finditer(full_notebook_content))
+    for n, match in enumerate(matches):
+        end = matches[n + 1].start() if n + 1 < len(matches) else len(full_notebook_content)
+        cells.append((match.group(1), full_notebook_content[match.end():end].strip("\n")))
+    return cells
+
+
+@dataclass
+class CompiledPrompt:
+    text: str
+    sections: dict = field(default_factory=dict)
+    trimmed_cells: int = 0
+
+    @property
+    def tokens(self):
+        return self.sections.get("total", 0)
+
+    def describe(self):
+        parts = ", ".join(f"{name} {count}" for name, count in self.sections.items() if name != "total")
+        trimmed = f", {self.trimmed_cells} cell(s) trimmed" if self.trimmed_cells else ""
+        return f"~{self.tokens} tokens ({parts}{trimmed})"
+
+
+class PromptCompiler:
+    def __init__(self, rubric, token_budget=PROMPT_TOKEN_BUDGET, max_cell_tokens=MAX_CELL_TOKENS,
+                 max_code_tokens=MAX_CODE_TOKENS):
+        self.token_budget = token_budget
+        self.max_cell_tokens = max_cell_tokens
+        self.max_code_tokens = max_code_tokens
+
+        self.prefix = (
+            "--- BATCH EVALUATION ---\n"
+            "You are required to evaluate ALL tasks in the rubric below based on the provided student submission.\n"
+            "For tasks requiring code (Task 1 & 2), look at the EXTRACTED CODE SECTIONS.\n"
+            "For tasks requiring report/plots (Task 3), look at the FULL NOTEBOOK CONTENT (or attached PDF).\n\n"
+            "RUBRIC:\n" + json.dumps(rubric, indent=2) + "\n\n"
+        )
+        self.instructions = (
+            "INSTRUCTION: Return a JSON object with a key 'results' containing a list of evaluations for every task_id in the rubric.\n"
+            "Format:\n"
+            "{\n  \"results\": [\n    {\n      \"task_id\": \"1.1\",\n      \"marks_awarded\": 1.0,\n      \"max_marks\": 1.0,\n      \"feedback\": \"Correct.\",\n      \"issues\": []\n    },\n    ...\n  ]\n}"
+        )
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.instruction_tokens = estimate_tokens(self.instructions)
+
+    def compile(self, extracted_tasks, full_notebook_content, is_pdf_available, include_notebook=True,
+                evidence=None, image_count=0):
+        """
+        Builds one student's prompt. With include_notebook=False (a code-only task
+        group) the notebook section is left out entirely. evidence ({task_id: text},
+        e.g. sandboxed test results) is placed under the task's code. image_count
+        is the number of plot images attached instead of a PDF; the notebook text
+        then marks the cell each figure came from.
+        """
+        code = io.StringIO()
+        code.write("--- EXTRACTED CODE SECTIONS ---\n")
+        for task_id, source in extracted_tasks.items():
+            code.write(f"Task {task_id} Code:\n```python\n{trim_text(source, self.max_code_tokens)}\n```\n\n")
+            if evidence and task_id in evidence:
+                code.write(f"Task {task_id} {evidence[task_id]}\n\n")
+        code_text = code.getvalue()
+
+        notebook = io.StringIO()
+        trimmed = 0
+        if include_notebook:
+            notebook.write("--- FULL NOTEBOOK CONTENT ---\n")
+            if is_pdf_available:
+                notebook.write("[SYSTEM]: The student's full notebook is attached as a PDF. Please refer to it for all plots and analysis tasks.\n\n")
+            else:
+                if image_count:
+                    notebook.write(f"[SYSTEM]: The notebook's plots are attached as {image_count} image(s), in order "
+                                   f"Figure 1 to Figure {image_count}. An '[Output: Figure N attached]' line under a "
+                                   "cell marks the figure it produced.\n\n")
+                fixed = (self.prefix_tokens + estimate_tokens(code_text) + self.instruction_tokens
+                         + estimate_tokens(notebook.getvalue()))
+                body, trimmed = self._fit_notebook(full_notebook_content, self.token_budget - fixed)
+                notebook.write(body + "\n\n")
+        notebook_text = notebook.getvalue()
+
+        out = io.StringIO()
+        out.write(self.prefix)
+        out.write(code_text)
+        out.write(notebook_text)
+        out.write(self.instructions)
+
+        sections = {
+            "rubric": self.prefix_tokens,
+            "code": estimate_tokens(code_text),
+            "notebook": estimate_tokens(notebook_text),
+            "instructions": self.instruction_tokens,
+        }
+        if image_count and include_notebook and not is_pdf_available:
+            sections["images"] = image_count * IMAGE_TOKENS
+        sections["total"] = sum(sections.values())
+        return CompiledPrompt(out.getvalue(), sections, trimmed)
+
+    def _fit_notebook(self, full_notebook_content, budget):
+        """
+        Trims the notebook text to fit budget tokens. A notebook within budget is left
+        whole; otherwise every cell is capped, then the cap is halved until the whole
+        section fits. Returns (text, cells trimmed).
+        """
+        if estimate_tokens(full_notebook_content) <= budget:
+            return full_notebook_content, 0
+        cells = split_cells(full_notebook_content)
+        if not cells:
+            return trim_text(full_notebook_content, max(budget, MIN_CELL_TOKENS)), 0
+
+        cap = self.max_cell_tokens
+        while True:
+            parts = []
+            trimmed = 0
+            for cell_type, source in cells:
+                short = trim_text(source, cap)
+                trimmed += short is not source
+                parts.append(f"--- [{cell_type} CELL] ---\n{short}\n")
+            text = "\n".join(parts)
+            if estimate_tokens(text) <= budget or cap <= MIN_CELL_TOKENS:
+                break
+            cap = max(MIN_CELL_TOKENS, cap // 2)
+
+        if estimate_tokens(text) > budget:
+            text = trim_text(text, max(budget, MIN_CELL_TOKENS))
+        return text, trimmed
@@ -0,0 +1,248 @@
+"""
+Rate control for Gemini calls: quota pacing, retries, adaptive concurrency
+and a circuit breaker.
+
+Every generate call goes through a RateController, which
+  - waits for a request and its estimated tokens in two token buckets
+    (requests per minute and tokens per minute), so the run stays under quota
+    instead of running into it;
+  - holds a slot in an AIMD limiter: the number of calls in flight grows by
+    one per window of successful calls and is halved on a 429 or when latency
+    climbs above its target;
+  - retries retryable errors (429, 5xx, timeouts) with exponential backoff and
+    full jitter;
+  - waits on a circuit breaker that opens after a run of consecutive failures.
+    While it is open, calls pause instead of burning through retries. After
+    reset_timeout a single probe call is let through, and it closes the
+    breaker again if it succeeds.
+
+Errors that are not retryable, and calls that run out of retries, are raised
+to the caller.
+"""
+
+import random
+import threading
+import time
+
+import metrics
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+# google.api_core exception class names, for errors that carry no usable code
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                   "DeadlineExceeded", "GatewayTimeout", "BadGateway", "TimeoutError", "ConnectionError"}
+
+
+def _status(exc):
+    code = getattr(exc, "code", None)
+    code = getattr(code, "value", code)  # google.api_core uses HTTPStatus
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limit(exc):
+    return _status(exc) == 429 or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+def is_retryable(exc):
+    status = _status(exc)
+    if status is not None:
+        return status in RETRYABLE_CODES
+    return type(exc).__name__ in RETRYABLE_NAMES
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, rng=random):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Refills at rate_per_minute, holding at most `capacity` (default: one minute's worth).
+    A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, n=1):
+        """Blocks until n tokens are available and takes them. Returns the time spent waiting."""
+        if not self.rate:
+            return 0.0
+        # A single request larger than the bucket is let through once the bucket is full
+        n = min(n, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return waited
+                delay = (n - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+class AIMDLimiter:
+    """
+    Limits calls in flight. The limit grows by one after `limit` successful calls
+    in a row (additive increase) and is multiplied by `decrease` on congestion
+    (multiplicative decrease), at most once per cooldown.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, decrease=0.5, latency_target=None,
+                 cooldown=5.0, clock=time.monotonic):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, rate_limited=False, latency=None):
+        with self._cond:
+            self.in_flight -= 1
+            congested = rate_limited or (self.latency_target is not None and latency is not None
+                                         and latency > self.latency_target)
+            if congested:
+                now = self._clock()
+                if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; open -> half-open
+    after reset_timeout, letting one probe through; the probe's result closes or reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic, sleep=time.sleep):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._probing = False
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks while the breaker is open. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self.state == "closed":
+                    return waited
+                now = self._clock()
+                if self.state == "open" and now - self._opened_at >= self.reset_timeout:
+                    self.state = "half-open"
+                if self.state == "half-open" and not self._probing:
+                    self._probing = True
+                    return waited
+                delay = max(0.1, self.reset_timeout - (now - self._opened_at)) if self.state == "open" else 0.5
+            self._sleep(delay)
+            waited += delay
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != "closed":
+                print("   -> Gemini circuit breaker closed; resuming")
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            probe_failed = self.state == "half-open"
+            self._probing = False
+            if probe_failed or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = self._clock()
+                self.opened += 1
+                print(f"   -> Gemini circuit breaker open after {self.failures} failure(s); "
+                      f"pausing calls for {self.reset_timeout:.0f}s")
+
+
+class RateController:
+    """Runs calls under the buckets, the limiter, retries and the breaker described above."""
+
+    def __init__(self, rpm=0, tpm=0, max_in_flight=4, max_retries=5, backoff_base=1.0, backoff_cap=60.0,
+                 latency_target=None, failure_threshold=5, reset_timeout=60.0, sleep=time.sleep, rng=None):
+        self.requests = TokenBucket(rpm, sleep=sleep)
+        self.tokens = TokenBucket(tpm, sleep=sleep)
+        self.limiter = AIMDLimiter(initial=max_in_flight, maximum=max_in_flight, latency_target=latency_target)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retries = 0
+        self.rate_limited = 0
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def call(self, fn, tokens=0):
+        """Runs fn() (an API call using about `tokens` tokens) and returns its result."""
+        attempt = 0
+        while True:
+            self.breaker.wait()
+            self.requests.acquire()
+            self.tokens.acquire(tokens)
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                limited = is_rate_limit(e)
+                self.limiter.release(rate_limited=limited)
+                if not is_retryable(e):
+                    # The service answered; a bad request says nothing about an outage
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                with self._lock:
+                    self.rate_limited += limited
+                    if attempt >= self.max_retries:
+                        raise
+                    self.retries += 1
+                metrics.incr("retries")
+                if limited:
+                    metrics.incr("rate_limited")
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, self._rng)
+                print(f"   -> Gemini call failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                self._sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.release(latency=time.monotonic() - started)
+            self.breaker.record_success()
+            return result
+
+    def summary(self):
+        return (f"Rate control: {self.retries} retry(ies), {self.rate_limited} rate-limited call(s), "
+                f"concurrency limit {int(self.limiter.limit)}, breaker opened {self.breaker.opened} time(s)")
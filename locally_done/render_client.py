@@ -0,0 +1,141 @@
+"""
+Client for convert-server.js, the long-lived notebook -> PDF render service.
+
+One Node process (and one Chromium) is started per run and reused for every
+notebook, instead of paying process and browser start-up per submission.
+Requests and replies are JSON lines over the server's stdin/stdout, so
+several worker threads can have jobs in flight at once.
+"""
+
+import itertools
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+RENDER_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "convert-server.js")
+
+
+class RenderServerError(Exception):
+    pass
+
+
+class RenderClient:
+    """Thread-safe handle on a running convert-server.js process."""
+
+    def __init__(self, script=RENDER_SERVER_SCRIPT, pool_size=2, timeout=300, startup_timeout=60):
+        self.script = os.path.abspath(script)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+
+        self._proc = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = Future()
+        self._reader = None
+
+    @property
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """Launches the server and waits until its page pool is warm."""
+        if not os.path.exists(self.script):
+            raise RenderServerError(f"Render server script not found at {self.script}")
+
+        env = dict(os.environ, RENDER_POOL_SIZE=str(self.pool_size))
+        try:
+            self._proc = subprocess.Popen(
+                ["node", self.script],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                env=env,
+                cwd=os.path.dirname(self.script),
+            )
+        except OSError as e:
+            raise RenderServerError(f"Could not launch node: {e}")
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+        try:
+            self._ready.result(timeout=self.startup_timeout)
+        except Exception as e:
+            self.close()
+            raise RenderServerError(f"Render server failed to start: {e}")
+        return self
+
+    def render(self, ipynb_path, pdf_path):
+        """Renders one notebook to pdf_path. Raises RenderServerError on failure."""
+        if not self.alive:
+            raise RenderServerError("Render server is not running")
+
+        job_id = next(self._ids)
+        future = Future()
+        request = {"id": job_id, "ipynb": os.path.abspath(ipynb_path), "pdf": os.path.abspath(pdf_path)}
+
+        with self._lock:
+            self._pending[job_id] = future
+            try:
+                self._proc.stdin.write(json.dumps(request) + "\n")
+                self._proc.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                del self._pending[job_id]
+                raise RenderServerError(f"Render server pipe closed: {e}")
+
+        try:
+            reply = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            raise RenderServerError(f"Render timed out after {self.timeout}s")
+
+        if not reply.get("ok"):
+            raise RenderServerError(reply.get("error", "unknown render error"))
+        return pdf_path
+
+    def close(self):
+        """Closes stdin so the server drains in-flight jobs and exits."""
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+        self._proc = None
+
+    def _read_replies(self):
+        for line in self._proc.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                continue
+
+            if reply.get("ready"):
+                self._ready.set_result(reply)
+                continue
+
+            with self._lock:
+                future = self._pending.pop(reply.get("id"), None)
+            if future is not None:
+                future.set_result(reply)
+
+        # Server exited: fail everything still waiting on it
+        error = RenderServerError("Render server exited")
+        if not self._ready.done():
+            self._ready.set_exception(error)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
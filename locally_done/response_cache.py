@@ -0,0 +1,150 @@
+"""
+Persistent store of Gemini responses, so an identical request is only paid for once.
+
+Entries are keyed by a hash of everything that determines the answer: system
+prompt, prompt, attachment content hash, model name and generation config.
+A restarted run or a regenerated report therefore reads its answers back from
+SQLite instead of calling the API. Identical requests that are in flight at
+the same time are coalesced into a single call.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+RESPONSE_CACHE_FILE = os.path.join(".grading_cache", "responses.sqlite3")
+RESPONSE_CACHE_TTL_DAYS = 30
+RESPONSE_CACHE_MAX_ENTRIES = 50000
+
+
+def make_key(system_prompt, prompt, attachment_hash, model, generation_config):
+    payload = json.dumps({
+        "system": system_prompt,
+        "prompt": prompt,
+        "attachment": attachment_hash,
+        "model": model,
+        "config": generation_config,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response store with TTL and size based eviction."""
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, ttl_seconds=RESPONSE_CACHE_TTL_DAYS * 86400,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the stored response text for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, response, model=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            self._conn.commit()
+
+    def get_or_compute(self, key, compute, model=None):
+        """
+        Returns the stored response for key, or runs compute() to produce it.
+        Concurrent callers with the same key wait for the first caller's result.
+        Exceptions from compute() are passed to every waiter and nothing is stored.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            metrics.incr("response_cache_hits")
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            metrics.incr("response_cache_coalesced")
+            return future.result()
+
+        try:
+            response = compute()
+            self.put(key, response, model=model)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def evict(self):
+        """Drops expired entries, then the least recently used beyond max_entries."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+    def summary(self):
+        return (f"Response cache: {self.hits} hit(s), {self.misses} miss(es), "
+                f"{self.coalesced} coalesced request(s)")
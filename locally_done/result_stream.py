@@ -0,0 +1,75 @@
+"""
+Incremental parser for streamed evaluation responses.
+
+Gemini streams a JSON document of the form {"results": [{...}, {...}]} in
+arbitrary text chunks. ResultStreamParser is fed those chunks and returns
+each element of the "results" array as soon as its closing brace arrives,
+so per-task marks can be stored and shown while the rest of the response is
+still being generated. A bare top-level array of results is accepted too.
+
+The parser only tracks string/escape state and container nesting. Each
+complete item is decoded with json.loads, and the full text is kept so the
+caller can still decode (and cache) the whole response at the end.
+"""
+
+import json
+
+
+class ResultStreamParser:
+    def __init__(self, key="results"):
+        self.key = key
+        self.text = ""
+        self.items = 0
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._items_depth = None
+        self._item_start = None
+        self._closed = False
+
+    def feed(self, chunk):
+        """Adds a chunk of response text and returns the result items it completed."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._stack == ["{"]:
+                        # Strings directly inside the top-level object alternate key/value;
+                        # only the one before ':' matters and it is checked when '[' opens
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and self._items_depth is None and not self._closed:
+                    if not self._stack or (self._stack == ["{"] and self._last_key == self.key):
+                        self._items_depth = len(self._stack) + 1
+                self._stack.append(ch)
+                if self._items_depth is not None and len(self._stack) == self._items_depth + 1 and self._item_start is None:
+                    self._item_start = i
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._item_start is not None and len(self._stack) == self._items_depth:
+                    completed.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+                elif self._items_depth is not None and len(self._stack) < self._items_depth:
+                    # The results array itself closed
+                    self._items_depth = None
+                    self._closed = True
+        self._pos = len(text)
+        self.items += len(completed)
+        return completed
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+SQLite store of grading results across cohorts and runs.
+
+Every graded student becomes one row in `students` (total, overall feedback,
+run and input hashes) and one row per sub-task in `task_marks` (marks,
+maximum, feedback), all in typed, indexed columns. Rows are buffered and
+written in batches, one transaction per batch. Re-grading a student replaces
+their rows.
+
+The per-cohort CSV reports are exports of this store. export_csv writes the
+current report layout (Student, Total Marks, Overall Feedback,
+Task <id> Marks...), and export_xlsx writes the same table as a workbook
+(openpyxl required). Both are a single query.
+
+    python results_store.py import 4470_grading_report.csv --cohort 4470
+    python results_store.py export --cohort 4470 --csv 4470_grading_report.csv
+    python results_store.py export --xlsx all_cohorts.xlsx
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+RESULTS_DB = "grading_results.sqlite3"
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS runs ("
+    " run_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " started_at REAL NOT NULL,"
+    " model TEXT,"
+    " rubric_sha256 TEXT,"
+    " output_file TEXT)",
+    "CREATE TABLE IF NOT EXISTS students ("
+    " cohort TEXT NOT NULL,"
+    " student TEXT NOT NULL,"
+    " run_id INTEGER REFERENCES runs (run_id),"
+    " total_marks REAL NOT NULL,"
+    " overall_feedback TEXT,"
+    " notebook_sha256 TEXT,"
+    " prompt_sha256 TEXT,"
+    " graded_at REAL NOT NULL,"
+    " PRIMARY KEY (cohort, student))",
+    "CREATE TABLE IF NOT EXISTS task_marks ("
+    " cohort TEXT NOT NULL,"
+    " student TEXT NOT NULL,"
+    " task_id TEXT NOT NULL,"
+    " marks_awarded REAL NOT NULL,"
+    " max_marks REAL,"
+    " feedback TEXT,"
+    " subtask_sha256 TEXT,"
+    " PRIMARY KEY (cohort, student, task_id))",
+    "CREATE TABLE IF NOT EXISTS rubric_versions ("
+    " version TEXT PRIMARY KEY,"
+    " created_at REAL NOT NULL,"
+    " subtask_hashes TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS students_run ON students (run_id)",
+    "CREATE INDEX IF NOT EXISTS task_marks_task ON task_marks (task_id, cohort)",
+]
+
+_TASK_COLUMN = re.compile(r"^Task (.+) Marks$")
+
+
+def task_sort_key(task_id):
+    """Orders "1.10" after "1.9"."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"[.\-_]", str(task_id))]
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ResultsStore:
+    def __init__(self, path=RESULTS_DB, batch_size=50, journal_mode="WAL"):
+        """journal_mode="DELETE" is needed when processes on several machines share the file (WAL cannot)."""
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(task_marks)")]
+        if "subtask_sha256" not in columns:
+            # Stores created before rubric versioning
+            self._conn.execute("ALTER TABLE task_marks ADD COLUMN subtask_sha256 TEXT")
+        self._conn.commit()
+
+    def start_run(self, model=None, rubric_sha256=None, output_file=None):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (started_at, model, rubric_sha256, output_file) VALUES (?, ?, ?, ?)",
+                (time.time(), model, rubric_sha256, output_file),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def add(self, cohort, row, task_results=None, run_id=None, notebook_sha256=None, prompt_sha256=None,
+            subtask_hashes=None):
+        """
+        Queues one student's result. `row` is the CSV row dict (Student, Total Marks,
+        Overall Feedback, Task <id> Marks...); task_results, when available, are the
+        evaluation's result items and add max marks and per-task feedback.
+        subtask_hashes records which version of each evaluated sub-task was used.
+        """
+        details = {str(r.get("task_id")): r for r in task_results or []}
+        subtask_hashes = subtask_hashes or {}
+        tasks = []
+        for column, value in row.items():
+            match = _TASK_COLUMN.match(column)
+            if match:
+                task_id = match.group(1)
+                detail = details.get(task_id)
+                tasks.append((task_id, _number(value), (detail or {}).get("max_marks"), (detail or {}).get("feedback"),
+                              subtask_hashes.get(task_id) if detail is not None else None))
+        student = (cohort, row["Student"], run_id, _number(row.get("Total Marks")), row.get("Overall Feedback"),
+                   notebook_sha256, prompt_sha256, time.time())
+        with self._lock:
+            self._pending.append((student, tasks))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # Caller holds self._lock
+        if not self._pending:
+            return
+        # A student queued twice in one batch keeps the later result
+        pending = list({(student[0], student[1]): (student, tasks) for student, tasks in self._pending}.values())
+        self._pending = []
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM task_marks WHERE cohort = ? AND student = ?",
+                [(student[0], student[1]) for student, _ in pending],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO students (cohort, student, run_id, total_marks, overall_feedback,"
+                " notebook_sha256, prompt_sha256, graded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [student for student, _ in pending],
+            )
+            self._conn.executemany(
+                "INSERT INTO task_marks (cohort, student, task_id, marks_awarded, max_marks, feedback, subtask_sha256)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(student[0], student[1], *task) for student, tasks in pending for task in tasks],
+            )
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def record_rubric_version(self, version, subtask_hashes):
+        """Registers the rubric in use and returns the sub-task hashes of the previous version (or None)."""
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT subtask_hashes FROM rubric_versions WHERE version != ? ORDER BY created_at DESC LIMIT 1",
+                (version,),
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR IGNORE INTO rubric_versions (version, created_at, subtask_hashes) VALUES (?, ?, ?)",
+                (version, time.time(), json.dumps(subtask_hashes)),
+            )
+            self._conn.commit()
+        return json.loads(previous[0]) if previous else None
+
+    def stored_results(self, cohort, student, notebook_sha256=None, include_unversioned=False):
+        """
+        The versioned per-task results stored for a student, as {task_id: result}.
+        Empty when the notebook has changed since (notebook_sha256 given and different).
+        Results without a sub-task hash (imported or resumed) are left out, unless
+        include_unversioned: then they are returned with a subtask_sha256 of None, and
+        a row with no notebook hash (imported) counts as this notebook's.
+        """
+        with self._lock:
+            self._flush()
+            stored = self._conn.execute(
+                "SELECT notebook_sha256 FROM students WHERE cohort = ? AND student = ?", (cohort, student)
+            ).fetchone()
+            if stored is None:
+                return {}
+            if notebook_sha256 is not None and stored[0] != notebook_sha256:
+                if not (include_unversioned and stored[0] is None):
+                    return {}
+            rows = self._conn.execute(
+                "SELECT task_id, marks_awarded, max_marks, feedback, subtask_sha256 FROM task_marks"
+                " WHERE cohort = ? AND student = ?" + ("" if include_unversioned else " AND subtask_sha256 IS NOT NULL"),
+                (cohort, student),
+            ).fetchall()
+        return {
+            task_id: {"task_id": task_id, "marks_awarded": marks, "max_marks": max_marks,
+                      "feedback": feedback, "subtask_sha256": sha}
+            for task_id, marks, max_marks, feedback, sha in rows
+        }
+
+    def cohorts(self):
+        with self._lock:
+            self._flush()
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT cohort FROM students ORDER BY cohort")]
+
+    def table(self, cohort=None, task_ids=None):
+        """
+        Returns (headers, rows) in the report layout. Rows are lists, ordered by
+        cohort then student; a Cohort column leads when no cohort is selected.
+        """
+        where, params = ("WHERE cohort = ?", (cohort,)) if cohort is not None else ("", ())
+        with self._lock:
+            self._flush()
+            if task_ids is None:
+                found = self._conn.execute(f"SELECT DISTINCT task_id FROM task_marks {where}", params).fetchall()
+                task_ids = sorted((r[0] for r in found), key=task_sort_key)
+            students = self._conn.execute(
+                f"SELECT cohort, student, total_marks, overall_feedback FROM students {where} ORDER BY cohort, student",
+                params,
+            ).fetchall()
+            marks = {}
+            for c, s, t, m in self._conn.execute(
+                    f"SELECT cohort, student, task_id, marks_awarded FROM task_marks {where}", params):
+                marks[(c, s, t)] = m
+
+        headers = ["Student", "Total Marks", "Overall Feedback"] + [f"Task {t} Marks" for t in task_ids]
+        if cohort is None:
+            headers.insert(0, "Cohort")
+        rows = []
+        for c, student, total, feedback in students:
+            row = [student, total, feedback] + [marks.get((c, student, t), 0) for t in task_ids]
+            rows.append(row if cohort is not None else [c] + row)
+        return headers, rows
+
+    def export_csv(self, path, cohort=None, task_ids=None):
+        headers, rows = self.table(cohort, task_ids)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        return len(rows)
+
+    def export_xlsx(self, path, cohort=None, task_ids=None):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("XLSX export needs openpyxl (pip install openpyxl)")
+        headers, rows = self.table(cohort, task_ids)
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=str(cohort) if cohort is not None else "All cohorts")
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+        return len(rows)
+
+    def import_csv(self, path, cohort):
+        """Loads an existing report CSV (the current layout) into the store."""
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            rows = [row for row in csv.DictReader(f) if row.get("Student")]
+        for row in rows:
+            self.add(cohort, row)
+        self.flush()
+        return len(rows)
+
+
+def cohort_for(file_path):
+    """Submissions are grouped by the directory they were found in (e.g. 4470/)."""
+    return os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.environ.get("RESULTS_DB", RESULTS_DB))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="write the report for one cohort (or all) as CSV and/or XLSX")
+    export.add_argument("--cohort")
+    export.add_argument("--csv")
+    export.add_argument("--xlsx")
+
+    load = sub.add_parser("import", help="load an existing report CSV")
+    load.add_argument("csv_file")
+    load.add_argument("--cohort", help="default: the file name prefix (4470_grading_report.csv -> 4470)")
+
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.db)
+    try:
+        if args.command == "import":
+            cohort = args.cohort or os.path.basename(args.csv_file).split("_")[0]
+            print(f"Imported {store.import_csv(args.csv_file, cohort)} student(s) into cohort {cohort}")
+        else:
+            if not (args.csv or args.xlsx):
+                parser.error("export needs --csv and/or --xlsx")
+            if args.csv:
+                print(f"Wrote {store.export_csv(args.csv, args.cohort)} row(s) to {args.csv}")
+            if args.xlsx:
+                print(f"Wrote {store.export_xlsx(args.xlsx, args.cohort)} row(s) to {args.xlsx}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Rubric versioning by per-sub-task content hash.
+
+Each sub-task in the rubric hashes to the SHA-256 of its canonical JSON
+(description, marks and any criteria it carries), and the rubric version is
+the hash of all of those together. Stored results remember the hash of the
+sub-task they were graded against. After a rubric edit, only the sub-tasks
+whose hash changed need another Gemini call; every other stored result
+remains valid.
+"""
+
+import copy
+import hashlib
+import json
+
+
+def _sha256(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def subtask_hashes(rubric):
+    """{sub_task_id: content hash} for every sub-task, in rubric order."""
+    return {
+        sub["sub_task_id"]: _sha256(sub)
+        for group in rubric.get("tasks", [])
+        for sub in group.get("sub_tasks", [])
+    }
+
+
+def rubric_version(hashes):
+    return _sha256(hashes)[:16]
+
+
+def diff_hashes(old, new):
+    """Returns (changed, added, removed) sub-task ids between two subtask_hashes() results."""
+    old = old or {}
+    changed = [t for t in new if t in old and old[t] != new[t]]
+    added = [t for t in new if t not in old]
+    removed = [t for t in old if t not in new]
+    return changed, added, removed
+
+
+def subset_rubric(rubric, task_ids):
+    """A copy of the rubric with only the given sub-tasks (and their groups); total_marks is recomputed."""
+    task_ids = set(task_ids)
+    subset = copy.deepcopy(rubric)
+    groups = []
+    for group in subset.get("tasks", []):
+        group["sub_tasks"] = [sub for sub in group.get("sub_tasks", []) if sub["sub_task_id"] in task_ids]
+        if group["sub_tasks"]:
+            groups.append(group)
+    subset["tasks"] = groups
+    subset["total_marks"] = sum(sub.get("marks", 0) for group in groups for sub in group["sub_tasks"])
+    return subset
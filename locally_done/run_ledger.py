@@ -0,0 +1,164 @@
+"""
+Crash-safe ledger of per-student progress through the grading pipeline.
+
+Every stage a student completes (converted, uploaded, evaluated, written) is
+committed to SQLite together with the hashes of its inputs. When a run is
+restarted, finished students are skipped, students that stopped mid-pipeline
+resume after their last completed stage, and failed students are retried.
+A student whose notebook changed since it was recorded starts over.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+STAGES = ["pending", "converted", "uploaded", "evaluated", "written"]
+
+
+def stage_index(stage):
+    return STAGES.index(stage)
+
+
+def ledger_path_for(output_file):
+    """The ledger lives next to the report it tracks (grading_report.csv -> grading_report.ledger.sqlite3)."""
+    base, _ = os.path.splitext(output_file)
+    return f"{base}.ledger.sqlite3"
+
+
+class RunLedger:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS students ("
+            " student TEXT PRIMARY KEY,"
+            " file_path TEXT,"
+            " notebook_sha256 TEXT,"
+            " stage TEXT NOT NULL,"
+            " pdf_path TEXT,"
+            " pdf_sha256 TEXT,"
+            " gemini_file TEXT,"
+            " prompt_sha256 TEXT,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Per-task results as they stream in, before the student's full evaluation is recorded
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS partial_results ("
+            " student TEXT NOT NULL,"
+            " task_id TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " received_at REAL NOT NULL,"
+            " PRIMARY KEY (student, task_id))"
+        )
+        self._conn.commit()
+
+    def get(self, student):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM students WHERE student = ?", (student,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["result"] = json.loads(entry["result"]) if entry["result"] else None
+        return entry
+
+    def begin(self, student, file_path, notebook_sha256):
+        """
+        Registers a student for this run and returns their entry.
+        A student whose notebook hash changed is reset to "pending".
+        """
+        entry = self.get(student)
+        with self._lock:
+            if entry is None or entry["notebook_sha256"] != notebook_sha256:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO students (student, file_path, notebook_sha256, stage, attempts, updated_at) "
+                    "VALUES (?, ?, ?, 'pending', 0, ?)",
+                    (student, file_path, notebook_sha256, time.time()),
+                )
+                self._conn.execute("DELETE FROM partial_results WHERE student = ?", (student,))
+            self._conn.execute(
+                "UPDATE students SET attempts = attempts + 1, file_path = ? WHERE student = ?",
+                (file_path, student),
+            )
+            self._conn.commit()
+        return self.get(student)
+
+    def record(self, student, stage, **fields):
+        """Marks a stage as completed, storing any artefacts (pdf_path, result, ...) with it."""
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        fields.update(stage=stage, error=None, updated_at=time.time())
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE students SET {columns} WHERE student = ?", (*fields.values(), student))
+            if stage_index(stage) >= stage_index("evaluated"):
+                # The full result supersedes whatever streamed in
+                self._conn.execute("DELETE FROM partial_results WHERE student = ?", (student,))
+            self._conn.commit()
+
+    def record_partial(self, student, result):
+        """Stores one streamed task result ({"task_id": ..., ...}), replacing an earlier one for the same task."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO partial_results (student, task_id, result, received_at) VALUES (?, ?, ?, ?)",
+                (student, str(result.get("task_id")), json.dumps(result), time.time()),
+            )
+            self._conn.commit()
+
+    def partial_results(self, student):
+        """The streamed task results stored for a student, in arrival order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM partial_results WHERE student = ? ORDER BY received_at", (student,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def fail(self, student, error):
+        """Records an error without moving the student past their last completed stage."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE students SET error = ?, updated_at = ? WHERE student = ?",
+                (str(error), time.time(), student),
+            )
+            self._conn.commit()
+
+    def reconcile_written(self, written_students):
+        """
+        Makes the report the source of truth for the "written" stage: students
+        already in the CSV count as written, and students the ledger marked as
+        written but that are missing from the CSV go back to "evaluated" so
+        their stored result is written again without another API call.
+        """
+        written_students = set(written_students)
+        with self._lock:
+            rows = self._conn.execute("SELECT student, stage, result FROM students").fetchall()
+            for row in rows:
+                student, stage = row["student"], row["stage"]
+                if student in written_students and stage != "written":
+                    self._conn.execute("UPDATE students SET stage = 'written', error = NULL WHERE student = ?", (student,))
+                elif student not in written_students and stage == "written":
+                    fallback = "evaluated" if row["result"] else "pending"
+                    self._conn.execute("UPDATE students SET stage = ? WHERE student = ?", (fallback, student))
+            self._conn.commit()
+
+    def counts(self):
+        """Number of students per last completed stage, plus how many have an outstanding error."""
+        with self._lock:
+            rows = self._conn.execute("SELECT stage, COUNT(*) FROM students GROUP BY stage").fetchall()
+            failed = self._conn.execute("SELECT COUNT(*) FROM students WHERE error IS NOT NULL").fetchone()[0]
+        counts = {stage: 0 for stage in STAGES}
+        counts.update({row[0]: row[1] for row in rows})
+        counts["failed"] = failed
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,214 @@
+"""
+Runs students' extracted code-task functions against test harnesses in isolated processes.
+
+Each (student, sub-task) pair runs in a fresh `python -I task_checks.py`
+process. The process gets an empty temporary working directory and a
+scrubbed environment, so API keys and other secrets are not visible. It also
+gets CPU, address-space and file-size limits and a wall-clock timeout. A
+fresh process per check means one student's globals, monkey-patching or
+leaked threads can never affect the next student. A thread pool caps how
+many of these processes run at once.
+
+Each run yields Evidence with one of three verdicts:
+- pass: every check passed.
+- fail: a hard check failed.
+- ambiguous: a soft check failed, or the harness could not decide (missing
+  imports or helpers, timeout, memory limit, crash).
+The evaluate stage grades clear-cut verdicts locally. Ambiguous ones go to
+Gemini, with the evidence added to the prompt.
+
+The sandbox limits resources; it does not block network access or system
+calls. Students' code is still untrusted code, so only turn code checks on
+where running it is acceptable (a disposable VM or container).
+
+The child reports its result on a file descriptor passed to it, not on
+stdout, as one line tagged with a random nonce for each run. Anything else
+(a result line on stdout, a second line, a wrong nonce) makes the verdict
+ambiguous, so printing a fake "all checks passed" line does not grade a
+broken function as correct. Code that goes looking for the descriptor and
+the nonce in the harness's memory can still forge a result; that is part
+of running untrusted code.
+"""
+
+import ast
+import json
+import os
+import re
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from prompt_compiler import split_cells
+from task_checks import CHECKS, RESULT_MARKER
+
+CHECKS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_checks.py")
+SANDBOX_WORKERS = 2
+SANDBOX_CPU_SECONDS = 60
+SANDBOX_MEMORY_MB = 8192
+SANDBOX_FILE_MB = 16
+SANDBOX_TIMEOUT = 120
+
+_IMPORT_LINE = re.compile(r"^(?:import\s+\S.*|from\s+\S+\s+import\s+\S.*)$")
+
+
+@dataclass
+class Evidence:
+    task_id: str
+    verdict: str  # "pass", "fail" or "ambiguous"
+    checks: list = field(default_factory=list)
+    error: str = None
+    seconds: float = 0.0
+
+    def failed(self, hard=None):
+        return [c for c in self.checks if not c["ok"] and (hard is None or c["hard"] == hard)]
+
+    def describe(self):
+        """The evidence as plain text, for the prompt or the feedback column."""
+        lines = [f"Automated checks ({self.verdict}):"]
+        for c in self.checks:
+            mark = "PASS" if c["ok"] else ("FAIL" if c["hard"] else "DOUBT")
+            lines.append(f"- {mark} {c['name']}" + (f" ({c['detail']})" if not c["ok"] and c["detail"] else ""))
+        if self.error:
+            lines.append(f"- Could not complete: {self.error}")
+        return "\n".join(lines)
+
+
+def verdict_for(result):
+    """Maps a task_checks result to pass/fail/ambiguous."""
+    checks = result.get("checks", [])
+    if any(not c["ok"] and c["hard"] for c in checks):
+        # A clear failure stands even if the harness stopped early afterwards
+        return "fail"
+    if result.get("status") != "ok" or not checks or any(not c["ok"] for c in checks):
+        return "ambiguous"
+    return "pass"
+
+
+def notebook_imports(full_notebook_content):
+    """Top-level import statements of the notebook's code cells, in order and without duplicates."""
+    statements = []
+    for cell_type, source in split_cells(full_notebook_content):
+        if cell_type != "CODE":
+            continue
+        try:
+            tree = ast.parse(source)
+            found = [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+        except SyntaxError:
+            # Cells with magics still contribute their plain import lines
+            found = [line.strip() for line in source.splitlines() if _IMPORT_LINE.match(line.strip())]
+        for statement in found:
+            if statement not in statements:
+                statements.append(statement)
+    return statements
+
+
+class SandboxRunner:
+    def __init__(self, workers=SANDBOX_WORKERS, cpu_seconds=SANDBOX_CPU_SECONDS, memory_mb=SANDBOX_MEMORY_MB,
+                 timeout=SANDBOX_TIMEOUT, file_mb=SANDBOX_FILE_MB, script=CHECKS_SCRIPT, python=sys.executable):
+        self.limits = {"cpu_seconds": cpu_seconds, "memory_mb": memory_mb, "file_mb": file_mb}
+        self.timeout = timeout
+        self.script = script
+        self.python = python
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="sandbox")
+
+    @staticmethod
+    def supports(task_id):
+        return task_id in CHECKS
+
+    def run(self, task_id, code, imports=()):
+        """Runs one sub-task's harness on code in a fresh sandboxed process and returns its Evidence."""
+        # The result comes back through a file only the harness is told about, tagged with this run's nonce.
+        # stdout is the student's, so a result line printed there is never believed.
+        nonce = secrets.token_hex(16)
+        result_fd, result_path = tempfile.mkstemp(prefix="sandbox-result-")
+        job = {"task_id": task_id, "code": code, "imports": list(imports), "limits": self.limits,
+               "result_fd": result_fd, "nonce": nonce}
+        workdir = tempfile.mkdtemp(prefix="sandbox-")
+        env = {
+            "PATH": os.environ.get("PATH", ""),
+            "HOME": workdir,
+            "TMPDIR": workdir,
+            "MPLBACKEND": "Agg",
+            "OMP_NUM_THREADS": "1",
+            "TF_CPP_MIN_LOG_LEVEL": "3",
+            "PYTHONHASHSEED": "0",
+        }
+        started = time.perf_counter()
+        stdout_path, stderr_path = os.path.join(workdir, ".stdout"), os.path.join(workdir, ".stderr")
+        try:
+            # Output goes to files, which the child's file-size limit caps, not to unbounded pipes
+            with open(stdout_path, "w") as stdout, open(stderr_path, "w") as stderr:
+                proc = subprocess.Popen([self.python, "-I", self.script], stdin=subprocess.PIPE, stdout=stdout,
+                                        stderr=stderr, cwd=workdir, env=env, text=True, start_new_session=True,
+                                        pass_fds=(result_fd,))
+                os.close(result_fd)
+                result_fd = None
+                try:
+                    proc.communicate(json.dumps(job), timeout=self.timeout)
+                except subprocess.TimeoutExpired:
+                    _kill_group(proc)
+                    return Evidence(task_id, "ambiguous", error=f"timed out after {self.timeout:g}s",
+                                    seconds=time.perf_counter() - started)
+            with open(stdout_path, "r", errors="replace") as f:
+                out = f.read()
+            with open(stderr_path, "r", errors="replace") as f:
+                err = f.read()
+            with open(result_path, "r", errors="replace") as f:
+                reported = f.read()
+        except OSError as e:
+            return Evidence(task_id, "ambiguous", error=f"could not start the sandbox: {e}")
+        finally:
+            if result_fd is not None:
+                os.close(result_fd)
+            os.remove(result_path)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        seconds = time.perf_counter() - started
+        if any(line.startswith(RESULT_MARKER) for line in out.splitlines()):
+            return Evidence(task_id, "ambiguous", error="the code printed a fake check result", seconds=seconds)
+        lines = reported.splitlines()
+        if not lines:
+            return Evidence(task_id, "ambiguous", error=_exit_reason(proc.returncode, err), seconds=seconds)
+        prefix = f"{RESULT_MARKER}{nonce} "
+        if len(lines) > 1 or not lines[0].startswith(prefix):
+            return Evidence(task_id, "ambiguous", error="the check result was tampered with", seconds=seconds)
+        try:
+            result = json.loads(lines[0][len(prefix):])
+        except ValueError:
+            return Evidence(task_id, "ambiguous", error="the check result was tampered with", seconds=seconds)
+        return Evidence(task_id, verdict_for(result), result.get("checks", []), result.get("error"), seconds)
+
+    def run_all(self, tasks, imports=()):
+        """Runs {task_id: code} concurrently on the pool. Returns {task_id: Evidence}."""
+        futures = {t_id: self._pool.submit(self.run, t_id, code, imports) for t_id, code in tasks.items()}
+        return {t_id: future.result() for t_id, future in futures.items()}
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        proc.kill()
+    proc.wait()
+
+
+def _exit_reason(returncode, stderr):
+    if returncode is not None and returncode < 0:
+        try:
+            name = signal.Signals(-returncode).name
+        except ValueError:
+            name = f"signal {-returncode}"
+        reason = "CPU time limit reached" if name == "SIGXCPU" else f"killed by {name}"
+    else:
+        reason = f"exited with status {returncode}"
+    tail = stderr.strip().splitlines()[-1:] if stderr.strip() else []
+    return f"{reason}" + (f": {tail[0][:200]}" if tail else "")
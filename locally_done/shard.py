@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Sharded grading: many worker processes (on one machine, or several sharing a
+filesystem) pull students from a shared work queue instead of each run
+globbing its own hard-coded STUDENT_DIRS.
+
+    python shard.py enqueue 4470 4473          # once, from any machine
+    python shard.py work --processes 4         # on every machine
+    python shard.py status
+    python shard.py merge                      # one report per cohort
+
+Each worker claims a batch of students, runs them through the normal
+pipeline, and keeps its own report and run ledger under .grading_cache/shards.
+Finished students are marked done in the queue. Failed students go back into
+the queue until MAX_ATTEMPTS is reached. A worker that dies loses its lease,
+and its students are picked up by the others. Every worker also writes to the
+shared results store, and `merge` exports that store into one
+<cohort>_grading_report.csv per cohort.
+
+The worker processes on one machine share its caches: the PDF cache, and
+the response cache and upload registry (RESPONSE_CACHE_FILE,
+UPLOAD_REGISTRY_FILE), which are SQLite databases in WAL mode that are safe
+for several processes. WAL cannot be shared over a network filesystem,
+though, so when the workers run on several machines, give each machine
+local caches (PDF_CACHE_DIR, RESPONSE_CACHE_FILE, UPLOAD_REGISTRY_FILE).
+The queue and the results store can be shared.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+from functools import partial
+
+from results_store import RESULTS_DB, ResultsStore, cohort_for
+from work_queue import LEASE_SECONDS, MAX_ATTEMPTS, WORK_QUEUE_FILE, WorkQueue, worker_name
+
+SHARD_DIR = os.path.join(".grading_cache", "shards")
+
+
+def queue_items(student_dirs):
+    """(key, file_path, cohort) for every notebook in student_dirs; keys are <cohort>/<filename>."""
+    items = []
+    for d in student_dirs:
+        for file_path in sorted(glob.glob(os.path.join(os.path.abspath(d), "*.ipynb"))):
+            cohort = cohort_for(file_path)
+            items.append((f"{cohort}/{os.path.basename(file_path)}", file_path, cohort))
+    return items
+
+
+def run_worker(queue, batch_size, heartbeat_interval):
+    """Claims and grades batches until the queue has nothing left to hand out."""
+    # Several machines may write the shared results store; WAL cannot span machines
+    os.environ.setdefault("RESULTS_DB_JOURNAL", "DELETE")
+    import evaluate_submissions as grading
+
+    if not grading.configure_gemini():
+        return
+    owner = worker_name()
+    ctx = grading.build_context(os.path.join(SHARD_DIR, f"{owner}.csv"))
+
+    held = set()
+    held_lock = threading.Lock()
+    stop = threading.Event()
+
+    def renew_leases():
+        while not stop.wait(heartbeat_interval):
+            with held_lock:
+                keys = list(held)
+            lost = set(keys) - set(queue.heartbeat(owner, keys))
+            if lost:
+                print(f"   -> [{owner}] Lost the lease on {len(lost)} student(s); another worker may grade them too")
+
+    heartbeat = threading.Thread(target=renew_leases, daemon=True)
+    heartbeat.start()
+    graded = 0
+    try:
+        while True:
+            claimed = queue.claim(owner, batch_size)
+            if not claimed:
+                break
+            keys = {file_path: key for key, file_path, _ in claimed}
+            with held_lock:
+                held.update(keys.values())
+            print(f"\n[{owner}] Claimed {len(claimed)} student(s)")
+
+            jobs = grading.plan_jobs(ctx["ledger"], list(keys), needs_regrade=partial(grading.needs_regrade, ctx),
+                                     written_students=grading.read_written_students(ctx["output_file"]))
+            planned = {job["file_path"] for job in jobs}
+            finished = {job["file_path"] for job in grading.build_pipeline(ctx).run(jobs)}
+            for file_path, key in keys.items():
+                if file_path not in planned or file_path in finished:
+                    # Not planned means this worker's report already has the student
+                    queue.complete(owner, key)
+                    graded += 1
+                else:
+                    entry = ctx["ledger"].get(os.path.basename(file_path))
+                    queue.fail(owner, key, (entry or {}).get("error") or "grading failed")
+            with held_lock:
+                held.difference_update(keys.values())
+            ctx["results_store"].flush()
+    finally:
+        stop.set()
+        heartbeat.join()
+        grading.close_shared_clients()
+        grading.close_context(ctx)
+    print(f"\n[{owner}] Done: {graded} student(s) graded")
+
+
+def merge(store, out_dir, task_ids=None, xlsx=None):
+    """Writes <cohort>_grading_report.csv for every cohort in the store (and optionally one XLSX)."""
+    written = []
+    for cohort in store.cohorts():
+        path = os.path.join(out_dir, f"{cohort}_grading_report.csv")
+        rows = store.export_csv(path, cohort, task_ids)
+        print(f"Wrote {rows} row(s) to {path}")
+        written.append(path)
+    if xlsx:
+        print(f"Wrote {store.export_xlsx(xlsx, task_ids=task_ids)} row(s) to {xlsx}")
+    return written
+
+
+def rubric_task_ids(rubric_file):
+    with open(rubric_file, "r", encoding="utf-8") as f:
+        rubric = json.load(f)
+    return [sub["sub_task_id"] for group in rubric.get("tasks", []) for sub in group.get("sub_tasks", [])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue", default=os.environ.get("WORK_QUEUE_FILE", WORK_QUEUE_FILE))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="add every notebook in the given directories to the queue")
+    enqueue.add_argument("dirs", nargs="+")
+
+    work = sub.add_parser("work", help="claim and grade students until the queue is empty")
+    work.add_argument("--processes", type=int, default=1, help="worker processes to start on this machine")
+    work.add_argument("--batch", type=int, default=8, help="students claimed at a time per process")
+    work.add_argument("--lease", type=float, default=LEASE_SECONDS)
+    work.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+
+    sub.add_parser("status", help="show queue counts")
+    sub.add_parser("retry", help="re-queue students that used up their attempts")
+
+    merge_cmd = sub.add_parser("merge", help="export one report per cohort from the results store")
+    merge_cmd.add_argument("--out-dir", default=".")
+    merge_cmd.add_argument("--xlsx")
+    merge_cmd.add_argument("--rubric", default="Assignment_2_Rubric.json")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        store = ResultsStore(os.environ.get("RESULTS_DB", RESULTS_DB), journal_mode="DELETE")
+        try:
+            merge(store, args.out_dir, rubric_task_ids(args.rubric), args.xlsx)
+        finally:
+            store.close()
+        return
+
+    if args.command == "work" and args.processes > 1:
+        command = [sys.executable, os.path.abspath(__file__), "--queue", args.queue, "work", "--processes", "1",
+                   "--batch", str(args.batch), "--lease", str(args.lease), "--max-attempts", str(args.max_attempts)]
+        workers = [subprocess.Popen(command) for _ in range(args.processes)]
+        sys.exit(max(worker.wait() for worker in workers))
+
+    lease = getattr(args, "lease", LEASE_SECONDS)
+    queue = WorkQueue(args.queue, lease_seconds=lease, max_attempts=getattr(args, "max_attempts", MAX_ATTEMPTS))
+    try:
+        if args.command == "enqueue":
+            items = queue_items(args.dirs)
+            print(f"Queued {queue.enqueue(items)} new student(s) ({len(items)} found)")
+        elif args.command == "work":
+            run_worker(queue, args.batch, heartbeat_interval=lease / 3)
+        elif args.command == "retry":
+            print(f"Re-queued {queue.requeue_failed()} student(s)")
+        print(", ".join(f"{state}: {n}" for state, n in queue.counts().items()))
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
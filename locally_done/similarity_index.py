@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate index over the task code extracted from each submission.
+
+For every assessed task, each student's extracted code is normalised into a
+token stream. Comments and layout are dropped. Identifiers become V, string
+literals S and numbers N. Keywords, builtins, operators and attribute names
+(the `fillna` in df.fillna) are kept. Renaming variables or reformatting a
+copied solution therefore changes nothing.
+
+The stream is cut into overlapping k-token shingles, and each shingle set is
+summarised by a MinHash signature. The signature is split into LSH bands, and
+two submissions become a candidate pair only if they share a bucket in some
+band. Each candidate pair is then scored by the exact Jaccard similarity of
+the two shingle sets. Finding the pairs costs time roughly linear in the
+number of students instead of comparing every pair.
+
+Signatures and band buckets are kept in SQLite, so adding a cohort, or a
+re-submitted notebook, only hashes the new code. The grading pipeline adds
+each student as soon as their code is extracted. Notebooks graded earlier
+can be added from the command line:
+
+    python similarity_index.py add 4470 4473
+    python similarity_index.py report --min-similarity 0.8 --csv similarity_report.csv
+"""
+
+import argparse
+import builtins
+import csv
+import glob
+import hashlib
+import io
+import json
+import keyword
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import tokenize
+import zlib
+from array import array
+
+SIMILARITY_INDEX_FILE = "similarity_index.sqlite3"
+SHINGLE_TOKENS = 5
+NUM_PERM = 128
+# 32 bands of 4 rows: pairs above ~0.5 Jaccard almost always share a bucket
+BANDS = 32
+# Code shorter than this (an untouched stub) says nothing about copying
+MIN_SHINGLES = 8
+# Buckets this large are template code everyone shares; pairing them would be quadratic again
+MAX_BUCKET = 500
+MIN_SIMILARITY = 0.6
+
+# Largest prime below 2**32, so every hash value fits an unsigned 32-bit array item
+_PRIME = 4294967291
+_KEEP_NAMES = set(keyword.kwlist) | set(dir(builtins)) | {"self"}
+_SKIP_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+                tokenize.ENCODING, tokenize.ENDMARKER}
+# Python 3.12+ splits f-strings into several tokens; the whole f-string counts as one S
+_SKIP_TOKENS |= {getattr(tokenize, name) for name in ("FSTRING_MIDDLE", "FSTRING_END") if hasattr(tokenize, name)}
+_STRING_TOKENS = {tokenize.STRING} | ({tokenize.FSTRING_START} if hasattr(tokenize, "FSTRING_START") else set())
+_FALLBACK_TOKEN = re.compile(r"[A-Za-z_]\w*|\d[\w.]*|\S")
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " doc_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " cohort TEXT NOT NULL,"
+    " student TEXT NOT NULL,"
+    " task_id TEXT NOT NULL,"
+    " code_sha256 TEXT NOT NULL,"
+    " code TEXT NOT NULL,"
+    " signature BLOB NOT NULL,"
+    " indexed_at REAL NOT NULL,"
+    " UNIQUE (cohort, student, task_id))",
+    "CREATE TABLE IF NOT EXISTS bands ("
+    " task_id TEXT NOT NULL,"
+    " band INTEGER NOT NULL,"
+    " bucket INTEGER NOT NULL,"
+    " doc_id INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS bands_bucket ON bands (task_id, band, bucket)",
+    "CREATE INDEX IF NOT EXISTS bands_doc ON bands (doc_id)",
+]
+
+
+def normalize_tokens(code):
+    """The code as a list of normalised tokens (see the module docstring)."""
+    tokens = []
+    previous = None
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type in _SKIP_TOKENS:
+                continue
+            if tok.type == tokenize.NAME:
+                text = tok.string if tok.string in _KEEP_NAMES or previous == "." else "V"
+            elif tok.type in _STRING_TOKENS:
+                text = "S"
+            elif tok.type == tokenize.NUMBER:
+                text = "N"
+            else:
+                text = tok.string
+            tokens.append(text)
+            previous = tok.string
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Half-finished cells still get compared, on plain word/symbol tokens
+        tokens = [t if t in _KEEP_NAMES or not (t[0].isalpha() or t[0] == "_") else "V"
+                  for t in _FALLBACK_TOKEN.findall(code)]
+    return tokens
+
+
+def shingles(tokens, k=SHINGLE_TOKENS):
+    """The set of 32-bit hashes of every k consecutive tokens."""
+    if len(tokens) < k:
+        return {zlib.crc32("\x1f".join(tokens).encode("utf-8"))} if tokens else set()
+    return {zlib.crc32("\x1f".join(tokens[i:i + k]).encode("utf-8")) for i in range(len(tokens) - k + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """num_perm hash functions (a*x + b) mod p, drawn from a fixed seed so signatures stay comparable."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, shingle_set):
+        values = list(shingle_set)
+        return array("I", [min((a * x + b) % _PRIME for x in values) for a, b in self.params])
+
+
+def estimated_similarity(sig_a, sig_b):
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+class SimilarityIndex:
+    def __init__(self, path=SIMILARITY_INDEX_FILE, num_perm=NUM_PERM, bands=BANDS, shingle_tokens=SHINGLE_TOKENS,
+                 min_shingles=MIN_SHINGLES, max_bucket=MAX_BUCKET, journal_mode="WAL"):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.path = path
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_tokens = shingle_tokens
+        self.min_shingles = min_shingles
+        self.max_bucket = max_bucket
+        self.hasher = MinHasher(num_perm)
+        self.skipped_buckets = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+        params = json.dumps({"num_perm": num_perm, "bands": bands, "shingle_tokens": shingle_tokens})
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+        if row is not None and row[0] != params:
+            # Signatures built with other settings cannot be compared; start over
+            print(f"   -> [similarity_index] Index settings changed; clearing {path}")
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM documents")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('params', ?)", (params,))
+        self._conn.commit()
+
+    def _buckets(self, signature):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            yield band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "big", signed=True)
+
+    def add(self, cohort, student, task_id, code):
+        """Indexes one student's code for one task. Returns False if it was already indexed unchanged (or too short)."""
+        return self.add_submission(cohort, student, {task_id: code}) > 0
+
+    def add_submission(self, cohort, student, extracted_tasks):
+        """Indexes a student's {task_id: code}. Returns how many tasks were (re)indexed."""
+        work = []
+        for task_id, code in extracted_tasks.items():
+            code_sha256 = hashlib.sha256(code.encode("utf-8")).hexdigest()
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT code_sha256 FROM documents WHERE cohort = ? AND student = ? AND task_id = ?",
+                    (cohort, student, task_id),
+                ).fetchone()
+            if row is not None and row[0] == code_sha256:
+                continue
+            shingle_set = shingles(normalize_tokens(code), self.shingle_tokens)
+            signature = self.hasher.signature(shingle_set) if len(shingle_set) >= self.min_shingles else None
+            work.append((task_id, code, code_sha256, signature))
+
+        with self._lock:
+            for task_id, code, code_sha256, signature in work:
+                old = self._conn.execute(
+                    "SELECT doc_id FROM documents WHERE cohort = ? AND student = ? AND task_id = ?",
+                    (cohort, student, task_id),
+                ).fetchone()
+                if old is not None:
+                    self._conn.execute("DELETE FROM bands WHERE doc_id = ?", (old[0],))
+                    self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (old[0],))
+                if signature is None:
+                    continue
+                doc_id = self._conn.execute(
+                    "INSERT INTO documents (cohort, student, task_id, code_sha256, code, signature, indexed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (cohort, student, task_id, code_sha256, code, signature.tobytes(), time.time()),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT INTO bands (task_id, band, bucket, doc_id) VALUES (?, ?, ?, ?)",
+                    [(task_id, band, bucket, doc_id) for band, bucket in self._buckets(signature)],
+                )
+            self._conn.commit()
+        return sum(1 for *_, signature in work if signature is not None)
+
+    def task_ids(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT task_id FROM documents ORDER BY task_id").fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, task_id=None):
+        with self._lock:
+            if task_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM documents WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+    def candidate_pairs(self, task_id):
+        """Pairs of doc_ids that share an LSH bucket for task_id. Oversized buckets are skipped and counted."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT GROUP_CONCAT(doc_id) FROM bands WHERE task_id = ?"
+                " GROUP BY band, bucket HAVING COUNT(*) > 1",
+                (task_id,),
+            ).fetchall()
+        pairs = set()
+        for (members,) in rows:
+            ids = sorted(int(doc_id) for doc_id in members.split(","))
+            if len(ids) > self.max_bucket:
+                self.skipped_buckets += 1
+                continue
+            for n, a in enumerate(ids):
+                for b in ids[n + 1:]:
+                    pairs.add((a, b))
+        return pairs
+
+    def similar_pairs(self, task_id=None, min_similarity=MIN_SIMILARITY, cross_cohort=False):
+        """
+        Candidate pairs scored by exact Jaccard similarity, most similar first. Each row has
+        task_id, similarity, estimated (MinHash), cohort_a, student_a, cohort_b, student_b.
+        """
+        report = []
+        for t_id in ([task_id] if task_id else self.task_ids()):
+            pairs = self.candidate_pairs(t_id)
+            doc_ids = sorted({doc_id for pair in pairs for doc_id in pair})
+            docs = {}
+            with self._lock:
+                for start in range(0, len(doc_ids), 500):
+                    chunk = doc_ids[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT doc_id, cohort, student, code, signature FROM documents"
+                        f" WHERE doc_id IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    docs.update({row[0]: row[1:] for row in rows})
+            shingle_sets = {}
+            for a, b in pairs:
+                cohort_a, student_a, code_a, sig_a = docs[a]
+                cohort_b, student_b, code_b, sig_b = docs[b]
+                if cross_cohort and cohort_a == cohort_b:
+                    continue
+                for doc_id, code in ((a, code_a), (b, code_b)):
+                    if doc_id not in shingle_sets:
+                        shingle_sets[doc_id] = shingles(normalize_tokens(code), self.shingle_tokens)
+                similarity = jaccard(shingle_sets[a], shingle_sets[b])
+                if similarity < min_similarity:
+                    continue
+                report.append({
+                    "task_id": t_id,
+                    "similarity": round(similarity, 3),
+                    "estimated": round(estimated_similarity(array("I", sig_a), array("I", sig_b)), 3),
+                    "cohort_a": cohort_a, "student_a": student_a,
+                    "cohort_b": cohort_b, "student_b": student_b,
+                })
+        return sorted(report, key=lambda r: (r["task_id"], -r["similarity"], r["student_a"], r["student_b"]))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def write_report_csv(path, rows):
+    fields = ["task_id", "similarity", "estimated", "cohort_a", "student_a", "cohort_b", "student_b"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_report(rows, top=20):
+    """Plain-text report: the `top` most similar pairs of each task."""
+    lines = []
+    by_task = {}
+    for row in rows:
+        by_task.setdefault(row["task_id"], []).append(row)
+    for task_id, task_rows in by_task.items():
+        lines.append(f"Task {task_id}: {len(task_rows)} pair(s)")
+        for row in task_rows[:top]:
+            lines.append(f"   {row['similarity']:.2f}  {row['cohort_a']}/{row['student_a']}  <->  "
+                         f"{row['cohort_b']}/{row['student_b']}")
+    return "\n".join(lines) if lines else "No similar pairs found."
+
+
+def index_directories(index, dirs, task_functions):
+    """Adds every notebook under dirs. Returns (notebooks, tasks indexed)."""
+    from notebook_reader import iter_notebook_cells
+    from results_store import cohort_for
+    from task_locator import TaskLocator
+
+    notebooks = indexed = 0
+    for d in dirs:
+        for file_path in sorted(glob.glob(os.path.join(os.path.abspath(d), "*.ipynb"))):
+            locator = TaskLocator(task_functions)
+            try:
+                for n, cell in enumerate(iter_notebook_cells(file_path)):
+                    if cell.get("cell_type") == "code":
+                        locator.add_cell("".join(cell.get("source", [])), n)
+            except Exception as e:
+                print(f"   -> [similarity_index] Skipping {file_path}: {e}")
+                continue
+            notebooks += 1
+            indexed += index.add_submission(cohort_for(file_path), os.path.basename(file_path), locator.tasks())
+    return notebooks, indexed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=os.environ.get("SIMILARITY_INDEX") or SIMILARITY_INDEX_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="index every notebook in the given directories")
+    add.add_argument("dirs", nargs="+")
+    add.add_argument("--questions", default="Assignment_2_Questions.json")
+
+    report = sub.add_parser("report", help="ranked similar pairs per task")
+    report.add_argument("--task")
+    report.add_argument("--min-similarity", type=float, default=MIN_SIMILARITY)
+    report.add_argument("--cross-cohort", action="store_true", help="only pairs from different cohorts")
+    report.add_argument("--top", type=int, default=20, help="pairs printed per task")
+    report.add_argument("--csv", help="write every pair to this CSV")
+
+    args = parser.parse_args(argv)
+    index = SimilarityIndex(args.index)
+    try:
+        if args.command == "add":
+            from task_locator import derive_task_functions
+            with open(args.questions, "r", encoding="utf-8") as f:
+                task_functions = derive_task_functions(json.load(f))
+            notebooks, indexed = index_directories(index, args.dirs, task_functions)
+            print(f"Indexed {indexed} new or changed task(s) from {notebooks} notebook(s); {index.count()} in the index")
+        else:
+            rows = index.similar_pairs(args.task, args.min_similarity, args.cross_cohort)
+            print(format_report(rows, args.top))
+            if index.skipped_buckets:
+                print(f"Skipped {index.skipped_buckets} bucket(s) of more than {index.max_bucket} submissions (shared template code)")
+            if args.csv:
+                write_report_csv(args.csv, rows)
+                print(f"Wrote {len(rows)} pair(s) to {args.csv}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
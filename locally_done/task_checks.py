@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Test harnesses for the code sub-tasks, run inside a sandboxed child process.
+
+sandbox.py starts `python -I task_checks.py` once per (student, sub-task).
+It writes one JSON job to stdin:
+
+    {"task_id": "1.1", "code": "...", "imports": ["import pandas as pd", ...],
+     "limits": {"cpu_seconds": 60, "memory_mb": 4096, "file_mb": 16}}
+
+The child first applies the resource limits to itself. It then runs the
+notebook's import statements and the student's extracted functions, and
+calls them on small fixed fixtures. It writes a single line,
+RESULT_MARKER + nonce + " " + JSON, to the job's result_fd (stdout when the
+job has none):
+
+    {"status": "ok" | "error", "checks": [{"name", "ok", "hard", "detail"}], "error": ...}
+
+A failed hard check means the function clearly does not do what the task
+asks: it crashes on valid input, leaves missing values, and so on. A failed
+soft check is only a doubt, such as statistics taken from the test set, and
+leaves the grade to the LLM. "error" means the harness could not decide:
+imports failed, or a helper defined elsewhere in the notebook was missing.
+
+The module only imports the standard library at the top, so the parent
+process can read CHECKS without pandas, sklearn or TensorFlow installed.
+"""
+
+import json
+import math
+import os
+import sys
+from contextlib import redirect_stdout
+
+RESULT_MARKER = "@@TASK_CHECKS@@ "
+
+
+class Inconclusive(Exception):
+    """The harness cannot judge the code (missing import or helper), as opposed to the code failing."""
+
+
+class StudentError(Exception):
+    """The student's function raised on valid input."""
+
+
+class Checks:
+    """Collects check outcomes for one sub-task."""
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, name, ok, detail="", hard=True):
+        self.items.append({"name": name, "ok": bool(ok), "hard": hard, "detail": detail})
+        return bool(ok)
+
+    def soft(self, name, ok, detail=""):
+        return self.add(name, ok, detail, hard=False)
+
+
+def call(namespace, name, *args):
+    """Calls the student's function; a missing name or import makes the check inconclusive."""
+    function = namespace.get(name)
+    if not callable(function):
+        raise Inconclusive(f"{name} is not defined")
+    try:
+        return function(*args)
+    except (NameError, ImportError) as e:
+        raise Inconclusive(f"{name} needs something defined elsewhere in the notebook: {e}")
+    except MemoryError:
+        raise
+    except Exception as e:
+        raise StudentError(f"{name} raised {type(e).__name__}: {e}")
+
+
+def _pair_of_frames(checks, name, out):
+    import pandas as pd
+
+    return checks.add(
+        f"{name} returns (X_train, X_test) DataFrames",
+        isinstance(out, tuple) and len(out) == 2 and all(isinstance(x, pd.DataFrame) for x in out),
+        f"returned {type(out).__name__}",
+    )
+
+
+def _raw_frames():
+    """A small Adult-like train/test split with numeric and categorical columns and gaps in both."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+
+    def frame(n, categories):
+        # Object dtype on every pandas version: pandas 3 would otherwise infer its string
+        # dtype, and code written for `dtype == object` would fail on valid input
+        return pd.DataFrame({
+            "age": rng.integers(18, 70, n).astype(float),
+            "hours_per_week": rng.normal(40, 8, n).round(1),
+            "workclass": pd.Series(rng.choice(categories, n), dtype=object),
+            "sex": pd.Series(rng.choice(["Male", "Female"], n), dtype=object),
+        })
+
+    train = frame(40, ["Private", "State-gov", "Self-emp"])
+    # The test split lacks one category, which breaks naive per-split one-hot encoding
+    test = frame(15, ["Private", "State-gov"])
+    train.loc[[1, 5, 9], "age"] = np.nan
+    train.loc[[2, 7], "workclass"] = np.nan
+    test.loc[[0, 3], "hours_per_week"] = np.nan
+    test.loc[[4], "sex"] = np.nan
+    return train, test
+
+
+def check_missing_data(namespace, checks):
+    train, test = _raw_frames()
+    out = call(namespace, "missing_data", train.copy(), test.copy())
+    if not _pair_of_frames(checks, "missing_data", out):
+        return
+    train_out, test_out = out
+    left = int(train_out.isna().sum().sum() + test_out.isna().sum().sum())
+    checks.add("no missing values remain", left == 0, f"{left} missing value(s) left")
+    checks.soft("rows are kept", len(train_out) == len(train) and len(test_out) == len(test),
+                f"{len(train_out)}/{len(train)} train and {len(test_out)}/{len(test)} test rows")
+    checks.soft("columns are kept", list(train_out.columns) == list(train.columns),
+                f"columns {list(train_out.columns)}")
+    if len(test_out) == len(test) and "hours_per_week" in test_out:
+        filled = test_out["hours_per_week"].iloc[[0, 3]].astype(float)
+        train_stats = [train["hours_per_week"].median(), train["hours_per_week"].mean()]
+        checks.soft("test gaps are filled with training-set statistics",
+                    all(any(math.isclose(v, s, rel_tol=1e-6) for s in train_stats) for v in filled),
+                    f"filled with {list(filled)}; training median/mean {train_stats}")
+
+
+def check_encoding(namespace, checks):
+    import pandas as pd
+
+    train, test = _raw_frames()
+    train, test = train.dropna().reset_index(drop=True), test.dropna().reset_index(drop=True)
+    out = call(namespace, "encoding", train.copy(), test.copy())
+    if not _pair_of_frames(checks, "encoding", out):
+        return
+    train_out, test_out = out
+    left = [c for c in train_out.columns if not (pd.api.types.is_numeric_dtype(train_out[c])
+                                                 or pd.api.types.is_bool_dtype(train_out[c]))]
+    checks.add("no categorical columns remain", not left, f"non-numeric columns {left}")
+    checks.add("train and test have the same columns", list(train_out.columns) == list(test_out.columns),
+               f"train {list(train_out.columns)}, test {list(test_out.columns)}")
+    checks.add("rows are kept", len(train_out) == len(train) and len(test_out) == len(test),
+               f"{len(train_out)}/{len(train)} train and {len(test_out)}/{len(test)} test rows")
+    checks.soft("one column per category", train_out.shape[1] >= 2 + 3 + 1,
+                f"{train_out.shape[1]} columns for 2 numeric and 2 categorical features")
+
+    # The notebook also encodes the class attribute with it
+    y_train = pd.DataFrame({"income": ["<=50K", ">50K", "<=50K", ">50K"]})
+    y_test = pd.DataFrame({"income": [">50K", "<=50K"]})
+    y_out = call(namespace, "encoding", y_train, y_test)
+    checks.soft("encodes the class attribute too",
+                isinstance(y_out, tuple) and len(y_out) == 2 and getattr(y_out[0], "shape", (0, 0))[1] == 2,
+                f"returned {type(y_out).__name__}")
+
+
+def check_rescale(namespace, checks):
+    import pandas as pd
+
+    train = pd.DataFrame({"age": [20.0, 30.0, 40.0, 60.0], "hours": [10.0, 40.0, 40.0, 50.0],
+                          "sex_Male": [1, 0, 1, 0]})
+    # 80 is above the training maximum, so train-only scaling maps it above 1
+    test = pd.DataFrame({"age": [30.0, 80.0], "hours": [20.0, 50.0], "sex_Male": [0, 1]})
+    out = call(namespace, "rescale", train.copy(), test.copy())
+    if not _pair_of_frames(checks, "rescale", out):
+        return
+    train_out, test_out = out
+    ranges = {c: (float(train_out[c].min()), float(train_out[c].max())) for c in ("age", "hours") if c in train_out}
+    checks.add("continuous training columns span [0, 1]",
+               len(ranges) == 2 and all(math.isclose(lo, 0, abs_tol=1e-6) and math.isclose(hi, 1, abs_tol=1e-6)
+                                        for lo, hi in ranges.values()),
+               f"ranges {ranges}")
+    checks.add("shape is kept", train_out.shape == train.shape and test_out.shape == test.shape,
+               f"train {train_out.shape}, test {test_out.shape}")
+    if "age" in test_out:
+        checks.soft("test set is scaled with training-set minimum and maximum",
+                    math.isclose(float(test_out["age"].iloc[1]), 1.5, rel_tol=1e-6),
+                    f"test age 80 became {float(test_out['age'].iloc[1])}, expected 1.5")
+
+
+def check_shallow_net(namespace, checks):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.random((120, 4)), columns=[f"x{i}" for i in range(4)])
+    labels = (X["x0"] + X["x1"] > 1).astype(int) + (X["x2"] > 0.8).astype(int)
+    y = pd.get_dummies(labels).astype(float)
+    y.columns = [f"class_{c}" for c in y.columns]
+    model = call(namespace, "train_shallow_net_class", X, y)
+    if not checks.add("returns a model with predict and evaluate",
+                      hasattr(model, "predict") and hasattr(model, "evaluate"), f"returned {type(model).__name__}"):
+        return
+    predictions = np.asarray(model.predict(X, verbose=0))
+    checks.add("predicts one probability per class", predictions.shape == (len(X), y.shape[1]),
+               f"prediction shape {predictions.shape}")
+
+    dense = [layer for layer in getattr(model, "layers", []) if hasattr(layer, "units")]
+    expected_units = round(math.sqrt(X.shape[1] * y.shape[1]))
+    activation = lambda layer: getattr(getattr(layer, "activation", None), "__name__", "")
+    checks.soft("one hidden layer of round(sqrt(Di * Do)) units",
+                len(dense) == 2 and dense[0].units == expected_units,
+                f"dense layer units {[layer.units for layer in dense]}, expected [{expected_units}, {y.shape[1]}]")
+    checks.soft("ReLU hidden and softmax output", len(dense) == 2 and activation(dense[0]) == "relu"
+                and activation(dense[-1]) == "softmax", f"activations {[activation(layer) for layer in dense]}")
+    loss = getattr(model, "loss", "")
+    loss = loss if isinstance(loss, str) else getattr(loss, "name", type(loss).__name__)
+    checks.soft("categorical cross-entropy loss", "categorical" in loss.lower() and "entropy" in loss.lower(),
+                f"loss {loss}")
+    checks.soft("Adam optimiser", type(getattr(model, "optimizer", None)).__name__ == "Adam",
+                f"optimiser {type(getattr(model, 'optimizer', None)).__name__}")
+    history = getattr(getattr(model, "history", None), "history", {}) or {}
+    epochs = len(next(iter(history.values()), []))
+    checks.soft("30 epochs with a validation split", epochs == 30 and "val_accuracy" in history,
+                f"{epochs} epoch(s), history keys {sorted(history)}")
+
+
+TREE_MODELS = [
+    ("train_classification_tree", "DecisionTreeClassifier"),
+    ("train_bagging", "BaggingClassifier"),
+    ("train_random_forest", "RandomForestClassifier"),
+    ("train_adaboost", "AdaBoostClassifier"),
+]
+
+
+def check_tree_models(namespace, checks):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.random((200, 5)), columns=[f"x{i}" for i in range(5)])
+    y = np.ravel((X["x0"] + 0.5 * X["x3"] > 0.75).astype(int))
+    for function, expected in TREE_MODELS:
+        model = call(namespace, function, X, y)
+        try:
+            accuracy = float(np.mean(np.asarray(model.predict(X)) == y))
+        except Exception as e:
+            checks.add(f"{function} returns a fitted classifier", False, f"predict failed: {type(e).__name__}: {e}")
+            continue
+        checks.add(f"{function} returns a fitted classifier", accuracy > 0.7, f"training accuracy {accuracy:.2f}")
+        checks.soft(f"{function} returns a {expected}", type(model).__name__ == expected,
+                    f"returned {type(model).__name__}")
+        params = model.get_params() if hasattr(model, "get_params") else {}
+        if expected in ("DecisionTreeClassifier", "RandomForestClassifier"):
+            checks.soft(f"{function} uses random_state=42", params.get("random_state") == 42,
+                        f"random_state={params.get('random_state')}")
+        if expected in ("BaggingClassifier", "AdaBoostClassifier"):
+            base = params.get("estimator") or params.get("base_estimator")
+            checks.soft(f"{function} uses decision trees as base learners",
+                        type(base).__name__ == "DecisionTreeClassifier", f"base learner {type(base).__name__}")
+
+
+# Sub-task id -> harness; the parent reads the keys to know which sub-tasks can be executed
+CHECKS = {
+    "1.1": check_missing_data,
+    "1.2": check_encoding,
+    "1.3": check_rescale,
+    "2.1": check_shallow_net,
+    "2.2": check_tree_models,
+}
+
+
+def apply_limits(limits):
+    """CPU seconds, address space and file size limits for this process (where the platform has them)."""
+    try:
+        import resource
+    except ImportError:
+        return
+    cpu = int(limits.get("cpu_seconds") or 0)
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    memory = int(limits.get("memory_mb") or 0)
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory * 1024 * 1024,) * 2)
+    files = int(limits.get("file_mb") or 0)
+    if files:
+        resource.setrlimit(resource.RLIMIT_FSIZE, (files * 1024 * 1024,) * 2)
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def run_job(job):
+    check = CHECKS.get(job["task_id"])
+    if check is None:
+        return {"status": "error", "checks": [], "error": f"no harness for task {job['task_id']}"}
+    namespace = {"__name__": "__student__"}
+    notes = []
+    # Whatever the student's code prints goes to stderr
+    with redirect_stdout(sys.stderr):
+        for statement in job.get("imports", []):
+            try:
+                exec(statement, namespace)
+            except Exception as e:
+                notes.append(f"{statement}: {type(e).__name__}: {e}")
+        try:
+            exec(compile(job["code"], "<student>", "exec"), namespace)
+        except Exception as e:
+            return {"status": "error", "checks": [], "error": f"code does not run: {type(e).__name__}: {e}"}
+
+        checks = Checks()
+        try:
+            check(namespace, checks)
+        except Inconclusive as e:
+            return {"status": "error", "checks": checks.items, "error": str(e)}
+        except ImportError as e:
+            # The harness's own pandas/sklearn/TensorFlow import
+            return {"status": "error", "checks": checks.items, "error": f"harness dependency missing: {e}"}
+        except StudentError as e:
+            checks.add("runs on valid input", False, str(e))
+        except MemoryError:
+            return {"status": "error", "checks": checks.items, "error": "memory limit reached"}
+        except Exception as e:
+            # The harness itself could not handle what the function returned
+            return {"status": "error", "checks": checks.items, "error": f"harness failed: {type(e).__name__}: {e}"}
+    result = {"status": "ok", "checks": checks.items}
+    if notes:
+        result["notes"] = notes
+    return result
+
+
+def main():
+    job = json.load(sys.stdin)
+    # Kept out of the job the student's code runs next to
+    result_fd = job.pop("result_fd", None)
+    nonce = job.pop("nonce", "")
+    apply_limits(job.get("limits", {}))
+    result = run_job(job)
+    line = f"{RESULT_MARKER}{nonce} {json.dumps(result, default=str)}\n"
+    if result_fd is None:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    else:
+        with os.fdopen(result_fd, "w") as f:
+            f.write(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Splits the rubric into groups of sub-tasks that are evaluated concurrently.
+
+The bulk prompt asks for every sub-task in one generation. Each student then
+waits on the longest output, and a truncated response loses everything after
+the cut. In grouped evaluation each group is its own, smaller request:
+
+- All sub-tasks with extracted code form one group. It is sent the code only.
+- The remaining (report) sub-tasks are grouped by section: 3.1 on its own,
+  then 3.2.x, 3.3.x and so on. These groups are sent the notebook or PDF, and
+  no code.
+
+Every group gets an output budget sized to its number of sub-tasks. The
+results are merged back into one list in rubric order.
+"""
+
+from dataclasses import dataclass
+
+# Room for one {"task_id", "marks_awarded", "max_marks", "feedback", "issues"} item
+OUTPUT_TOKENS_PER_TASK = 256
+OUTPUT_TOKENS_OVERHEAD = 128
+
+
+@dataclass
+class TaskGroup:
+    name: str
+    task_ids: list
+    needs_code: bool
+
+    def output_budget(self, per_task=OUTPUT_TOKENS_PER_TASK):
+        return OUTPUT_TOKENS_OVERHEAD + per_task * len(self.task_ids)
+
+
+def section_of(task_id):
+    """'3.2.1' -> '3.2'. Two-part ids belong to their top-level task ('3.1' -> '3')."""
+    parts = task_id.split(".")
+    return ".".join(parts[:2] if len(parts) > 2 else parts[:1])
+
+
+def split_task_groups(rubric, task_functions):
+    """The rubric's evaluation groups, in rubric order; task_functions is {task_id: [function names]}."""
+    code_ids = []
+    sections = {}
+    for group in rubric.get("tasks", []):
+        for sub in group.get("sub_tasks", []):
+            t_id = sub["sub_task_id"]
+            if t_id in task_functions:
+                code_ids.append(t_id)
+            else:
+                sections.setdefault(section_of(t_id), []).append(t_id)
+    groups = [TaskGroup("code", code_ids, needs_code=True)] if code_ids else []
+    groups.extend(TaskGroup(f"Task {section}", ids, needs_code=False) for section, ids in sections.items())
+    return groups
+
+
+def narrow_groups(groups, task_ids):
+    """The groups cut down to task_ids (e.g. the sub-tasks still to grade). Empty groups are dropped."""
+    task_ids = set(task_ids)
+    narrowed = []
+    for group in groups:
+        ids = [t_id for t_id in group.task_ids if t_id in task_ids]
+        if ids:
+            narrowed.append(TaskGroup(group.name, ids, group.needs_code))
+    return narrowed
+
+
+def merge_results(result_lists, task_order):
+    """
+    Concatenates lists of task results and sorts them into task_order.
+    A task that appears more than once keeps its first result. Unknown task ids go last.
+    """
+    order = {t_id: n for n, t_id in enumerate(task_order)}
+    merged = {}
+    for results in result_lists:
+        for result in results:
+            merged.setdefault(result.get("task_id"), result)
+    return sorted(merged.values(), key=lambda r: order.get(r.get("task_id"), len(order)))
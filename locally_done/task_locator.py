@@ -0,0 +1,148 @@
+"""
+Locates the functions each task asks for in a student's notebook.
+
+Every code cell is parsed once and all of its top-level function and class
+definitions are indexed by name, so finding the code for every task is a
+dictionary lookup instead of a substring scan per (cell, task) pair. The
+exact source span of each definition is returned rather than the whole cell,
+which keeps unrelated code out of the prompt and copes with students who put
+several functions in one cell.
+
+Cells that are not valid Python (IPython magics, shell escapes, half-finished
+code) fall back to an indentation-based scan for `def`/`class` lines.
+
+The function names per task come from Assignment_2_Questions.json: the
+`def name(...)` stubs that appear in the "This cell will be assessed" parts
+of each sub-task description.
+"""
+
+import ast
+import re
+from dataclasses import dataclass
+
+_DEF_STUB = re.compile(r"\bdef\s+(\w+)\s*\(")
+_ASSESSED = re.compile(r"This cell will be assessed")
+_NOT_ASSESSED = re.compile(r"This cell has no code to write|Do not change the code")
+_MAGIC_LINE = re.compile(r"^\s*[%!]")
+_TOP_LEVEL_DEF = re.compile(r"^(?:async\s+def|def|class)\s+(\w+)")
+
+
+@dataclass
+class Definition:
+    name: str
+    kind: str  # "function" or "class"
+    source: str
+    cell_index: int
+    lineno: int
+
+
+def assessed_functions(description):
+    """Function names stubbed out in the assessed cells of a question description."""
+    markers = sorted(
+        [(m.start(), True) for m in _ASSESSED.finditer(description)]
+        + [(m.start(), False) for m in _NOT_ASSESSED.finditer(description)]
+    )
+    names = []
+    for n, (start, assessed) in enumerate(markers):
+        if not assessed:
+            continue
+        end = markers[n + 1][0] if n + 1 < len(markers) else len(description)
+        for name in _DEF_STUB.findall(description[start:end]):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def derive_task_functions(questions, task_ids=None):
+    """
+    Maps each sub-task id in the questions file to the function names it asks for.
+    Only sub-tasks in task_ids (e.g. the rubric's ids) are kept when given.
+    """
+    task_functions = {}
+
+    def walk(node):
+        for sub in node.get("subtasks") or []:
+            names = assessed_functions(sub.get("description", ""))
+            if names and (task_ids is None or sub.get("id") in task_ids):
+                task_functions[sub["id"]] = names
+            walk(sub)
+
+    for task in questions.get("tasks", []):
+        walk(task)
+    return task_functions
+
+
+def _parse_tolerant(source):
+    """Parses a cell, blanking IPython magic/shell lines (line numbers are preserved)."""
+    try:
+        return ast.parse(source)
+    except SyntaxError:
+        pass
+    cleaned = "\n".join("" if _MAGIC_LINE.match(line) else line for line in source.split("\n"))
+    try:
+        return ast.parse(cleaned)
+    except SyntaxError:
+        return None
+
+
+def _scan_definitions(source):
+    """Fallback for unparsable cells: a top-level def/class runs until the next unindented line."""
+    lines = source.split("\n")
+    found = []
+    for i, line in enumerate(lines):
+        match = _TOP_LEVEL_DEF.match(line)
+        if not match:
+            continue
+        end = i + 1
+        while end < len(lines):
+            nxt = lines[end]
+            if nxt.strip() and not nxt[0].isspace() and not nxt.lstrip().startswith("#") and not nxt.startswith(")"):
+                break
+            end += 1
+        while end > i + 1 and not lines[end - 1].strip():
+            end -= 1
+        kind = "class" if line.startswith("class") else "function"
+        found.append((match.group(1), kind, "\n".join(lines[i:end]), i + 1))
+    return found
+
+
+def cell_definitions(source):
+    """Yields (name, kind, source span, first line) for each top-level definition in a cell."""
+    tree = _parse_tolerant(source)
+    if tree is None:
+        yield from _scan_definitions(source)
+        return
+
+    lines = source.split("\n")
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            kind = "function"
+        elif isinstance(node, ast.ClassDef):
+            kind = "class"
+        else:
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        span = "\n".join(lines[start - 1:node.end_lineno])
+        yield node.name, kind, span, start
+
+
+class TaskLocator:
+    """Single pass over code cells that collects the definitions tasks ask for."""
+
+    def __init__(self, task_functions):
+        self.task_functions = task_functions
+        self.definitions = {}
+
+    def add_cell(self, source, cell_index=0):
+        # Later definitions replace earlier ones, as they would when the notebook runs
+        for name, kind, span, lineno in cell_definitions(source):
+            self.definitions[name] = Definition(name, kind, span, cell_index, lineno)
+
+    def tasks(self):
+        """Returns {task_id: source} with the spans of every function found for the task."""
+        extracted = {}
+        for task_id, names in self.task_functions.items():
+            spans = [self.definitions[name].source for name in names if name in self.definitions]
+            if spans:
+                extracted[task_id] = "\n\n".join(spans)
+        return extracted
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Tests for the synthetic cohort generator and benchmark report.
+"""
+
+import json
+import random
+
+import pytest
+
+from benchmark import format_report, generate_cohort, load_task_functions, make_png, run_level, summarize_level
+from notebook_reader import OmittedPayload, iter_notebook_cells
+from task_locator import TaskLocator
+
+
+def test_png_is_well_formed():
+    png = make_png(16, 8, random.Random(1))
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    assert png[12:16] == b"IHDR" and png.endswith(b"IEND\xaeB`\x82")
+
+
+def test_cohort_defines_every_assessed_function(tmp_path):
+    task_functions = load_task_functions()
+    paths = generate_cohort(str(tmp_path), 3, task_functions, cells=12, plot_density=1.0, image_kb=4)
+    assert len(paths) == 3
+
+    for path in paths:
+        locator = TaskLocator(task_functions)
+        images = 0
+        for index, cell in enumerate(iter_notebook_cells(path)):
+            if cell["cell_type"] == "code":
+                locator.add_cell("".join(cell["source"]), index)
+                images += sum(isinstance(o.get("data", {}).get("image/png"), OmittedPayload) for o in cell["outputs"])
+        assert set(locator.tasks()) == set(task_functions)
+        assert images == 8
+
+
+def test_cohort_is_reproducible(tmp_path):
+    task_functions = load_task_functions()
+    first = generate_cohort(str(tmp_path / "a"), 1, task_functions, seed=7, cells=6)
+    second = generate_cohort(str(tmp_path / "b"), 1, task_functions, seed=7, cells=6)
+    with open(first[0]) as a, open(second[0]) as b:
+        assert json.load(a) == json.load(b)
+
+
+def test_level_summary_and_report(tmp_path):
+    metrics_path = tmp_path / "m.jsonl"
+    with open(metrics_path, "w") as f:
+        for n, status in enumerate(["ok", "ok", "failed"]):
+            f.write(json.dumps({"student": str(n), "status": status, "stages": {"generate": n + 1.0}}) + "\n")
+
+    row = summarize_level(4, 60.0, str(metrics_path), 204800)
+    assert (row["graded"], row["failed"]) == (2, 1)
+    assert row["students_per_min"] == 2.0
+    assert row["stages"]["generate"] == (2.0, 3.0)
+    assert row["peak_rss_mb"] == 200
+
+    report = format_report([row])
+    assert "generate p50/p95" in report
+    assert report.split("\n")[1].split()[:4] == ["4", "2", "1", "2.0"]
+
+
+def test_crashed_run_is_not_reported(tmp_path):
+    # Needs the full grading environment in the child (dotenv, ...)
+    pytest.importorskip("evaluate_submissions")
+    cohort = tmp_path / "cohort"
+    generate_cohort(str(cohort), 1, load_task_functions(), cells=4)
+    with pytest.raises(RuntimeError, match="did not finish"):
+        run_level(str(cohort), 1, str(tmp_path), {}, extra_env={"GRADING_RUBRIC": str(tmp_path / "missing.json"),
+                                                                "RENDER_SERVER": "0"})
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the Gemini backend layer, using the local fake backend.
+"""
+
+import json
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import gemini_client
+from gemini_client import FakeAPIError, FakeBackend, GoogleGenAIBackend
+
+
+def test_fake_backend_awards_every_rubric_sub_task():
+    with open("Assignment_2_Rubric.json", "r") as f:
+        rubric = json.load(f)
+    prompt = "RUBRIC:\n" + json.dumps(rubric, indent=2)
+
+    text = FakeBackend().generate("gemini-1.5-pro", "sys", {}, [prompt])
+    results = json.loads(text)["results"]
+
+    assert [r["task_id"] for r in results][:3] == ["1.1", "1.2", "1.3"]
+    assert sum(r["marks_awarded"] for r in results) == rubric["total_marks"]
+
+
+def test_fake_files_go_through_processing():
+    backend = FakeBackend(processing_polls=1)
+    remote = backend.upload_file("a.pdf")
+    assert remote.state.name == "PROCESSING"
+    assert backend.get_file(remote.name).state.name == "ACTIVE"
+
+
+def test_google_backend_configures_once_and_caches_models(monkeypatch):
+    built = []
+    configured = []
+
+    class FakeModel:
+        def __init__(self, name, system_instruction=None, generation_config=None):
+            built.append((name, system_instruction))
+
+        def generate_content(self, contents):
+            return SimpleNamespace(text="{}")
+
+    genai = SimpleNamespace(configure=lambda api_key: configured.append(api_key), GenerativeModel=FakeModel)
+    google = SimpleNamespace(generativeai=genai)
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+
+    backend = GoogleGenAIBackend(api_key="key")
+    threads = [threading.Thread(target=backend.generate, args=("m", "sys", {"a": 1}, ["p"])) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    backend.generate("m", "other sys", {"a": 1}, ["p"])
+
+    assert configured == ["key"]
+    assert built == [("m", "sys"), ("m", "other sys")]
+
+
+def test_backend_selected_from_environment(monkeypatch):
+    monkeypatch.setenv("GEMINI_BACKEND", "fake")
+    gemini_client.set_backend(None)
+    try:
+        assert isinstance(gemini_client.get_backend(), FakeBackend)
+    finally:
+        gemini_client.set_backend(None)
+
+
+def test_fake_backend_simulates_errors_and_rate_limits():
+    backend = FakeBackend(rpm_limit=2)
+    backend.generate("m", "sys", {}, ["a"])
+    backend.generate("m", "sys", {}, ["b"])
+    with pytest.raises(FakeAPIError) as excinfo:
+        backend.generate("m", "sys", {}, ["c"])
+    assert excinfo.value.code == 429
+    assert backend.rate_limited == 1
+
+    failing = FakeBackend(error_rate=1.0)
+    with pytest.raises(FakeAPIError) as excinfo:
+        failing.generate("m", "sys", {}, ["a"])
+    assert excinfo.value.code == 500
+    assert failing.errors == 1
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for memoised grades of identical task implementations.
+"""
+
+from grade_memo import GradeMemo, grading_version, normalized_ast_hash
+
+RESCALE = '''
+def rescale(df, columns):
+    """Min-max scaling."""
+    for c in columns:
+        df[c] = (df[c] - df[c].min()) / (df[c].max() - df[c].min())
+    return df
+'''
+
+# Same implementation: other spacing, comments, and no docstring
+RESCALE_REFORMATTED = '''
+def rescale(df,columns):
+    # scale every column to [0, 1]
+    for c in columns:
+
+        df[c] = (df[c]-df[c].min()) / (df[c].max()-df[c].min())   # min-max
+    return df
+'''
+
+
+def test_hash_ignores_layout_comments_and_docstrings():
+    assert normalized_ast_hash(RESCALE) == normalized_ast_hash(RESCALE_REFORMATTED)
+    assert normalized_ast_hash(RESCALE) != normalized_ast_hash(RESCALE.replace("min()) /", "mean()) /"))
+    assert normalized_ast_hash("def rescale(df:\n    return") is None
+
+
+def test_memo_reuses_grades_only_for_the_same_version(tmp_path):
+    memo = GradeMemo(str(tmp_path / "memo.sqlite3"))
+    code = normalized_ast_hash(RESCALE)
+    v1 = grading_version("subtask-a", "system prompt", "model")
+    v2 = grading_version("subtask-b", "system prompt", "model")
+    result = {"task_id": "1.3", "marks_awarded": 0.5, "max_marks": 0.5, "feedback": "Correct.", "issues": []}
+
+    assert memo.get("1.3", code, v1) is None
+    memo.put("1.3", code, v1, result, student="alice.ipynb")
+    # The first grade for an implementation is the one kept
+    memo.put("1.3", code, v1, dict(result, marks_awarded=0.0), student="bob.ipynb")
+
+    assert memo.get("1.3", normalized_ast_hash(RESCALE_REFORMATTED), v1) == result
+    assert memo.get("1.3", code, v2) is None
+    assert memo.get("1.2", code, v1) is None
+    assert memo.hits == 1 and memo.stored == 1
+    assert "1 hit(s)" in memo.summary()
+    memo.close()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the grademind-local command line.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import grademind_cli
+from results_store import ResultsStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_help_loads_no_grading_modules():
+    # What `grademind-local --help` costs a script that shells out per student
+    code = ("import sys, grademind_cli\n"
+            "try:\n    grademind_cli.main(['--help'])\nexcept SystemExit:\n    pass\n"
+            "heavy = {'evaluate_submissions', 'google.generativeai', 'pandas', 'docx', 'PyPDF2', 'PIL', 'pikepdf'}\n"
+            "print(sorted(heavy & set(sys.modules)))\n")
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True).stdout
+    assert "grade" in out and "extract-questions" in out
+    assert out.strip().splitlines()[-1] == "[]"
+
+
+def test_report_prints_the_stored_results(tmp_path, capsys):
+    db = str(tmp_path / "results.sqlite3")
+    store = ResultsStore(db)
+    store.add("4473", {"Student": "a.ipynb", "Total Marks": 7, "Overall Feedback": "ok", "Task 1.1 Marks": 7})
+    store.close()
+
+    assert grademind_cli.main(["report", "--db", db, "--cohort", "4473"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Student,Total Marks,Overall Feedback,Task 1.1 Marks"
+    assert lines[1] == "a.ipynb,7.0,ok,7.0"
+
+
+def test_grade_options_become_settings(monkeypatch):
+    calls = []
+    evaluate_submissions = type(sys)("evaluate_submissions")
+    evaluate_submissions.main = lambda dirs: calls.append((dirs, os.environ["GRADING_OUTPUT"])) or {"failed": 1}
+    monkeypatch.setitem(sys.modules, "evaluate_submissions", evaluate_submissions)
+    for name in grademind_cli.GRADE_SETTINGS.values():
+        # Removed again when the test ends
+        monkeypatch.delenv(name, raising=False)
+
+    assert grademind_cli.main(["grade", "4470", "-o", "out.csv", "--backend", "fake"]) == 1
+    assert calls == [(["4470"], "out.csv")] and os.environ["GEMINI_BACKEND"] == "fake"
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-student grading metrics.
+"""
+
+import json
+import threading
+
+import metrics
+from metrics import MetricsRecorder, StudentMetrics, percentile
+from response_cache import ResponseCache
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_helpers_only_touch_the_bound_record(tmp_path):
+    recorder = MetricsRecorder(str(tmp_path / "m.jsonl"))
+    rec = recorder.new("alice.ipynb")
+
+    # Nothing bound: calls are no-ops
+    metrics.incr("api_calls")
+    with metrics.timed("generate"):
+        pass
+
+    with metrics.bound(rec):
+        with metrics.timed("generate"):
+            pass
+        with metrics.timed("generate"):
+            pass
+        metrics.incr("api_calls")
+        metrics.incr("api_calls")
+        metrics.record(prompt_tokens=120)
+
+        seen = []
+        other = threading.Thread(target=lambda: seen.append(metrics.current()))
+        other.start()
+        other.join()
+
+    assert metrics.current() is None
+    assert seen == [None]
+    assert rec.counters == {"api_calls": 2}
+    assert rec.fields == {"prompt_tokens": 120}
+    assert set(rec.stages) == {"generate"}
+    recorder.close()
+
+
+def test_finish_appends_jsonl_and_summarises(tmp_path):
+    path = tmp_path / "m.jsonl"
+    recorder = MetricsRecorder(str(path))
+    for name, status in [("a", "ok"), ("b", "ok"), ("c", "failed")]:
+        rec = recorder.new(name)
+        rec.stages["convert"] = 1.0
+        rec.counters["retries"] = 1
+        recorder.finish(rec, status)
+    recorder.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [l["student"] for l in lines] == ["a", "b", "c"]
+    assert lines[2]["status"] == "failed"
+    assert lines[0]["stages"] == {"convert": 1.0}
+    assert lines[0]["retries"] == 1
+
+    summary = recorder.summary()
+    assert "2 graded, 1 failed" in summary
+    assert "convert" in summary and "p95" in summary
+    assert "retries=3" in summary
+
+
+def test_cache_hits_are_counted_on_the_bound_record(tmp_path):
+    cache = ResponseCache(str(tmp_path / "r.sqlite3"))
+    recorder = MetricsRecorder(str(tmp_path / "m.jsonl"))
+    rec = recorder.new("alice.ipynb")
+    with metrics.bound(rec):
+        cache.get_or_compute("k", lambda: "{}")
+        cache.get_or_compute("k", lambda: "{}")
+    assert rec.counters == {"response_cache_hits": 1}
+    cache.close()
+    recorder.close()
+
+
+def test_absorb_folds_a_group_record_into_the_student():
+    student, group = StudentMetrics("a"), StudentMetrics("a")
+    student.counters["api_calls"] = 1
+    student.fields.update(prompt_tokens=100, first_result_seconds=2.0)
+    group.counters.update(api_calls=1, retries=2)
+    group.fields.update(prompt_tokens=50, first_result_seconds=0.5, model="m")
+    student.absorb(group)
+    assert student.counters == {"api_calls": 2, "retries": 2}
+    assert student.fields == {"prompt_tokens": 150, "first_result_seconds": 0.5, "model": "m"}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Tests for taking plot images straight from notebook outputs.
+"""
+
+import base64
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from notebook_images import ImageCollector, extract_images, images_sha256
+from prompt_compiler import PromptCompiler
+
+PLOT = os.urandom(20000)
+HEATMAP = os.urandom(8000)
+
+
+def _b64_lines(data):
+    """base64 split into 76-character lines, as some notebook writers store it."""
+    text = base64.b64encode(data).decode("ascii")
+    return [text[i:i + 76] + "\n" for i in range(0, len(text), 76)]
+
+
+def _write_notebook(tmp_path, cells):
+    path = tmp_path / "nb.ipynb"
+    path.write_text(json.dumps({"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}), encoding="utf-8")
+    return str(path)
+
+
+def _code(source, *images):
+    outputs = [{"output_type": "stream", "name": "stdout", "text": ["done\n"]}]
+    for mime, payload in images:
+        outputs.append({"output_type": "display_data", "metadata": {},
+                        "data": {mime: payload, "text/plain": ["<Figure size 640x480>"]}})
+    return {"cell_type": "code", "execution_count": 1, "metadata": {}, "source": source, "outputs": outputs}
+
+
+def test_images_are_extracted_and_deduplicated(tmp_path):
+    path = _write_notebook(tmp_path, [
+        {"cell_type": "markdown", "metadata": {}, "source": "## Task 3.1"},
+        _code("plt.plot(x)", ("image/png", base64.b64encode(PLOT).decode("ascii"))),
+        _code("sns.heatmap(m)", ("image/jpeg", _b64_lines(HEATMAP))),
+        # The same plot shown again is not attached twice
+        _code("plt.plot(x)", ("image/png", _b64_lines(PLOT))),
+    ])
+    out_dir = str(tmp_path / "images")
+
+    images = extract_images(path, out_dir)
+
+    assert [(i.figure, i.cell_index, i.mime) for i in images] == [(1, 1, "image/png"), (2, 2, "image/jpeg")]
+    assert images[0].read() == PLOT and images[1].read() == HEATMAP
+    assert images[1].path.endswith(".jpg")
+    # Only the content-addressed images are left behind
+    assert sorted(os.listdir(out_dir)) == sorted(os.path.basename(i.path) for i in images)
+    assert images_sha256(images) == images_sha256(extract_images(path, out_dir))
+
+
+def test_same_plot_written_by_concurrent_workers(tmp_path):
+    path = _write_notebook(tmp_path, [_code("plt.plot(x)", ("image/png", base64.b64encode(PLOT).decode("ascii")))])
+    out_dir = str(tmp_path / "images")
+    with ThreadPoolExecutor(8) as pool:
+        found = list(pool.map(lambda _: extract_images(path, out_dir), range(32)))
+    assert all(len(images) == 1 and images[0].read() == PLOT for images in found)
+    assert len(os.listdir(out_dir)) == 1
+
+    # Another size limit is stored (and attached) separately
+    other, = extract_images(path, out_dir, max_side=512)
+    assert other.path != found[0][0].path and images_sha256([other]) != images_sha256(found[0])
+
+
+def test_figures_are_noted_under_their_cells(tmp_path):
+    # Needs the full grading environment (pandas, dotenv, ...)
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+
+    path = _write_notebook(tmp_path, [
+        _code("plt.plot(x)", ("image/png", base64.b64encode(PLOT).decode("ascii"))),
+        _code("plt.plot(x)", ("image/png", base64.b64encode(PLOT).decode("ascii"))),
+        _code("print(1)"),
+    ])
+    with ImageCollector(str(tmp_path / "images")) as collector:
+        _, text = evaluate_submissions.extract_code_from_notebook(path, {}, images=collector)
+    assert len(collector.images) == 1
+    assert text.count("[Output: Figure 1 attached]") == 2
+
+    _, plain = evaluate_submissions.extract_code_from_notebook(path, {})
+    assert "Figure" not in plain and plain == text.replace("[Output: Figure 1 attached]\n", "")
+
+
+def test_failed_image_upload_fails_the_upload_stage(tmp_path, monkeypatch):
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+    from run_ledger import RunLedger
+
+    path = _write_notebook(tmp_path, [
+        _code("plt.plot(x)", ("image/png", base64.b64encode(PLOT).decode("ascii"))),
+        _code("sns.heatmap(m)", ("image/png", base64.b64encode(HEATMAP).decode("ascii"))),
+    ])
+    images = extract_images(path, str(tmp_path / "images"))
+    # The first figure goes inline, the second needs an upload, which fails
+    monkeypatch.setattr(evaluate_submissions, "IMAGE_INLINE_MAX_MB", len(PLOT) / (1024 * 1024))
+    monkeypatch.setattr(evaluate_submissions, "upload_to_gemini", lambda *args, **kwargs: None)
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+    ledger.begin("nb.ipynb", path, "hash")
+    ledger.record("nb.ipynb", "converted")
+    job = {"filename": "nb.ipynb", "file_path": path, "pdf_path": None, "images": images, "done_stage": "converted"}
+
+    assert evaluate_submissions.upload_stage({"ledger": ledger}, job) is None
+    entry = ledger.get("nb.ipynb")
+    assert entry["stage"] == "converted" and entry["error"] == "Image upload failed"
+
+
+def test_notebook_without_images_has_no_attachment(tmp_path):
+    path = _write_notebook(tmp_path, [_code("print(1)"), {"cell_type": "markdown", "metadata": {}, "source": "x"}])
+    assert extract_images(path, str(tmp_path / "images")) == []
+
+
+def test_image_count_is_capped(tmp_path):
+    path = _write_notebook(tmp_path, [
+        _code("plot", ("image/png", base64.b64encode(os.urandom(500)).decode("ascii"))) for _ in range(5)])
+    with open(path, encoding="utf-8") as f:
+        cells = json.load(f)["cells"]
+    with ImageCollector(str(tmp_path / "images"), max_images=3) as collector:
+        for index, cell in enumerate(cells):
+            collector.add_cell(index, cell)
+    assert len(collector.images) == 3 and collector.skipped == 2
+
+
+def test_large_plots_are_downscaled(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    buf = io.BytesIO()
+    Image.effect_noise((2400, 1200), 40).convert("RGB").save(buf, "PNG")
+    path = _write_notebook(tmp_path, [_code("plot", ("image/png", base64.b64encode(buf.getvalue()).decode("ascii")))])
+
+    image, = extract_images(path, str(tmp_path / "images"), max_side=600)
+    with Image.open(image.path) as small:
+        assert small.size == (600, 300)
+    assert image.size < image.original_size
+
+
+def test_prompt_points_at_the_attached_figures():
+    compiler = PromptCompiler({"tasks": []})
+    compiled = compiler.compile({}, "--- [CODE CELL] ---\nplt.plot(x)\n[Output: Figure 1 attached]\n",
+                                is_pdf_available=False, image_count=2)
+    assert "attached as 2 image(s)" in compiled.text and "[Output: Figure 1 attached]" in compiled.text
+    assert compiled.sections["images"] == 2 * 258
+
+    plain = compiler.compile({}, "--- [CODE CELL] ---\nprint(1)\n", is_pdf_available=False)
+    assert "image(s)" not in plain.text and "images" not in plain.sections
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming notebook reader.
+"""
+
+import base64
+import json
+import os
+
+from notebook_reader import OmittedPayload, iter_notebook_cells
+
+PNG = base64.b64encode(os.urandom(30000)).decode("ascii")
+
+
+def _write_notebook(tmp_path):
+    nb = {
+        "cells": [
+            {"cell_type": "markdown", "metadata": {}, "source": ["# Task 1\n", "Unicode é and \"quotes\" and \\ slashes\n"]},
+            {
+                "cell_type": "code",
+                "execution_count": 3,
+                "metadata": {"scrolled": True},
+                "source": "def missing_data(df):\n    return df.dropna()\n",
+                "outputs": [
+                    {"output_type": "stream", "name": "stdout", "text": ["Epoch 1\n", "Epoch 2\n"]},
+                    {"output_type": "display_data", "data": {"image/png": PNG, "text/plain": ["<Figure>"]}, "metadata": {}},
+                    {"output_type": "stream", "name": "stdout", "text": "x" * 50000},
+                ],
+            },
+            {"cell_type": "code", "execution_count": None, "metadata": {}, "source": [], "outputs": []},
+        ],
+        "metadata": {"kernelspec": {"name": "python3"}},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+    path = tmp_path / "nb.ipynb"
+    path.write_text(json.dumps(nb, indent=1), encoding="utf-8")
+    return str(path), nb
+
+
+def test_cells_match_json_load_except_large_outputs(tmp_path):
+    path, nb = _write_notebook(tmp_path)
+
+    # A tiny chunk size forces strings, escapes and numbers across chunk boundaries
+    cells = list(iter_notebook_cells(path, max_output_chars=1000, chunk_size=7))
+
+    assert len(cells) == 3
+    assert cells[0] == nb["cells"][0]
+    assert cells[1]["source"] == nb["cells"][1]["source"]
+    assert cells[1]["execution_count"] == 3
+    assert cells[2] == nb["cells"][2]
+
+    outputs = cells[1]["outputs"]
+    assert outputs[0]["text"] == ["Epoch 1\n", "Epoch 2\n"]
+    image = outputs[1]["data"]["image/png"]
+    assert isinstance(image, OmittedPayload)
+    assert image.size == len(PNG) and image.mime == "image/png"
+    assert outputs[1]["data"]["text/plain"] == ["<Figure>"]
+    assert isinstance(outputs[2]["text"], OmittedPayload)
+
+
+def test_large_outputs_can_be_offloaded(tmp_path):
+    path, _ = _write_notebook(tmp_path)
+    offload = tmp_path / "offload"
+
+    cells = list(iter_notebook_cells(path, max_output_chars=1000, offload_dir=str(offload)))
+
+    image = cells[1]["outputs"][1]["data"]["image/png"]
+    assert image.path.endswith(".b64")
+    with open(image.path, "r", encoding="utf-8") as f:
+        assert f.read() == PNG
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed PDF cache.
+"""
+
+import os
+import time
+
+from pdf_cache import PdfCache, renderer_fingerprint
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _render(cache, key, size):
+    tmp = _write(cache.temp_path_for(key), b"%PDF" + b"x" * size)
+    return cache.put(key, tmp)
+
+
+def test_hit_after_put_and_miss_on_changed_notebook(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"), fingerprint="v1")
+    nb = _write(str(tmp_path / "a.ipynb"), b'{"cells": []}')
+
+    key = cache.key_for(nb)
+    assert cache.get(key) is None
+    _render(cache, key, 10)
+    assert cache.get(key) == cache.path_for(key)
+
+    _write(nb, b'{"cells": [1]}')
+    assert cache.get(cache.key_for(nb)) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_renderer_settings_change_the_key(tmp_path):
+    nb = _write(str(tmp_path / "a.ipynb"), b'{"cells": []}')
+    a4 = PdfCache(str(tmp_path / "cache"), fingerprint=renderer_fingerprint({"format": "A4"}))
+    letter = PdfCache(str(tmp_path / "cache"), fingerprint=renderer_fingerprint({"format": "Letter"}))
+    assert a4.key_for(nb) != letter.key_for(nb)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"), max_bytes=250)
+    first = _render(cache, "a" * 64, 100)
+    second = _render(cache, "b" * 64, 100)
+    past = time.time() - 60
+    os.utime(first, (past, past))
+    os.utime(second, (past - 60, past - 60))
+
+    # "a" was used more recently than "b", so "b" goes first
+    _render(cache, "c" * 64, 100)
+
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert cache.evictions == 1
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for shrinking rendered PDFs before upload.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pdf_optimizer import PdfOptimizer, ghostscript_command
+
+# Stands in for Ghostscript: writes the input cut to a fraction of its size (or grown) to -sOutputFile
+FAKE_GS = '''#!{python}
+import sys
+args = sys.argv[1:]
+if {fail}:
+    sys.exit("gs: unrecoverable error")
+out = next(a.split("=", 1)[1] for a in args if a.startswith("-sOutputFile="))
+with open(args[-1], "rb") as f:
+    data = f.read()
+with open(out, "wb") as f:
+    f.write(data[:int(len(data) * {ratio})] if {ratio} <= 1 else data * int({ratio}))
+'''
+
+
+def _fake_gs(tmp_path, ratio=0.25, fail=False):
+    path = tmp_path / "gs"
+    path.write_text(FAKE_GS.format(python=sys.executable, ratio=ratio, fail=fail))
+    path.chmod(0o755)
+    return str(path)
+
+
+def _pdf(tmp_path, size=40000):
+    path = tmp_path / "cache" / "abc.pdf"
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"%PDF-1.4\n" + os.urandom(size))
+    return str(path)
+
+
+def test_smaller_pdf_is_stored_and_reused(tmp_path):
+    pdf = _pdf(tmp_path)
+    optimizer = PdfOptimizer(dpi=120, gs=_fake_gs(tmp_path), use_pikepdf=False)
+
+    result = optimizer.optimize(pdf)
+    assert result.path == optimizer.output_path_for(pdf) and result.path.endswith(".pdf")
+    assert result.after < result.before / 3 and result.tools == ("ghostscript",)
+    assert "(-75%, ghostscript)" in result.describe()
+
+    again = optimizer.optimize(pdf)
+    assert again.reused and again.path == result.path
+    assert optimizer.count == 2 and "2 PDF(s)" in optimizer.summary()
+    # Only the original and the optimized PDF are left; no scratch files
+    assert sorted(os.listdir(tmp_path / "cache")) == sorted(["abc.pdf", os.path.basename(result.path)])
+
+    # Other settings are a different output
+    assert PdfOptimizer(dpi=200, gs=_fake_gs(tmp_path), use_pikepdf=False).output_path_for(pdf) != result.path
+
+
+def test_original_is_kept_when_nothing_is_gained(tmp_path):
+    pdf = _pdf(tmp_path)
+    result = PdfOptimizer(gs=_fake_gs(tmp_path, ratio=2), use_pikepdf=False).optimize(pdf)
+    assert result.after == result.before
+    with open(result.path, "rb") as a, open(pdf, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_failures_and_missing_tools(tmp_path):
+    pdf = _pdf(tmp_path)
+    with pytest.raises(subprocess.CalledProcessError):
+        PdfOptimizer(gs=_fake_gs(tmp_path, fail=True), use_pikepdf=False).optimize(pdf)
+    assert os.listdir(tmp_path / "cache") == ["abc.pdf"]
+
+    none = PdfOptimizer(gs=None, use_pikepdf=False)
+    assert not none.available and none.optimize(pdf).path == pdf
+
+
+def test_ghostscript_resamples_to_the_configured_dpi():
+    cmd = ghostscript_command("gs", "in.pdf", "out.pdf", 96, 70)
+    assert "-dColorImageResolution=96" in cmd and "-dGrayImageResolution=96" in cmd
+    assert "-dJPEGQ=70" in cmd and cmd[-2:] == ["-sOutputFile=out.pdf", "in.pdf"]
+
+
+def test_blank_pages_are_dropped(tmp_path):
+    pikepdf = pytest.importorskip("pikepdf")
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                                                BaseFont=pikepdf.Name.Helvetica))
+    for text in (b"BT /F1 12 Tf 72 720 Td (Task 3.1) Tj ET", b"1 1 1 rg 0 0 612 792 re f", b"BT /F1 12 Tf (x) Tj ET"):
+        page = pdf.add_blank_page(page_size=(612, 792))
+        page.obj.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.obj.Contents = pdf.make_stream(text)
+    path = str(tmp_path / "nb.pdf")
+    pdf.save(path)
+
+    result = PdfOptimizer(gs=None, drop_blank_pages=True).optimize(path)
+    assert result.pages_dropped == 1
+    with pikepdf.open(result.path) as out:
+        assert len(out.pages) == 2
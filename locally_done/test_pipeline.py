@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the staged grading pipeline (ordering, dropping and backpressure).
+"""
+
+import threading
+import time
+
+from pipeline import Pipeline, Stage
+
+
+def test_jobs_flow_through_all_stages():
+    pipeline = Pipeline([
+        Stage("double", lambda x: x * 2, workers=3, queue_size=2),
+        Stage("inc", lambda x: x + 1, workers=2, queue_size=2),
+    ], report_interval=0)
+
+    results = pipeline.run(range(20))
+
+    assert sorted(results) == sorted(x * 2 + 1 for x in range(20))
+    stats = {s["stage"]: s for s in pipeline.stats()}
+    assert stats["double"]["processed"] == 20
+    assert stats["inc"]["processed"] == 20
+
+
+def test_none_and_errors_drop_the_job():
+    def fail_on_four(x):
+        if x == 4:
+            raise ValueError("boom")
+        return x
+
+    pipeline = Pipeline([
+        Stage("filter", lambda x: None if x % 2 else x, workers=2),
+        Stage("fail", fail_on_four, workers=1),
+    ], report_interval=0)
+
+    results = pipeline.run([0, 1, 2, 3, 4])
+
+    assert sorted(results) == [0, 2]
+    stats = {s["stage"]: s for s in pipeline.stats()}
+    assert stats["fail"]["failed"] == 1
+
+
+def test_bounded_queue_applies_backpressure():
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def fast(x):
+        with lock:
+            in_flight.append(x)
+            peak[0] = max(peak[0], len(in_flight))
+        return x
+
+    def slow(x):
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(x)
+        return x
+
+    pipeline = Pipeline([
+        Stage("fast", fast, workers=1, queue_size=1),
+        Stage("slow", slow, workers=1, queue_size=2),
+    ], report_interval=0)
+
+    pipeline.run(range(15))
+
+    # At most: queued for slow (2) + being processed (1) + waiting to be put (1)
+    assert peak[0] <= 4
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted prompt compiler.
+"""
+
+import json
+
+from prompt_compiler import PromptCompiler, estimate_tokens, split_cells, trim_text
+
+
+def _rubric():
+    with open("Assignment_2_Rubric.json", "r") as f:
+        return json.load(f)
+
+
+def _notebook(*cells):
+    return "\n".join(f"--- [{kind} CELL] ---\n{source}\n" for kind, source in cells)
+
+
+def test_prefix_is_built_once_and_shared():
+    compiler = PromptCompiler(_rubric())
+    a = compiler.compile({"1.1": "def missing_data(df): pass"}, "", is_pdf_available=True)
+    b = compiler.compile({}, "", is_pdf_available=True)
+
+    assert a.text.startswith(compiler.prefix) and b.text.startswith(compiler.prefix)
+    assert "RUBRIC:" in compiler.prefix
+    assert "Task 1.1 Code:" in a.text
+    assert a.text.endswith(compiler.instructions)
+
+
+def test_sections_add_up_to_total():
+    compiled = PromptCompiler(_rubric()).compile({"1.1": "x = 1"}, _notebook(("CODE", "print(1)")), False)
+    sections = dict(compiled.sections)
+    total = sections.pop("total")
+    assert total == sum(sections.values())
+    assert abs(total - estimate_tokens(compiled.text)) <= len(sections)
+
+
+def test_long_training_log_is_trimmed_to_head_and_tail():
+    log = "\n".join(f"Epoch {i}/500 - loss: 0.{i:03d}" for i in range(500))
+    short = trim_text(log, 100)
+    assert estimate_tokens(short) <= 110
+    assert short.startswith("Epoch 0/500")
+    assert short.endswith("Epoch 499/500 - loss: 0.499")
+    assert "lines trimmed" in short
+
+
+def test_notebook_is_shrunk_to_fit_the_budget():
+    cells = [("CODE", "\n".join(f"line {i} " * 5 for i in range(400))) for _ in range(10)]
+    compiler = PromptCompiler(_rubric(), token_budget=6000)
+
+    compiled = compiler.compile({}, _notebook(*cells), is_pdf_available=False)
+
+    assert compiled.tokens <= 6000
+    assert compiled.trimmed_cells == 10
+    assert len(split_cells(_notebook(*cells))) == 10
+
+
+def test_long_cell_is_kept_whole_when_the_notebook_fits():
+    answer = "\n".join(f"Task 3 discussion, paragraph {i}: " + "the model overfits " * 8 for i in range(60))
+    notebook = _notebook(("MARKDOWN", answer), ("CODE", "print(1)"))
+    compiler = PromptCompiler(_rubric(), token_budget=24000, max_cell_tokens=500)
+    assert estimate_tokens(answer) > 500
+
+    compiled = compiler.compile({}, notebook, is_pdf_available=False)
+
+    assert answer in compiled.text and compiled.trimmed_cells == 0
+    assert compiled.tokens <= 24000
+
+
+def test_pdf_mode_skips_notebook_text():
+    compiled = PromptCompiler(_rubric()).compile({}, _notebook(("MARKDOWN", "secret analysis")), True)
+    assert "secret analysis" not in compiled.text
+    assert "attached as a PDF" in compiled.text
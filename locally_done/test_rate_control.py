@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for Gemini rate control: token buckets, retries, AIMD and the circuit breaker.
+"""
+
+import random
+import threading
+
+import pytest
+
+from gemini_client import FakeAPIError, FakeBackend
+from rate_control import (AIMDLimiter, CircuitBreaker, RateController, TokenBucket, backoff_delay,
+                          is_rate_limit, is_retryable)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+def test_error_classification():
+    assert is_rate_limit(FakeAPIError(429, "quota")) and is_retryable(FakeAPIError(429, "quota"))
+    assert is_retryable(FakeAPIError(503, "unavailable"))
+    assert not is_retryable(FakeAPIError(400, "bad request"))
+    assert is_rate_limit(ResourceExhausted("quota"))
+    assert not is_retryable(ValueError("bad json"))
+
+
+def test_backoff_is_capped_and_jittered():
+    rng = random.Random(0)
+    delays = [backoff_delay(attempt, base=1.0, cap=8.0, rng=rng) for attempt in range(10)]
+    assert all(0 <= d <= 8.0 for d in delays)
+    assert len(set(delays)) == len(delays)
+
+
+def test_token_bucket_paces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert TokenBucket(0).acquire(10 ** 9) == 0.0
+
+
+def test_aimd_halves_on_429_and_grows_back():
+    clock = FakeClock()
+    limiter = AIMDLimiter(initial=8, maximum=8, cooldown=5.0, clock=clock)
+    limiter.acquire()
+    limiter.release(rate_limited=True)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(rate_limited=True)
+    assert limiter.limit == 4  # within the cooldown
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert 5 <= limiter.limit <= 8
+
+
+def test_aimd_blocks_beyond_limit():
+    limiter = AIMDLimiter(initial=1, maximum=1)
+    limiter.acquire()
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    waiter.start()
+    assert not acquired.wait(0.1)
+    limiter.release()
+    assert acquired.wait(1)
+    waiter.join()
+
+
+def test_breaker_opens_then_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock, sleep=clock.sleep)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.wait() == pytest.approx(30)
+    assert breaker.state == "half-open"
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.opened == 1
+
+
+def test_controller_retries_rate_limits_until_success():
+    clock = FakeClock()
+    controller = RateController(max_retries=3, sleep=clock.sleep, rng=random.Random(0))
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise FakeAPIError(429, "quota")
+        return "ok"
+
+    assert controller.call(flaky) == "ok"
+    assert controller.retries == 2 and controller.rate_limited == 2
+    assert len(clock.slept) == 2
+
+
+def test_controller_gives_up_and_skips_non_retryable():
+    clock = FakeClock()
+    controller = RateController(max_retries=2, sleep=clock.sleep, failure_threshold=100)
+    failing = FakeBackend(error_rate=1.0)
+    with pytest.raises(FakeAPIError):
+        controller.call(lambda: failing.generate("m", "s", {}, ["a"]))
+    assert failing.calls == 3
+
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise FakeAPIError(400, "invalid argument")
+
+    with pytest.raises(FakeAPIError):
+        controller.call(bad_request)
+    assert len(calls) == 1
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent Gemini response cache.
+"""
+
+import threading
+import time
+
+import pytest
+
+from response_cache import ResponseCache, make_key
+
+
+def test_key_covers_every_input():
+    base = make_key("sys", "prompt", "abc", "gemini-1.5-pro", {"response_mime_type": "application/json"})
+    assert base == make_key("sys", "prompt", "abc", "gemini-1.5-pro", {"response_mime_type": "application/json"})
+    assert base != make_key("sys", "prompt", "abd", "gemini-1.5-pro", {"response_mime_type": "application/json"})
+    assert base != make_key("sys", "prompt", "abc", "gemini-2.0-flash", {"response_mime_type": "application/json"})
+    assert base != make_key("sys2", "prompt", "abc", "gemini-1.5-pro", {"response_mime_type": "application/json"})
+
+
+def test_second_call_reads_the_store(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return '{"results": []}'
+
+    ResponseCache(path).get_or_compute("k", compute)
+    # A fresh instance, as in a restarted run
+    cache = ResponseCache(path)
+    assert cache.get_or_compute("k", compute) == '{"results": []}'
+    assert len(calls) == 1
+    assert cache.hits == 1
+
+
+def test_failures_are_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+
+    def boom():
+        raise RuntimeError("429")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", boom)
+    assert cache.get("k") is None
+
+
+def test_identical_inflight_requests_are_coalesced(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "done"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == ["done"] * 4
+    assert len(calls) == 1
+
+
+def test_evicts_expired_and_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+        time.sleep(0.01)
+    cache.get("a")
+
+    cache.evict()
+
+    assert cache.get("a") == "a"
+    assert cache.get("b") is None
+    assert cache.get("c") == "c"
+
+    cache.ttl_seconds = -1
+    assert cache.get("a") is None
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental parser that picks task results out of a streamed response.
+"""
+
+import json
+
+from gemini_client import FakeBackend
+from result_stream import ResultStreamParser
+
+
+def feed_in_chunks(parser, text, size):
+    items = []
+    for start in range(0, len(text), size):
+        items.append(parser.feed(text[start:start + size]))
+    return items
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    results = [{"task_id": "1.1", "marks_awarded": 2, "feedback": "ok"},
+               {"task_id": "1.2", "marks_awarded": 0, "feedback": "missing"}]
+    text = json.dumps({"results": results})
+    parser = ResultStreamParser()
+
+    first_end = text.index("}") + 1
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [results[0]]
+    assert parser.feed(text[first_end:]) == [results[1]]
+    assert parser.text == text and parser.items == 2
+
+
+def test_strings_and_nesting_do_not_confuse_the_parser():
+    results = [{"task_id": "2.1", "feedback": 'brace } bracket ] quote " backslash \\', "issues": ["a", {"b": [1]}]},
+               {"task_id": "2.2", "feedback": "results: [{"}]
+    text = json.dumps({"summary": "results", "results": results, "other": [{"task_id": "x"}]})
+    parser = ResultStreamParser()
+    emitted = [item for batch in feed_in_chunks(parser, text, 1) for item in batch]
+    assert emitted == results
+
+
+def test_bare_array_response():
+    parser = ResultStreamParser()
+    assert parser.feed('[{"task_id": "1"}, {"task_id": "2"}]') == [{"task_id": "1"}, {"task_id": "2"}]
+
+
+def test_fake_backend_streams_the_same_text():
+    backend = FakeBackend()
+    prompt = '"sub_task_id": "1.1", "marks": 3 "sub_task_id": "1.2", "marks": 2'
+    chunks = list(backend.generate_stream("m", "s", {}, [prompt]))
+    assert len(chunks) > 1
+    parser = ResultStreamParser()
+    emitted = [item for chunk in chunks for item in parser.feed(chunk)]
+    assert [r["task_id"] for r in emitted] == ["1.1", "1.2"]
+    assert json.loads(parser.text) == json.loads(backend.generate("m", "s", {}, [prompt]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite results store and its report exports.
+"""
+
+import csv
+
+import pytest
+
+from results_store import ResultsStore, cohort_for, task_sort_key
+
+
+def row(student, marks, feedback="Excellent work!"):
+    result = {"Student": student, "Total Marks": sum(marks.values()), "Overall Feedback": feedback}
+    result.update({f"Task {t} Marks": m for t, m in marks.items()})
+    return result
+
+
+def test_export_reproduces_the_report_layout(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite3"), batch_size=10)
+    run_id = store.start_run(model="gemini-1.5-pro", rubric_sha256="r1")
+    store.add("4470", row("b.ipynb", {"1.1": 2, "1.10": 1, "1.2": 0}),
+              task_results=[{"task_id": "1.2", "max_marks": 3, "feedback": "Missing"}], run_id=run_id)
+    store.add("4470", row("a.ipynb", {"1.1": 3, "1.10": 1, "1.2": 3}), run_id=run_id)
+    store.add("4473", row("c.ipynb", {"1.1": 1, "1.10": 0, "1.2": 1}), run_id=run_id)
+
+    out = tmp_path / "4470.csv"
+    assert store.export_csv(str(out), cohort="4470") == 2
+    with open(out, newline="") as f:
+        lines = list(csv.reader(f))
+    assert lines[0] == ["Student", "Total Marks", "Overall Feedback", "Task 1.1 Marks", "Task 1.2 Marks", "Task 1.10 Marks"]
+    assert lines[1][:2] == ["a.ipynb", "7.0"]
+    assert lines[2][3:] == ["2.0", "0.0", "1.0"]
+
+    headers, rows = store.table()
+    assert headers[0] == "Cohort" and [r[0] for r in rows] == ["4470", "4470", "4473"]
+    store.close()
+
+
+def test_regrading_replaces_rows_and_persists(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    store = ResultsStore(path, batch_size=100)
+    store.add("4470", row("a.ipynb", {"1.1": 1, "1.2": 1}), task_results=[{"task_id": "1.1", "max_marks": 3}])
+    store.add("4470", row("a.ipynb", {"1.1": 3}))
+    store.close()
+
+    store = ResultsStore(path)
+    headers, rows = store.table(cohort="4470")
+    assert rows == [["a.ipynb", 3.0, "Excellent work!", 3.0]]
+    store.close()
+
+
+def test_import_existing_report(tmp_path):
+    report = tmp_path / "4470_grading_report.csv"
+    with open(report, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Student", "Total Marks", "Overall Feedback", "Task 1.1 Marks"])
+        writer.writerow(["a.ipynb", "2", "Task 1.1 (-1.0): partial", "2"])
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    assert store.import_csv(str(report), "4470") == 1
+    assert store.cohorts() == ["4470"]
+    assert store.table("4470")[1] == [["a.ipynb", 2.0, "Task 1.1 (-1.0): partial", 2.0]]
+    store.close()
+
+
+def test_xlsx_export(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    store.add("4470", row("a.ipynb", {"1.1": 3}))
+    store.export_xlsx(str(tmp_path / "out.xlsx"))
+    sheet = openpyxl.load_workbook(tmp_path / "out.xlsx").active
+    assert [c.value for c in sheet[2]] == ["4470", "a.ipynb", 3, "Excellent work!", 3]
+    store.close()
+
+
+def test_helpers():
+    assert sorted(["2.1", "1.10", "1.2"], key=task_sort_key) == ["1.2", "1.10", "2.1"]
+    assert cohort_for("/data/4470/student.ipynb") == "4470"
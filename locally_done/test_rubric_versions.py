@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for rubric versioning and the stored results re-grades reuse.
+"""
+
+import copy
+import csv
+import json
+
+import pytest
+
+from results_store import ResultsStore
+from rubric_versions import diff_hashes, rubric_version, subset_rubric, subtask_hashes
+
+
+def load_rubric():
+    with open("Assignment_2_Rubric.json", "r") as f:
+        return json.load(f)
+
+
+def test_editing_one_sub_task_changes_only_its_hash():
+    rubric = load_rubric()
+    before = subtask_hashes(rubric)
+    edited = copy.deepcopy(rubric)
+    edited["tasks"][0]["sub_tasks"][1]["description"] += " (clarified)"
+    edited["tasks"][-1]["sub_tasks"].append({"sub_task_id": "9.9", "description": "New", "marks": 1.0})
+    after = subtask_hashes(edited)
+
+    changed, added, removed = diff_hashes(before, after)
+    assert changed == [rubric["tasks"][0]["sub_tasks"][1]["sub_task_id"]]
+    assert added == ["9.9"] and removed == []
+    assert rubric_version(before) != rubric_version(after)
+    assert rubric_version(before) == rubric_version(subtask_hashes(load_rubric()))
+
+
+def test_subset_rubric_keeps_only_requested_sub_tasks():
+    rubric = load_rubric()
+    subset = subset_rubric(rubric, ["1.2", "2.1"])
+    ids = [sub["sub_task_id"] for group in subset["tasks"] for sub in group["sub_tasks"]]
+    assert ids == ["1.2", "2.1"]
+    assert subset["total_marks"] == sum(
+        sub["marks"] for group in rubric["tasks"] for sub in group["sub_tasks"] if sub["sub_task_id"] in ids)
+    assert len(rubric["tasks"][0]["sub_tasks"]) > 1  # original untouched
+
+
+def test_stored_results_carry_their_sub_task_version(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    hashes = {"1.1": "h1", "1.2": "h2"}
+    assert store.record_rubric_version("v1", hashes) is None
+    assert store.record_rubric_version("v2", {"1.1": "h1", "1.2": "h2b"}) == hashes
+
+    row = {"Student": "a.ipynb", "Total Marks": 3, "Overall Feedback": "", "Task 1.1 Marks": 1, "Task 1.2 Marks": 2}
+    store.add("4470", row, notebook_sha256="nb", subtask_hashes=hashes,
+              task_results=[{"task_id": "1.1", "marks_awarded": 1, "max_marks": 1, "feedback": "ok"}])
+
+    stored = store.stored_results("4470", "a.ipynb", notebook_sha256="nb")
+    # 1.2 was not in the evaluation's results, so it has no version and is never reused
+    assert list(stored) == ["1.1"]
+    assert stored["1.1"]["subtask_sha256"] == "h1" and stored["1.1"]["max_marks"] == 1
+    assert store.stored_results("4470", "a.ipynb", notebook_sha256="changed") == {}
+    store.close()
+
+
+def test_results_without_versions_are_regraded(tmp_path):
+    # Needs the full grading environment (dotenv, ...)
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    hashes = {"1.1": "h1", "1.2": "h2"}
+    row = {"Student": "a.ipynb", "Total Marks": 3, "Overall Feedback": "", "Task 1.1 Marks": 1, "Task 1.2 Marks": 2}
+    # Resumed from the ledger: written without the evaluation's task results
+    store.add("4470", row, notebook_sha256="nb", subtask_hashes=hashes)
+    # Imported from an old report: no notebook hash either
+    store.add("4470", dict(row, Student="b.ipynb"))
+
+    assert store.stored_results("4470", "a.ipynb", notebook_sha256="nb") == {}
+    assert store.stored_results("4470", "b.ipynb", notebook_sha256="nb", include_unversioned=True)["1.2"][
+        "subtask_sha256"] is None
+
+    ctx = {"results_store": store, "subtask_hashes": hashes}
+    for student in ("a.ipynb", "b.ipynb"):
+        job = {"file_path": str(tmp_path / "4470" / student), "filename": student, "notebook_sha256": "nb"}
+        assert evaluate_submissions.needs_regrade(ctx, job)
+        # Nothing stored is reused, so the student is graded in full
+        assert evaluate_submissions.reusable_results(ctx, job) == {}
+
+    store.add("4470", row, notebook_sha256="nb", subtask_hashes=hashes,
+              task_results=[{"task_id": "1.1"}, {"task_id": "1.2"}])
+    job = {"file_path": str(tmp_path / "4470" / "a.ipynb"), "filename": "a.ipynb", "notebook_sha256": "nb"}
+    assert not evaluate_submissions.needs_regrade(ctx, job)
+    store.close()
+
+
+def test_report_header_follows_the_rubric(tmp_path):
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+    report = str(tmp_path / "report.csv")
+    with open(report, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Student", "Total Marks", "Overall Feedback", "Task 1.1 Marks", "Task 1.2 Marks"])
+        writer.writerow(["a.ipynb", "3", "", "1", "2"])
+
+    # 1.2 removed from the rubric, 1.3 added
+    headers = ["Student", "Total Marks", "Overall Feedback", "Task 1.3 Marks", "Task 1.1 Marks"]
+    evaluate_submissions.initialize_csv(report, headers)
+    evaluate_submissions.append_to_csv(report, {"Student": "b.ipynb", "Total Marks": 5, "Overall Feedback": "",
+                                                "Task 1.3 Marks": 4, "Task 1.1 Marks": 1}, headers)
+    evaluate_submissions.replace_csv_row(report, {"Student": "a.ipynb", "Total Marks": 6, "Overall Feedback": "",
+                                                  "Task 1.3 Marks": 5, "Task 1.1 Marks": 1}, headers)
+
+    with open(report, newline="", encoding="utf-8") as f:
+        lines = list(csv.reader(f))
+    assert lines[0] == headers
+    assert sorted(lines[1:]) == [["a.ipynb", "6", "", "5", "1"], ["b.ipynb", "5", "", "4", "1"]]
+
+
+def test_rows_appended_under_an_old_header_are_realigned(tmp_path):
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+    report = str(tmp_path / "report.csv")
+    evaluate_submissions.initialize_csv(report, ["Student", "Total Marks", "Task 1.2 Marks"])
+    headers = ["Student", "Total Marks", "Task 1.3 Marks"]
+    evaluate_submissions.append_to_csv(report, {"Student": "a.ipynb", "Total Marks": 2, "Task 1.3 Marks": 2}, headers)
+    with open(report, newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [headers, ["a.ipynb", "2", "2"]]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the crash-safe run ledger used to resume interrupted grading runs.
+"""
+
+import csv
+
+import pytest
+
+from run_ledger import RunLedger, ledger_path_for
+
+
+def test_ledger_lives_next_to_the_report():
+    assert ledger_path_for("4470_grading_report.csv") == "4470_grading_report.ledger.sqlite3"
+
+
+def test_stages_survive_a_restart(tmp_path):
+    path = str(tmp_path / "run.ledger.sqlite3")
+    ledger = RunLedger(path)
+    ledger.begin("a.ipynb", "/x/a.ipynb", "hash-a")
+    ledger.record("a.ipynb", "converted", pdf_path="/cache/a.pdf", pdf_sha256="pdf-a")
+    ledger.record("a.ipynb", "evaluated", result={"Student": "a.ipynb", "Total Marks": 3})
+    ledger.close()
+
+    entry = RunLedger(path).begin("a.ipynb", "/x/a.ipynb", "hash-a")
+    assert entry["stage"] == "evaluated"
+    assert entry["pdf_path"] == "/cache/a.pdf"
+    assert entry["result"]["Total Marks"] == 3
+    assert entry["attempts"] == 2
+
+
+def test_changed_notebook_starts_over(tmp_path):
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+    ledger.begin("a.ipynb", "/x/a.ipynb", "hash-a")
+    ledger.record("a.ipynb", "written")
+
+    entry = ledger.begin("a.ipynb", "/x/a.ipynb", "hash-b")
+    assert entry["stage"] == "pending"
+
+
+def test_failures_keep_the_last_completed_stage(tmp_path):
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+    ledger.begin("a.ipynb", "/x/a.ipynb", "hash-a")
+    ledger.record("a.ipynb", "uploaded", gemini_file="files/1")
+    ledger.fail("a.ipynb", "API Call Failed: 429")
+
+    entry = ledger.get("a.ipynb")
+    assert entry["stage"] == "uploaded"
+    assert entry["error"] == "API Call Failed: 429"
+    assert ledger.counts()["failed"] == 1
+
+    ledger.record("a.ipynb", "evaluated", result={"Student": "a.ipynb"})
+    assert ledger.get("a.ipynb")["error"] is None
+
+
+def test_report_is_the_source_of_truth_for_written(tmp_path):
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+    for name in ("a.ipynb", "b.ipynb", "c.ipynb"):
+        ledger.begin(name, f"/x/{name}", name)
+    # a: row appended but the run died before the ledger was updated
+    ledger.record("a.ipynb", "evaluated", result={"Student": "a.ipynb"})
+    # b: ledger says written but the report was deleted
+    ledger.record("b.ipynb", "evaluated", result={"Student": "b.ipynb"})
+    ledger.record("b.ipynb", "written")
+
+    ledger.reconcile_written({"a.ipynb"})
+
+    assert ledger.get("a.ipynb")["stage"] == "written"
+    assert ledger.get("b.ipynb")["stage"] == "evaluated"
+    assert ledger.get("c.ipynb")["stage"] == "pending"
+
+
+def test_streamed_results_are_kept_until_the_evaluation_is_recorded(tmp_path):
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+    ledger.begin("a.ipynb", "/x/a.ipynb", "hash-a")
+    ledger.record_partial("a.ipynb", {"task_id": "1.1", "marks_awarded": 1})
+    ledger.record_partial("a.ipynb", {"task_id": "1.2", "marks_awarded": 2})
+    ledger.record_partial("a.ipynb", {"task_id": "1.1", "marks_awarded": 3})
+
+    assert sorted((r["task_id"], r["marks_awarded"]) for r in ledger.partial_results("a.ipynb")) == [("1.1", 3), ("1.2", 2)]
+    # Still there after a restart with the same notebook
+    ledger.begin("a.ipynb", "/x/a.ipynb", "hash-a")
+    assert len(ledger.partial_results("a.ipynb")) == 2
+
+    ledger.record("a.ipynb", "evaluated", result={"Student": "a.ipynb"})
+    assert ledger.partial_results("a.ipynb") == []
+
+    ledger.record_partial("a.ipynb", {"task_id": "1.1"})
+    ledger.begin("a.ipynb", "/x/a.ipynb", "hash-b")
+    assert ledger.partial_results("a.ipynb") == []
+
+
+def test_resubmitted_notebook_replaces_its_report_row(tmp_path):
+    # Needs the full grading environment (dotenv, ...)
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+
+    notebook = tmp_path / "a.ipynb"
+    notebook.write_text('{"cells": []}')
+    report = str(tmp_path / "report.csv")
+    headers = ["Student", "Total Marks", "Overall Feedback"]
+    with open(report, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(headers)
+    for name, marks in (("a.ipynb", 3), ("b.ipynb", 5)):
+        evaluate_submissions.append_to_csv(report, {"Student": name, "Total Marks": marks, "Overall Feedback": ""},
+                                           headers)
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+    ledger.begin("a.ipynb", str(notebook), "hash-of-the-first-submission")
+    ledger.record("a.ipynb", "written")
+
+    job, = evaluate_submissions.plan_jobs(ledger, [str(notebook)],
+                                          written_students=evaluate_submissions.read_written_students(report))
+    assert job["regrade"] and job.get("done_stage", "pending") == "pending"
+
+    job["student_results"] = {"Student": "a.ipynb", "Total Marks": 8, "Overall Feedback": ""}
+    evaluate_submissions.write_stage({"output_file": report, "headers": headers, "ledger": ledger}, job)
+    with open(report, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted((r["Student"], r["Total Marks"]) for r in rows) == [("a.ipynb", "8"), ("b.ipynb", "5")]
+
+
+def test_report_rows_from_before_the_ledger_are_not_regraded(tmp_path):
+    evaluate_submissions = pytest.importorskip("evaluate_submissions")
+
+    notebook = tmp_path / "a.ipynb"
+    notebook.write_text('{"cells": []}')
+    ledger = RunLedger(str(tmp_path / "run.ledger.sqlite3"))
+
+    assert evaluate_submissions.plan_jobs(ledger, [str(notebook)], written_students={"a.ipynb"}) == []
+    entry = ledger.get("a.ipynb")
+    assert entry["stage"] == "written" and entry["notebook_sha256"] == evaluate_submissions.file_sha256(str(notebook))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Tests for the sandboxed code checks: the parent runner and the task_checks child.
+"""
+
+import json
+import os
+
+import pytest
+
+from sandbox import Evidence, SandboxRunner, notebook_imports, verdict_for
+from task_checks import RESULT_MARKER, run_job
+
+# A stand-in child script, so the runner can be tested without pandas or the real harnesses
+CHILD = '''
+import json, os, sys, time
+job = json.load(sys.stdin)
+code = job["code"]
+marker = %r
+def report(text, nonce=job["nonce"]):
+    os.write(job["result_fd"], (marker + nonce + " " + text + "\\n").encode())
+if code == "sleep":
+    time.sleep(30)
+elif code == "env":
+    report(json.dumps({"status": "ok", "checks": [
+        {"name": "no key", "ok": "GEMINI_API_KEY" not in os.environ, "hard": True, "detail": ""},
+        {"name": "own cwd", "ok": os.getcwd() != %r, "hard": True, "detail": ""}]}))
+elif code == "crash":
+    sys.stderr.write("Traceback...\\nZeroDivisionError: division by zero\\n")
+    sys.exit(1)
+elif code.startswith("twice:"):
+    report(code[6:])
+    report(code[6:])
+elif code.startswith("guess:"):
+    report(code[6:], nonce="0" * 32)
+else:
+    print("student output")
+    report(code)
+'''
+
+
+@pytest.fixture
+def runner(tmp_path):
+    script = tmp_path / "child.py"
+    script.write_text(CHILD % (RESULT_MARKER, os.getcwd()))
+    runner = SandboxRunner(workers=2, timeout=2, script=str(script))
+    yield runner
+    runner.close()
+
+
+def _result(*checks, status="ok"):
+    return json.dumps({"status": status, "checks": [
+        {"name": name, "ok": ok, "hard": hard, "detail": ""} for name, ok, hard in checks]})
+
+
+def test_verdicts():
+    assert verdict_for({"status": "ok", "checks": [{"ok": True, "hard": True}]}) == "pass"
+    assert verdict_for({"status": "ok", "checks": [{"ok": True, "hard": True}, {"ok": False, "hard": False}]}) == "ambiguous"
+    assert verdict_for({"status": "error", "checks": [{"ok": False, "hard": True}]}) == "fail"
+    assert verdict_for({"status": "error", "checks": [], "error": "no pandas"}) == "ambiguous"
+    assert verdict_for({"status": "ok", "checks": []}) == "ambiguous"
+
+
+def test_runner_reads_the_result_line(runner):
+    evidence = runner.run_all({
+        "1.1": _result(("a", True, True)),
+        "1.2": _result(("a", True, True), ("b", False, True)),
+        "1.3": _result(("a", True, True), ("c", False, False)),
+    })
+    assert {t: e.verdict for t, e in evidence.items()} == {"1.1": "pass", "1.2": "fail", "1.3": "ambiguous"}
+    assert [c["name"] for c in evidence["1.2"].failed(hard=True)] == ["b"]
+    assert "- FAIL b" in evidence["1.2"].describe() and "- DOUBT c" in evidence["1.3"].describe()
+
+
+def test_child_sees_no_secrets(runner, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "secret")
+    evidence = runner.run("1.1", "env")
+    assert evidence.verdict == "pass", evidence.describe()
+
+
+def test_timeouts_and_crashes_are_ambiguous(runner):
+    evidence = runner.run("1.1", "sleep")
+    assert evidence.verdict == "ambiguous" and "timed out" in evidence.error
+    assert evidence.seconds < 10
+
+    evidence = runner.run("1.1", "crash")
+    assert evidence.verdict == "ambiguous"
+    assert evidence.error == "exited with status 1: ZeroDivisionError: division by zero"
+
+
+def test_forged_results_are_not_believed(runner):
+    passing = _result(("a", True, True))
+    assert runner.run("1.1", "twice:" + passing).verdict == "ambiguous"
+    evidence = runner.run("1.1", "guess:" + passing)
+    assert evidence.verdict == "ambiguous" and evidence.error == "the check result was tampered with"
+
+
+def test_result_line_printed_by_student_code_is_ignored():
+    # A broken function whose module prints a passing result line at exit, behind the harness's back
+    forged = RESULT_MARKER + _result(("x", True, True))
+    code = ("import atexit, os\n"
+            f"atexit.register(lambda: os.write(1, {(forged + chr(10)).encode()!r}))\n"
+            "def rescale(train, test):\n    raise ValueError('broken')\n")
+    runner = SandboxRunner(workers=1, timeout=60)
+    try:
+        evidence = runner.run("1.3", code)
+    finally:
+        runner.close()
+    assert evidence.verdict == "ambiguous" and evidence.error == "the code printed a fake check result"
+
+
+def test_notebook_imports():
+    notebook = (
+        "--- [CODE CELL] ---\nimport pandas as pd\nfrom sklearn.tree import DecisionTreeClassifier\nx = 1\n\n"
+        "--- [MARKDOWN CELL] ---\nimport this is prose\n\n"
+        "--- [CODE CELL] ---\n%matplotlib inline\nimport numpy as np\nimport pandas as pd\n"
+    )
+    assert notebook_imports(notebook) == [
+        "import pandas as pd", "from sklearn.tree import DecisionTreeClassifier", "import numpy as np"]
+
+
+def test_evidence_description():
+    evidence = Evidence("2.1", "ambiguous", [{"name": "returns a model", "ok": True, "hard": True, "detail": ""}],
+                        error="timed out after 120s")
+    assert evidence.describe() == (
+        "Automated checks (ambiguous):\n- PASS returns a model\n- Could not complete: timed out after 120s")
+
+
+def test_undecidable_code_is_an_error_not_a_fail():
+    result = run_job({"task_id": "1.1", "code": "def missing_data(:"})
+    assert result["status"] == "error" and result["error"].startswith("code does not run")
+    # Missing function, or pandas missing here: either way the harness cannot judge it
+    assert verdict_for(run_job({"task_id": "1.1", "code": "x = 1"})) == "ambiguous"
+    assert run_job({"task_id": "9.9", "code": ""})["error"] == "no harness for task 9.9"
+
+
+def test_missing_data_harness():
+    pytest.importorskip("pandas")
+    good = (
+        "def missing_data(train, test):\n"
+        "    for c in train.columns:\n"
+        "        fill = train[c].median() if train[c].dtype != object else train[c].mode()[0]\n"
+        "        train[c] = train[c].fillna(fill)\n"
+        "        test[c] = test[c].fillna(fill)\n"
+        "    return train, test\n"
+    )
+    assert verdict_for(run_job({"task_id": "1.1", "code": good})) == "pass"
+    dropped = "def missing_data(train, test):\n    return train, test\n"
+    assert verdict_for(run_job({"task_id": "1.1", "code": dropped})) == "fail"
+    raises = "def missing_data(train, test):\n    return train.fillna(1 / 0), test\n"
+    result = run_job({"task_id": "1.1", "code": raises})
+    assert verdict_for(result) == "fail" and result["checks"][-1]["name"] == "runs on valid input"
+
+
+def test_harness_fixtures_under_the_installed_pandas():
+    pd = pytest.importorskip("pandas")
+    from task_checks import _raw_frames
+
+    train, test = _raw_frames()
+    assert [str(train[c].dtype) for c in ("workclass", "sex")] == ["object", "object"], pd.__version__
+    # The real child process, with whatever pandas the sandbox's python has
+    code = (
+        "def missing_data(train, test):\n"
+        "    for c in train.columns:\n"
+        "        fill = train[c].mode()[0] if train[c].dtype == object else train[c].median()\n"
+        "        train[c] = train[c].fillna(fill)\n"
+        "        test[c] = test[c].fillna(fill)\n"
+        "    return train, test\n"
+    )
+    runner = SandboxRunner(workers=1, timeout=60)
+    try:
+        evidence = runner.run("1.1", code, imports=["import pandas as pd"])
+    finally:
+        runner.close()
+    assert evidence.verdict == "pass", f"pandas {pd.__version__}: {evidence.describe()}"
+
+
+def test_rescale_harness_flags_test_set_leakage():
+    pytest.importorskip("pandas")
+    leaky = (
+        "def rescale(train, test):\n"
+        "    for c in ('age', 'hours'):\n"
+        "        for df in (train, test):\n"
+        "            df[c] = (df[c] - df[c].min()) / (df[c].max() - df[c].min())\n"
+        "    return train, test\n"
+    )
+    result = run_job({"task_id": "1.3", "code": leaky})
+    assert verdict_for(result) == "ambiguous"
+    assert [c["name"] for c in result["checks"] if not c["ok"]] == [
+        "test set is scaled with training-set minimum and maximum"]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the MinHash/LSH near-duplicate index over extracted task code.
+"""
+
+import random
+
+from similarity_index import (
+    MinHasher, SimilarityIndex, estimated_similarity, format_report, jaccard, normalize_tokens, shingles,
+)
+
+ORIGINAL = '''
+def missing_data(df):
+    """Fill the gaps."""
+    # median for numeric columns
+    for column in df.columns:
+        if df[column].dtype != object:
+            df[column] = df[column].fillna(df[column].median())
+        else:
+            df[column] = df[column].fillna(df[column].mode()[0])
+    return df.dropna(axis=0, how="all")
+'''
+
+# The same solution with renamed variables, other comments and literals
+DISGUISED = '''
+def missing_data(frame):
+    # my own work
+    for col in frame.columns:
+        if frame[col].dtype != object:
+            frame[col] = frame[col].fillna(frame[col].median())
+        else:
+            frame[col] = frame[col].fillna(frame[col].mode()[1])
+    return frame.dropna(axis=1, how='any')
+'''
+
+
+STATEMENTS = [
+    "while {v} < {n}:\n        {v} += len(str({v}))",
+    "try:\n        {v} = int({v})\n    except ValueError:\n        {v} = None",
+    "{v} = [x ** {n} for x in range({n}) if x % 2]",
+    "with open('{v}.txt') as fh:\n        {v} = fh.read().split()",
+    "{v} = {{k: sorted(k) for k in set({v})}}",
+    "assert isinstance({v}, dict), 'bad'",
+    "{v} = lambda a, *b: (a, b)[{n}]",
+    "yield from zip({v}, reversed({v}))",
+    "raise RuntimeError(f'{v} {{{v}}}')",
+    "{v}.update(sum(map(abs, {v}.values())))",
+    "del {v}[{n}:], {v}[::-1]",
+    "{v} = not {v} and {v} is None or {v} in ({n},)",
+]
+
+
+def _unrelated(seed):
+    """Code that shares little more than the function name with anything else."""
+    rng = random.Random(seed)
+    body = [rng.choice(STATEMENTS).format(v=f"v{n}", n=rng.randint(1, 9)) for n in range(10)]
+    return "def missing_data(df):\n" + "\n".join(f"    {line}" for line in body) + "\n    return df"
+
+
+def test_renaming_and_comments_do_not_change_the_tokens():
+    assert normalize_tokens(ORIGINAL) == normalize_tokens(ORIGINAL.replace("df", "data").replace("# median", "# x"))
+    tokens = normalize_tokens("x = df.fillna(0)  # comment")
+    assert tokens == ["V", "=", "V", ".", "fillna", "(", "N", ")"]
+    # Unbalanced code falls back to plain word tokens
+    assert normalize_tokens("def f(:\n  return [")[:2] == ["def", "V"]
+
+
+def test_minhash_estimates_jaccard():
+    a = shingles(normalize_tokens(ORIGINAL))
+    b = shingles(normalize_tokens(DISGUISED))
+    hasher = MinHasher(256)
+    exact = jaccard(a, b)
+    assert exact > 0.6
+    assert abs(estimated_similarity(hasher.signature(a), hasher.signature(b)) - exact) < 0.15
+    assert MinHasher(256).signature(a) == hasher.signature(a)
+
+
+def test_copied_code_is_found_without_comparing_every_pair(tmp_path):
+    index = SimilarityIndex(str(tmp_path / "s.sqlite3"))
+    index.add_submission("4470", "alice.ipynb", {"1.1": ORIGINAL})
+    index.add_submission("4473", "bob.ipynb", {"1.1": DISGUISED})
+    for n in range(40):
+        index.add_submission("4473", f"student{n}.ipynb", {"1.1": _unrelated(n)})
+
+    candidates = index.candidate_pairs("1.1")
+    assert len(candidates) < 41 * 40 // 2 // 4
+
+    rows = index.similar_pairs(min_similarity=0.5)
+    assert rows[0]["student_a"] == "alice.ipynb" and rows[0]["student_b"] == "bob.ipynb"
+    assert rows[0]["similarity"] > 0.6 and rows == sorted(rows, key=lambda r: -r["similarity"])
+    assert index.similar_pairs(cross_cohort=True)[0]["cohort_a"] != index.similar_pairs(cross_cohort=True)[0]["cohort_b"]
+    assert "alice.ipynb" in format_report(rows)
+    index.close()
+
+
+def test_index_is_incremental_and_persistent(tmp_path):
+    path = str(tmp_path / "s.sqlite3")
+    index = SimilarityIndex(path)
+    assert index.add("4470", "alice.ipynb", "1.1", ORIGINAL)
+    assert not index.add("4470", "alice.ipynb", "1.1", ORIGINAL)
+    # Stubs too short to compare are not indexed
+    assert not index.add("4470", "carol.ipynb", "1.1", "def missing_data(df):\n    pass\n")
+    index.close()
+
+    index = SimilarityIndex(path)
+    assert index.count() == 1
+    index.add("4473", "bob.ipynb", "1.1", DISGUISED)
+    assert len(index.similar_pairs()) == 1
+    # A changed notebook replaces the student's old signature
+    index.add("4473", "bob.ipynb", "1.1", _unrelated(7))
+    assert index.count("1.1") == 2 and index.similar_pairs() == []
+    index.close()
+
+    # Other settings make old signatures meaningless, so the index starts over
+    index = SimilarityIndex(path, num_perm=64, bands=16)
+    assert index.count() == 0
+    index.close()
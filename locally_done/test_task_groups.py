@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for splitting the rubric into concurrently evaluated task groups.
+"""
+
+import json
+
+from gemini_client import FakeBackend
+from prompt_compiler import PromptCompiler
+from rubric_versions import subset_rubric
+from task_groups import TaskGroup, merge_results, narrow_groups, section_of, split_task_groups
+from task_locator import derive_task_functions
+
+
+def load_assignment():
+    with open("Assignment_2_Rubric.json", "r") as f:
+        rubric = json.load(f)
+    with open("Assignment_2_Questions.json", "r") as f:
+        questions = json.load(f)
+    task_ids = {sub["sub_task_id"] for group in rubric["tasks"] for sub in group["sub_tasks"]}
+    return rubric, derive_task_functions(questions, task_ids)
+
+
+def test_code_tasks_form_one_group_and_report_tasks_split_by_section():
+    rubric, task_functions = load_assignment()
+    groups = split_task_groups(rubric, task_functions)
+
+    assert groups[0] == TaskGroup("code", ["1.1", "1.2", "1.3", "2.1", "2.2"], needs_code=True)
+    assert [g.name for g in groups[1:]] == ["Task 3", "Task 3.2", "Task 3.3", "Task 3.4", "Task 3.5"]
+    assert not any(g.needs_code for g in groups[1:])
+    all_ids = [sub["sub_task_id"] for group in rubric["tasks"] for sub in group["sub_tasks"]]
+    assert [t_id for g in groups for t_id in g.task_ids] == all_ids
+    assert section_of("3.2.1") == "3.2" and section_of("3.1") == "3"
+
+
+def test_output_budget_grows_with_the_group():
+    small, large = TaskGroup("a", ["1"], True), TaskGroup("b", ["1", "2", "3"], True)
+    assert small.output_budget() < large.output_budget()
+    assert large.output_budget(per_task=100) - small.output_budget(per_task=100) == 200
+
+
+def test_narrow_groups_keeps_only_pending_tasks():
+    rubric, task_functions = load_assignment()
+    narrowed = narrow_groups(split_task_groups(rubric, task_functions), ["1.2", "3.3.1", "3.3.4"])
+    assert [(g.name, g.task_ids) for g in narrowed] == [("code", ["1.2"]), ("Task 3.3", ["3.3.1", "3.3.4"])]
+
+
+def test_merge_results_orders_by_rubric_and_keeps_first_duplicate():
+    merged = merge_results(
+        [[{"task_id": "3.1", "marks_awarded": 2}], [{"task_id": "1.1", "marks_awarded": 1}, {"task_id": "3.1", "marks_awarded": 0}]],
+        ["1.1", "3.1"],
+    )
+    assert merged == [{"task_id": "1.1", "marks_awarded": 1}, {"task_id": "3.1", "marks_awarded": 2}]
+
+
+def test_code_group_prompt_leaves_out_the_notebook():
+    rubric, task_functions = load_assignment()
+    code = split_task_groups(rubric, task_functions)[0]
+    compiler = PromptCompiler(subset_rubric(rubric, code.task_ids))
+    notebook = "--- [MARKDOWN CELL] ---\nMy report\n"
+
+    code_only = compiler.compile({"1.1": "def missing_data(df): pass"}, notebook, False, include_notebook=False)
+    assert "--- FULL NOTEBOOK CONTENT ---" not in code_only.text and "My report" not in code_only.text
+    assert code_only.sections["notebook"] == 0
+    assert "My report" in compiler.compile({}, notebook, False).text
+
+
+def test_fake_backend_cuts_the_response_at_the_output_budget():
+    rubric, task_functions = load_assignment()
+    prompt = PromptCompiler(rubric).compile({}, "", is_pdf_available=True).text
+    backend = FakeBackend()
+
+    full = backend.generate("m", "", {}, [prompt])
+    cut = backend.generate("m", "", {"max_output_tokens": 50}, [prompt])
+    assert json.loads(full)["results"]
+    assert len(cut) == 200 and full.startswith(cut)
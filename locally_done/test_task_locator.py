@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the AST-based task locator.
+"""
+
+import json
+
+from task_locator import TaskLocator, derive_task_functions
+
+
+def test_task_functions_come_from_the_questions_file():
+    with open("Assignment_2_Questions.json", "r") as f:
+        questions = json.load(f)
+
+    task_functions = derive_task_functions(questions, {"1.1", "1.2", "1.3", "2.1", "2.2", "3.1"})
+
+    assert task_functions == {
+        "1.1": ["missing_data"],
+        "1.2": ["encoding"],
+        "1.3": ["rescale"],
+        "2.1": ["train_shallow_net_class"],
+        # The provided helpers (format_values, print_results_table) are not assessed
+        "2.2": ["train_classification_tree", "train_bagging", "train_random_forest", "train_adaboost"],
+    }
+
+
+def test_several_functions_in_one_cell_get_exact_spans():
+    cell = (
+        "import pandas as pd\n"
+        "\n"
+        "def missing_data(X_train, X_test):\n"
+        "    return X_train.dropna(), X_test.dropna()\n"
+        "\n"
+        "print('between')\n"
+        "\n"
+        "@staticmethod\n"
+        "def encoding(X_train, X_test):\n"
+        "    return pd.get_dummies(X_train), pd.get_dummies(X_test)\n"
+    )
+    locator = TaskLocator({"1.1": ["missing_data"], "1.2": ["encoding"], "1.3": ["rescale"]})
+    locator.add_cell(cell)
+
+    tasks = locator.tasks()
+    assert tasks["1.1"] == "def missing_data(X_train, X_test):\n    return X_train.dropna(), X_test.dropna()"
+    assert tasks["1.2"].startswith("@staticmethod\ndef encoding")
+    assert "print('between')" not in tasks["1.1"] + tasks["1.2"]
+    assert "1.3" not in tasks
+
+
+def test_cells_with_magics_or_syntax_errors_still_index():
+    locator = TaskLocator({"1.3": ["rescale"], "2.2": ["train_classification_tree", "train_bagging"]})
+    locator.add_cell("%matplotlib inline\ndef rescale(X_train, X_test):\n    return X_train, X_test\n", 0)
+    locator.add_cell(
+        "def train_classification_tree(X, y):\n"
+        "    model = DecisionTreeClassifier(\n"
+        "    return model\n"
+        "\n"
+        "def train_bagging(X, y):\n"
+        "    return BaggingClassifier().fit(X, y)\n",
+        1,
+    )
+
+    tasks = locator.tasks()
+    assert tasks["1.3"].startswith("def rescale")
+    assert tasks["2.2"].count("def ") == 2
+    assert locator.definitions["train_bagging"].cell_index == 1
+
+
+def test_later_definition_wins():
+    locator = TaskLocator({"1.3": ["rescale"]})
+    locator.add_cell("def rescale(a, b):\n    return None\n")
+    locator.add_cell("def rescale(a, b):\n    return a / a.max(), b / a.max()\n")
+    assert "a.max()" in locator.tasks()["1.3"]
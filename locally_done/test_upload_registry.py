@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the Gemini upload registry using an in-memory stand-in for the File API.
+"""
+
+from types import SimpleNamespace
+
+from upload_registry import PollBackoff, UploadRegistry
+
+
+class FakeFiles:
+    def __init__(self, polls_until_active=2):
+        self.polls_until_active = polls_until_active
+        self.files = {}
+        self.uploads = 0
+        self.deleted = []
+
+    def _file(self, name):
+        state = "ACTIVE" if self.files[name] <= 0 else "PROCESSING"
+        return SimpleNamespace(name=name, uri=f"https://fake/{name}", display_name=name,
+                               state=SimpleNamespace(name=state))
+
+    def upload_file(self, path, mime_type=None):
+        self.uploads += 1
+        name = f"files/{self.uploads}"
+        self.files[name] = self.polls_until_active
+        return self._file(name)
+
+    def get_file(self, name):
+        self.files[name] -= 1
+        return self._file(name)
+
+    def delete_file(self, name):
+        self.deleted.append(name)
+        self.files.pop(name, None)
+
+
+def _registry(tmp_path, client, **kwargs):
+    return UploadRegistry(client, str(tmp_path / "uploads.sqlite3"), gc_interval=0,
+                          sleep=lambda s: None, **kwargs)
+
+
+def test_same_content_is_uploaded_once(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4 same")
+    client = FakeFiles()
+
+    first = _registry(tmp_path, client).get_or_upload(str(pdf))
+    # A new registry (next run) reads the persisted entry
+    second = _registry(tmp_path, client).get_or_upload(str(pdf))
+
+    assert client.uploads == 1
+    assert first.name == second.name
+
+
+def test_expired_entries_are_reuploaded(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4 expiring")
+    client = FakeFiles()
+
+    _registry(tmp_path, client, ttl=-1).get_or_upload(str(pdf))
+    _registry(tmp_path, client).get_or_upload(str(pdf))
+
+    assert client.uploads == 2
+
+
+def test_deletes_are_batched_until_collect(tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4 delete me")
+    client = FakeFiles()
+    registry = _registry(tmp_path, client)
+
+    remote = registry.get_or_upload(str(pdf))
+    registry.schedule_delete(remote.name)
+    assert client.deleted == []
+
+    registry.collect()
+    assert client.deleted == [remote.name]
+
+
+def test_backoff_starts_near_observed_processing_time():
+    backoff = PollBackoff(initial=0.5, factor=2, max_delay=8)
+    delays = backoff.delays()
+    assert [next(delays) for _ in range(5)] == [0.5, 1.0, 2.0, 4.0, 8.0]
+
+    backoff.observe(5.0)
+    assert next(backoff.delays()) == 4.0
+
+
+def test_release_all_deletes_every_registered_file(tmp_path):
+    client = FakeFiles()
+    registry = _registry(tmp_path, client)
+    names = []
+    for n in range(2):
+        pdf = tmp_path / f"{n}.pdf"
+        pdf.write_bytes(b"%PDF-1.4 " + bytes([n]))
+        names.append(registry.get_or_upload(str(pdf)).name)
+
+    registry.release_all()
+    registry.close()
+    assert sorted(client.deleted) == sorted(names)
+    # Nothing is left to reuse in the next run
+    _registry(tmp_path, client).get_or_upload(str(tmp_path / "0.pdf"))
+    assert client.uploads == 3
+
+
+def test_processes_sharing_the_registry_keep_each_others_uploads(tmp_path):
+    client = FakeFiles(polls_until_active=0)
+    # Two workers of a sharded run, each with its own connection to the same file
+    first, second = _registry(tmp_path, client), _registry(tmp_path, client)
+    pdfs = []
+    for n in range(2):
+        pdf = tmp_path / f"{n}.pdf"
+        pdf.write_bytes(b"%PDF-1.4 shared " + bytes([n]))
+        pdfs.append(str(pdf))
+    a = first.get_or_upload(pdfs[0])
+    b = second.get_or_upload(pdfs[1])
+
+    assert first.get_or_upload(pdfs[1]).name == b.name and second.get_or_upload(pdfs[0]).name == a.name
+    assert client.uploads == 2
+
+    # Each releases only what it uploaded
+    first.release_all()
+    first.close()
+    assert client.deleted == [a.name]
+    assert second.get_or_upload(pdfs[1]).name == b.name
+    second.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared work queue used by sharded grading.
+"""
+
+import csv
+import threading
+
+from results_store import ResultsStore
+from shard import merge, queue_items
+from work_queue import WorkQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def items(n):
+    return [(f"4470/s{i}.ipynb", f"/data/4470/s{i}.ipynb", "4470") for i in range(n)]
+
+
+def test_enqueue_is_idempotent(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q.sqlite3"))
+    assert queue.enqueue(items(3)) == 3
+    assert queue.enqueue(items(4)) == 1
+    assert queue.counts()["queued"] == 4
+    queue.close()
+
+
+def test_concurrent_workers_never_share_a_student(tmp_path):
+    path = str(tmp_path / "q.sqlite3")
+    WorkQueue(path).enqueue(items(60))
+    claimed = {}
+
+    def worker(name):
+        queue = WorkQueue(path)  # own connection, like a separate process
+        mine = []
+        while True:
+            batch = queue.claim(name, limit=3)
+            if not batch:
+                break
+            for key, _, _ in batch:
+                mine.append(key)
+                queue.complete(name, key)
+        claimed[name] = mine
+        queue.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    all_keys = [key for keys in claimed.values() for key in keys]
+    assert len(all_keys) == 60 and len(set(all_keys)) == 60
+    assert WorkQueue(path).counts()["done"] == 60
+
+
+def test_expired_leases_are_reclaimed(tmp_path):
+    clock = Clock()
+    queue = WorkQueue(str(tmp_path / "q.sqlite3"), lease_seconds=60, max_attempts=2, clock=clock)
+    queue.enqueue(items(1))
+
+    assert len(queue.claim("dead", 5)) == 1
+    assert queue.claim("alive", 5) == []
+    clock.now += 30
+    assert queue.heartbeat("dead", ["4470/s0.ipynb"]) == ["4470/s0.ipynb"]
+    clock.now += 61
+    [(key, _, _)] = queue.claim("alive", 5)
+    assert queue.heartbeat("dead", [key]) == []
+
+    # The second owner also dies: out of attempts
+    clock.now += 61
+    assert queue.claim("third", 5) == []
+    assert queue.counts()["failed"] == 1
+    assert queue.requeue_failed() == 1
+    assert len(queue.claim("third", 5)) == 1
+
+
+def test_failures_are_retried_until_attempts_run_out(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q.sqlite3"), max_attempts=2)
+    queue.enqueue(items(1))
+    [(key, _, _)] = queue.claim("w", 1)
+    queue.fail("w", key, "429")
+    assert queue.counts()["queued"] == 1
+    queue.claim("w", 1)
+    queue.fail("w", key, "429 again")
+    assert queue.counts()["failed"] == 1
+    assert queue.claim("w", 1) == []
+
+
+def test_queue_items_and_merge(tmp_path):
+    for cohort in ("4470", "4473"):
+        (tmp_path / cohort).mkdir()
+        (tmp_path / cohort / "a.ipynb").write_text("{}")
+    found = queue_items([str(tmp_path / "4470"), str(tmp_path / "4473")])
+    assert [key for key, _, _ in found] == ["4470/a.ipynb", "4473/a.ipynb"]
+
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    for _, _, cohort in found:
+        store.add(cohort, {"Student": "a.ipynb", "Total Marks": 1, "Overall Feedback": "", "Task 1.1 Marks": 1})
+    paths = merge(store, str(tmp_path), task_ids=["1.1", "1.2"])
+    assert [p.split("/")[-1] for p in paths] == ["4470_grading_report.csv", "4473_grading_report.csv"]
+    with open(paths[0], newline="") as f:
+        assert next(csv.reader(f))[-2:] == ["Task 1.1 Marks", "Task 1.2 Marks"]
+    store.close()
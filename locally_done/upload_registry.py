@@ -0,0 +1,238 @@
+"""
+Registry of files uploaded to the Gemini File API, keyed by content hash.
+
+Gemini keeps uploaded files for a limited time (48 hours). Within that window
+a re-grade or a second evaluation pass of the same PDF can reuse the remote
+handle instead of uploading again and waiting for server-side processing.
+The registry is a SQLite table (WAL mode), so reuse also works across runs,
+and the worker processes of a sharded run on one machine can share it: each
+entry is read and written in its own statement, never through a snapshot of
+the whole registry.
+
+Processing is polled with an adaptive backoff instead of a fixed sleep, and
+deletions are batched into a background garbage-collection pass.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from pdf_cache import file_sha256
+
+UPLOAD_REGISTRY_FILE = os.path.join(".grading_cache", "uploads.sqlite3")
+# Gemini deletes files after 48h; stop reusing a handle a little before that
+UPLOAD_TTL_SECONDS = 47 * 3600
+
+
+class UploadError(Exception):
+    pass
+
+
+class PollBackoff:
+    """
+    Delays between processing polls. The first poll waits for roughly the
+    processing time seen so far (an exponential moving average), after that
+    the delay grows geometrically up to max_delay.
+    """
+
+    def __init__(self, initial=0.5, factor=1.6, max_delay=8.0, alpha=0.3):
+        self.initial = initial
+        self.factor = factor
+        self.max_delay = max_delay
+        self.alpha = alpha
+        self.expected = None
+        self._lock = threading.Lock()
+
+    def delays(self):
+        with self._lock:
+            delay = self.initial if self.expected is None else max(self.initial, 0.8 * self.expected)
+        delay = min(delay, self.max_delay)
+        while True:
+            yield delay
+            delay = min(delay * self.factor, self.max_delay)
+
+    def observe(self, seconds):
+        with self._lock:
+            if self.expected is None:
+                self.expected = seconds
+            else:
+                self.expected = self.alpha * seconds + (1 - self.alpha) * self.expected
+
+
+class UploadRegistry:
+    """
+    Uploads files through `client` (anything with upload_file/get_file/delete_file,
+    e.g. the google.generativeai module) and remembers them by content hash.
+    """
+
+    def __init__(self, client, path=UPLOAD_REGISTRY_FILE, ttl=UPLOAD_TTL_SECONDS,
+                 processing_timeout=300, gc_interval=60.0, sleep=time.sleep):
+        self.client = client
+        self.path = path
+        self.ttl = ttl
+        self.processing_timeout = processing_timeout
+        self.gc_interval = gc_interval
+        self.backoff = PollBackoff()
+        self.reused = 0
+        self.uploaded = 0
+        self.deleted = 0
+        self._sleep = sleep
+
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._delete_queue = []
+        # Remote files this registry uploaded, the ones release_all may delete
+        self._own = set()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " sha256 TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " uri TEXT,"
+            " mime_type TEXT,"
+            " uploaded_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        self._stop = threading.Event()
+        self._gc_thread = None
+        if gc_interval:
+            self._gc_thread = threading.Thread(target=self._gc_loop, daemon=True)
+            self._gc_thread.start()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_upload(self, file_path, mime_type="application/pdf"):
+        """
+        Returns an ACTIVE remote file for file_path, reusing a previous upload of
+        the same bytes while it is still within its TTL. Raises UploadError on failure.
+        """
+        key = file_sha256(file_path)
+        # Concurrent requests for the same content wait for a single upload
+        with self._key_lock(key):
+            remote = self._reuse(key)
+            if remote is not None:
+                self.reused += 1
+                metrics.incr("upload_reused")
+                return remote
+
+            remote = self.client.upload_file(file_path, mime_type=mime_type)
+            print(f"   -> Uploaded {remote.display_name} to Gemini ({remote.uri})")
+            remote = self._wait_until_active(remote)
+            self.uploaded += 1
+            metrics.incr("uploads")
+
+            with self._lock:
+                self._own.add(remote.name)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO uploads (sha256, name, uri, mime_type, uploaded_at, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, remote.name, remote.uri, mime_type, time.time(), _expiry(remote, self.ttl)),
+                )
+                self._conn.commit()
+            return remote
+
+    def _reuse(self, key):
+        with self._lock:
+            entry = self._conn.execute("SELECT name, expires_at FROM uploads WHERE sha256 = ?", (key,)).fetchone()
+        if not entry or entry[1] <= time.time():
+            return None
+        try:
+            remote = self.client.get_file(entry[0])
+        except Exception:
+            remote = None
+        if remote is None or remote.state.name != "ACTIVE":
+            with self._lock:
+                self._conn.execute("DELETE FROM uploads WHERE sha256 = ? AND name = ?", (key, entry[0]))
+                self._conn.commit()
+            return None
+        print(f"   -> Reusing Gemini file {remote.name} (uploaded earlier)")
+        return remote
+
+    def _wait_until_active(self, remote):
+        started = time.monotonic()
+        delays = self.backoff.delays()
+        while remote.state.name == "PROCESSING":
+            if time.monotonic() - started > self.processing_timeout:
+                self.schedule_delete(remote.name)
+                raise UploadError(f"Processing of {remote.name} timed out after {self.processing_timeout}s")
+            self._sleep(next(delays))
+            metrics.incr("upload_polls")
+            remote = self.client.get_file(remote.name)
+
+        if remote.state.name != "ACTIVE":
+            self.schedule_delete(remote.name)
+            raise UploadError(f"File processing failed: {remote.state.name}")
+
+        self.backoff.observe(time.monotonic() - started)
+        return remote
+
+    def schedule_delete(self, name):
+        """Queues a remote file for deletion by the next garbage-collection pass."""
+        with self._lock:
+            self._delete_queue.append(name)
+            self._own.discard(name)
+            self._conn.execute("DELETE FROM uploads WHERE name = ?", (name,))
+            self._conn.commit()
+
+    def collect(self):
+        """
+        One garbage-collection pass: deletes queued files and forgets entries
+        that have outlived their TTL (the server has already dropped those).
+        """
+        now = time.time()
+        with self._lock:
+            queue, self._delete_queue = self._delete_queue, []
+            self._conn.execute("DELETE FROM uploads WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+        for name in queue:
+            try:
+                self.client.delete_file(name)
+                self.deleted += 1
+            except Exception as e:
+                print(f"   -> Warning: Failed to delete Gemini file {name}: {e}")
+
+    def release_all(self):
+        """
+        Queues every file this registry uploaded for deletion (used when reuse is turned off).
+        Files other processes sharing the registry uploaded are left to them.
+        """
+        with self._lock:
+            names = list(self._own)
+        for name in names:
+            self.schedule_delete(name)
+
+    def close(self):
+        self._stop.set()
+        if self._gc_thread is not None:
+            self._gc_thread.join()
+        self.collect()
+        with self._lock:
+            self._conn.close()
+
+    def _gc_loop(self):
+        while not self._stop.wait(self.gc_interval):
+            self.collect()
+
+    def summary(self):
+        return (f"Gemini uploads: {self.uploaded} uploaded, {self.reused} reused, "
+                f"{self.deleted} deleted")
+
+
+def _expiry(remote, ttl):
+    """Uses the server's expiration time when it reports one, capped by ttl."""
+    limit = time.time() + ttl
+    expiration = getattr(remote, "expiration_time", None)
+    if isinstance(expiration, datetime):
+        return min(limit, expiration.timestamp())
+    return limit
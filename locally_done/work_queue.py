@@ -0,0 +1,158 @@
+"""
+Durable queue of submissions for sharded grading.
+
+Students are enqueued once. Any number of worker processes, on one machine
+or on several machines sharing the filesystem, then claim them in small
+batches. A claim is a lease: the worker renews it with heartbeat(), and if
+the worker dies the lease expires and another worker picks the student up.
+Claims run inside BEGIN IMMEDIATE transactions, so two workers never hold
+the same student.
+
+The queue is an SQLite file in rollback-journal mode (not WAL), because WAL
+needs shared memory and does not work across machines. The shared
+filesystem must support POSIX locks (NFSv4 and SMB do).
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+WORK_QUEUE_FILE = "grading_queue.sqlite3"
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path=WORK_QUEUE_FILE, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 clock=time.time):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            " key TEXT PRIMARY KEY,"
+            " file_path TEXT NOT NULL,"
+            " cohort TEXT,"
+            " state TEXT NOT NULL,"
+            " owner TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS work_state ON work (state, lease_expires)")
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def enqueue(self, items):
+        """Adds (key, file_path, cohort) items; keys already queued are left alone. Returns how many were new."""
+        now = self._clock()
+        with self._lock, self._transaction():
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO work (key, file_path, cohort, state, updated_at) VALUES (?, ?, ?, 'queued', ?)",
+                [(key, file_path, cohort, now) for key, file_path, cohort in items],
+            )
+            return self._conn.total_changes - before
+
+    def claim(self, owner, limit=1):
+        """
+        Leases up to `limit` students to owner: queued ones first, then ones whose
+        previous owner's lease ran out. Returns a list of (key, file_path, cohort).
+        """
+        now = self._clock()
+        with self._lock, self._transaction():
+            # Expired leases that used up their attempts are given up on
+            self._conn.execute(
+                "UPDATE work SET state = 'failed', owner = NULL, error = COALESCE(error, 'lease expired'), updated_at = ?"
+                " WHERE state = 'claimed' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = self._conn.execute(
+                "SELECT key, file_path, cohort FROM work"
+                " WHERE state = 'queued' OR (state = 'claimed' AND lease_expires < ?)"
+                " ORDER BY state DESC, key LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE work SET state = 'claimed', owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE key = ?",
+                [(owner, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+        return [tuple(row) for row in rows]
+
+    def heartbeat(self, owner, keys):
+        """Extends owner's leases on keys. Returns the keys owner still holds."""
+        now = self._clock()
+        held = []
+        with self._lock, self._transaction():
+            for key in keys:
+                cursor = self._conn.execute(
+                    "UPDATE work SET lease_expires = ? WHERE key = ? AND owner = ? AND state = 'claimed'",
+                    (now + self.lease_seconds, key, owner),
+                )
+                if cursor.rowcount:
+                    held.append(key)
+        return held
+
+    def complete(self, owner, key):
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE work SET state = 'done', lease_expires = NULL, error = NULL, updated_at = ?"
+                " WHERE key = ? AND owner = ?",
+                (self._clock(), key, owner),
+            )
+
+    def fail(self, owner, key, error):
+        """Puts the student back in the queue, or marks it failed once it has used up its attempts."""
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE work SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " owner = NULL, lease_expires = NULL, error = ?, updated_at = ? WHERE key = ? AND owner = ?",
+                (self.max_attempts, str(error), self._clock(), key, owner),
+            )
+
+    def requeue_failed(self):
+        """Gives every failed student a fresh set of attempts."""
+        with self._lock, self._transaction():
+            return self._conn.execute(
+                "UPDATE work SET state = 'queued', attempts = 0, error = NULL WHERE state = 'failed'"
+            ).rowcount
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM work GROUP BY state").fetchall()
+        counts = {"queued": 0, "claimed": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error): takes the write lock up front so claims cannot interleave."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False